@@ -0,0 +1,110 @@
+"""
+Нагрузочный тест /api/v2: несколько сотен интеграций опрашивают расписание и занятость.
+
+Запуск (веб-приложение поднято, в БД есть будущие тренировки):
+    python -m benchmarks.api_load --url http://127.0.0.1:8000 --clients 300 --seconds 20
+
+Каждый клиент в цикле запрашивает страницу /api/v2/trainings (с переходом по
+next_cursor) и /api/v2/trainings/{id}/pilots для тренировок со страницы, как
+поллер интеграции. С --conditional клиент хранит ETag и шлёт If-None-Match.
+Для сравнения --v1 опрашивает старый /api/trainings целиком.
+Печатаются запросов/сек, p50/p99, доля 304 и переданный объём.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import aiohttp
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.not_modified = 0
+        self.errors = 0
+        self.bytes = 0
+
+
+async def get(session: aiohttp.ClientSession, url: str, etags: Dict[str, str], stats: Stats, conditional: bool):
+    headers = {"Accept-Encoding": "br, gzip"}  # br aiohttp распакует, если установлен brotli
+    if conditional and url in etags:
+        headers["If-None-Match"] = etags[url]
+    start = time.perf_counter()
+    try:
+        async with session.get(url, headers=headers) as resp:
+            body = await resp.read()
+            stats.latencies.append(time.perf_counter() - start)
+            # Content-Length — размер на проводе (после сжатия), body уже распакован
+            stats.bytes += int(resp.headers.get("Content-Length", len(body)))
+            if resp.status == 304:
+                stats.not_modified += 1
+                return None
+            if resp.status != 200:
+                stats.errors += 1
+                return None
+            if "ETag" in resp.headers:
+                etags[url] = resp.headers["ETag"]
+            return await resp.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        stats.errors += 1
+        return None
+
+
+async def client(session: aiohttp.ClientSession, base: str, args, stats: Stats, deadline: float):
+    etags: Dict[str, str] = {}
+    pages: Dict[str, dict] = {}
+    while time.monotonic() < deadline:
+        if args.v1:
+            await get(session, f"{base}/api/trainings", etags, stats, args.conditional)
+            continue
+        url = f"{base}/api/v2/trainings?limit={args.limit}&fields=id,datetime,spots"
+        for _ in range(args.pages):
+            # 304 — страница не изменилась, курсоры берём из прошлого ответа
+            page = await get(session, url, etags, stats, args.conditional) or pages.get(url)
+            if page is None:
+                break
+            pages[url] = page
+            for item in page["data"][:args.occupancy]:
+                await get(session, f"{base}/api/v2/trainings/{item['id']}/pilots", etags, stats, args.conditional)
+            if not page.get("next_cursor"):
+                break
+            url = f"{base}/api/v2/trainings?limit={args.limit}&fields=id,datetime,spots&cursor={page['next_cursor']}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=3, help="страниц за один цикл опроса")
+    parser.add_argument("--occupancy", type=int, default=5, help="запросов занятости на страницу")
+    parser.add_argument("--conditional", action="store_true", help="If-None-Match с сохранённым ETag")
+    parser.add_argument("--v1", action="store_true", help="опрашивать /api/trainings")
+    args = parser.parse_args()
+
+    stats = Stats()
+    base = args.url.rstrip("/")
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+        start = time.monotonic()
+        deadline = start + args.seconds
+        await asyncio.gather(*(client(session, base, args, stats, deadline) for _ in range(args.clients)))
+        elapsed = time.monotonic() - start
+
+    if not stats.latencies:
+        print(f"нет успешных ответов, ошибок: {stats.errors}")
+        return
+    ordered = sorted(stats.latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    total = len(ordered)
+    print(f"{'v1' if args.v1 else 'v2'}{' +ETag' if args.conditional else ''}, клиентов {args.clients}: "
+          f"{total / elapsed:8.0f} req/s | p50 {statistics.median(ordered) * 1000:6.1f} мс "
+          f"| p99 {p99 * 1000:6.1f} мс | 304: {stats.not_modified / total:5.1%} "
+          f"| {stats.bytes / elapsed / 1024:8.0f} КиБ/с | ошибок {stats.errors}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Микробенчмарк разбора callback_data: кодек bot.utils.callbacks против прежнего split('_').
+
+Запуск:
+    python -m benchmarks.callback_codec --iterations 200000
+
+Для каждой кнопки печатается длина callback_data (лимит Telegram — 64 байта) и время
+упаковки и разбора одной кнопки. Прежний формат («set_channel_42_R_3») разбирался
+split('_') и int(), без проверки подлинности; кодек дополнительно проверяет подпись.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.utils.callbacks import (  # noqa: E402
+    VIEW_TRAININGS, SEARCH_RESULTS, REGISTER, SET_CHANNEL, UNREGISTER, REFUND
+)
+
+
+def legacy_set_channel(data: str):
+    parts = data.split("_")
+    return int(parts[2]), parts[3], int(parts[4])
+
+
+def legacy_int(data: str):
+    return int(data.split("_")[-1])
+
+
+USER_ID = 123456789
+CASES = [
+    # (название, действие, значения, user_id, старый формат, старый разбор)
+    ("view_trainings", VIEW_TRAININGS, (12,), None, "view_trainings_12", legacy_int),
+    ("search_results", SEARCH_RESULTS, (3, "Москва\0" + "2025-06-01"), None,
+     "search_results_3", legacy_int),
+    ("register", REGISTER, (4242,), None, "register_4242", legacy_int),
+    ("set_channel", SET_CHANNEL, (4242, "R", 3), None, "set_channel_4242_R_3", legacy_set_channel),
+    ("unregister", UNREGISTER, (4242,), USER_ID, "unregister_4242", legacy_int),
+    ("refund", REFUND, (987654,), USER_ID, "refund_987654", legacy_int),
+]
+
+
+def per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"{'кнопка':<16} {'байт':>5} {'было':>5} {'pack, мкс':>10} {'unpack, мкс':>12} {'split, мкс':>11}")
+    for name, action, values, user_id, legacy, legacy_parse in CASES:
+        data = action.pack(*values, user_id=user_id)
+        assert action.unpack(data, user_id) is not None
+        pack = per_call(lambda: action.pack(*values, user_id=user_id), args.iterations)
+        unpack = per_call(lambda: action.unpack(data, user_id), args.iterations)
+        split = per_call(lambda: legacy_parse(legacy), args.iterations)
+        print(f"{name:<16} {len(data.encode()):>5} {len(legacy.encode()):>5} "
+              f"{pack:>10.2f} {unpack:>12.2f} {split:>11.2f}")
+
+    data = UNREGISTER.pack(4242, user_id=USER_ID)
+    forged = UNREGISTER.unpack(data, USER_ID + 1)
+    print(f"Чужая кнопка отмены записи: {'отклонена' if forged is None else 'ПРИНЯТА'}")
+
+
+if __name__ == "__main__":
+    main()
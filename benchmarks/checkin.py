@@ -0,0 +1,77 @@
+"""
+Микробенчмарк отметки явки по QR: проверка токенов без БД и разбор пачки сканов.
+
+Запуск:
+    python -m benchmarks.checkin --pilots 50 --iterations 2000
+
+БД не нужна. Замеряется: выпуск токена для чека, проверка подписи одного токена
+(сервер, онлайн), проверка скана по скачанному ростеру (устройство без сети: метка из QR
+сверяется с меткой записи, ключ не нужен) и разбор пачки сканов старта тренировки
+(parse_scans перед одним UPDATE) — вместо запроса к БД на каждого пилота.
+"""
+import argparse
+import base64
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.utils.checkin import (  # noqa: E402
+    TAG_BYTES, TOKEN_PREFIX, _FIELDS, _b64encode, build_roster, issue_token, parse_scans, read_token
+)
+
+TRAINING_ID = 4242
+
+
+def per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pilots", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    registrations = [{
+        'id': 1000 + i, 'user_id': 500000 + i, 'display_name': f"pilot{i}",
+        'vtx_band': "RFE"[i % 3], 'vtx_channel': i % 8 + 1, 'paid': 1, 'checked_in_at': None,
+    } for i in range(args.pilots)]
+    training = {'id': TRAINING_ID, 'city': "Москва", 'location': "Парк", 'date': "2025-06-01", 'time': "18:00"}
+    tokens = [issue_token(r['id'], TRAINING_ID, r['user_id']) for r in registrations]
+
+    roster = build_roster(training, registrations, now)
+    tags = {p['registration_id']: p['tag'] for p in roster['pilots']}
+
+    def offline_check(token: str) -> bool:
+        # То же, что делает устройство: разобрать QR и сравнить метку с ростером (без ключа)
+        text = token[len(TOKEN_PREFIX):]
+        raw = base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+        registration_id, training_id, _ = _FIELDS.unpack(raw[:_FIELDS.size])
+        return training_id == TRAINING_ID and tags.get(registration_id) == _b64encode(raw[-TAG_BYTES:])
+
+    assert all(offline_check(t) for t in tokens)
+    assert all(read_token(t) is not None for t in tokens)
+
+    scans = [{"token": t, "scanned_at": (now - timedelta(seconds=i)).isoformat()} for i, t in enumerate(tokens)]
+    scans += scans[: len(scans) // 5]  # повторные сканы того же QR
+
+    print(f"Токен в QR: {len(tokens[0])} символов, ростер на {args.pilots} пилотов: "
+          f"{len(json.dumps(roster, ensure_ascii=False, separators=(',', ':')).encode())} байт")
+    print(f"Выпуск токена: {per_call(lambda: issue_token(1, TRAINING_ID, 2), args.iterations):.2f} мкс")
+    print(f"Проверка подписи: {per_call(lambda: read_token(tokens[0]), args.iterations):.2f} мкс")
+    print(f"Проверка по ростеру без сети: {per_call(lambda: offline_check(tokens[0]), args.iterations):.2f} мкс")
+    batch = per_call(lambda: parse_scans(TRAINING_ID, scans, now), max(1, args.iterations // 10))
+    accepted, rejected = parse_scans(TRAINING_ID, scans, now)
+    print(f"Пачка из {len(scans)} сканов: {batch / 1000:.2f} мс → {len(accepted)} отметок одним UPDATE, "
+          f"отклонено {len(rejected)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Холодный старт процесса бота без сети и БД: импорт bot.bot + сборка диспетчера.
+
+Запуск:
+    python -m benchmarks.cold_start --runs 10
+
+Каждый прогон — отдельный интерпретатор (как `python -m bot.bot`), печатаются
+медиана и худшее время. Для сравнения с полным набором функций задайте
+OPENAI_API_KEY/YOOKASSA_*/STRIPE_* в окружении — тогда тяжёлые SDK тоже
+будут импортированы.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """
+import time
+start = time.perf_counter()
+import bot.bot as app
+app.build_dispatcher()
+print(time.perf_counter() - start)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    env = {**os.environ, "ADMIN_ID": os.environ.get("ADMIN_ID", "0"), "BOT_TOKEN": "123456:COLDSTART"}
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", SNIPPET], env=env, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+
+    print(f"холодный старт: медиана {statistics.median(samples) * 1000:.0f} мс, "
+          f"худший {max(samples) * 1000:.0f} мс ({args.runs} прогонов)")
+
+
+if __name__ == '__main__':
+    main()
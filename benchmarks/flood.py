@@ -0,0 +1,99 @@
+"""
+Флуд-тест антифлуда: сколько апдейтов доходит до хендлеров (и до БД) при росте частоты нажатий.
+
+Запуск:
+    python -m benchmarks.flood --users 200 --seconds 60 --rates 1 5 20 100
+
+БД и Telegram не нужны: время модельное, хендлер только считает вызовы, callback.answer —
+заглушка. Каждый пользователь жмёт кнопки с частотой --rates (нажатий в секунду), половина
+нажатий — двойные. Для каждой частоты печатается, сколько апдейтов в секунду пришло, сколько
+дошло до хендлеров и сколько из них дорогих (reg_auto, set_channel — запись в БД). При флуде
+число вызовов хендлеров упирается в THROTTLE_RATE на пользователя и дальше не растёт.
+"""
+import argparse
+import asyncio
+import os
+import random
+from collections import Counter
+from datetime import datetime
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from aiogram.types import CallbackQuery, Chat, Message, User  # noqa: E402
+
+from bot.config import THROTTLE_RATE, THROTTLE_BURST  # noqa: E402
+from bot.middlewares.throttling import ThrottlingMiddleware, HANDLER_COSTS  # noqa: E402
+from bot.middlewares.metrics import event_key  # noqa: E402
+from bot.utils.callbacks import VIEW_TRAININGS, REGISTER, REG_AUTO, SET_CHANNEL  # noqa: E402
+
+BUTTONS = ["main_menu", VIEW_TRAININGS.pack(2), REGISTER.pack(42), REG_AUTO.pack(42), SET_CHANNEL.pack(42, "R", 3),
+           "show_stats", "noop"]
+EXPENSIVE = ("reg_auto", "set_channel")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def _answer(self, *args, **kwargs):
+    pass
+
+
+def make_callback(user_id: int, message_id: int, data: str, n: int) -> CallbackQuery:
+    user = User(id=user_id, is_bot=False, first_name="flood")
+    message = Message(message_id=message_id, date=datetime.now(), chat=Chat(id=user_id, type="private"))
+    return CallbackQuery(id=str(n), from_user=user, chat_instance="flood", message=message, data=data)
+
+
+async def run(users: int, seconds: int, rate: float):
+    clock = Clock()
+    throttling = ThrottlingMiddleware(clock=clock)
+    handled = Counter()
+
+    async def handler(event, data):
+        handled[event_key(event)] += 1
+
+    events = []
+    n = 0
+    for user_id in range(1, users + 1):
+        t = random.random() / rate
+        while t < seconds:
+            data = random.choice(BUTTONS)
+            events.append((t, user_id, data))
+            if random.random() < 0.5:  # двойное нажатие
+                events.append((t + 0.05, user_id, data))
+            t += random.expovariate(rate)
+    events.sort()
+
+    for t, user_id, data in events:
+        clock.now = t
+        n += 1
+        await throttling(handler, make_callback(user_id, 1, data, n), {})
+
+    total = sum(handled.values())
+    expensive = sum(handled[key] for key in EXPENSIVE)
+    print(f"{rate:>6.0f}/с на пользователя: пришло {len(events) / seconds:>8.0f}/с, "
+          f"до хендлеров {total / seconds:>7.0f}/с, из них дорогих {expensive / seconds:>6.0f}/с")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--rates", type=float, nargs="+", default=[1, 5, 20, 100])
+    args = parser.parse_args()
+
+    random.seed(1)
+    CallbackQuery.answer = _answer
+    print(f"THROTTLE_RATE={THROTTLE_RATE}/с, THROTTLE_BURST={THROTTLE_BURST}, "
+          f"цены: reg_auto={HANDLER_COSTS['reg_auto']}, main_menu={HANDLER_COSTS['main_menu']}")
+    for rate in args.rates:
+        await run(args.users, args.seconds, rate)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
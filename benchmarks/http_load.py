@@ -0,0 +1,113 @@
+"""
+Нагрузочный тест веб-расписания: /schedule, /schedule-partial и удержание SSE-клиентов.
+
+Запуск (веб-приложение уже поднято, БД заполнена):
+    python -m benchmarks.http_load --url http://127.0.0.1:8000 --requests 5000 --concurrency 200 --sse 2000
+
+Для сравнения со старым Flask/gunicorn из web/web.py (до переноса) поднимите его
+из предыдущего коммита на другом порту и передайте оба адреса:
+    python -m benchmarks.http_load --url http://127.0.0.1:8000 http://127.0.0.1:8001
+
+Для каждого адреса: запросов/сек, p50/p99 и ошибки для обычных страниц, затем
+открывается --sse соединений с /updates и проверяется, сколько из них живы
+через --sse-hold секунд и как при этом меняется задержка /schedule.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Tuple
+
+import aiohttp
+
+PATHS = ["/schedule", "/schedule-partial"]
+
+
+async def hammer(session: aiohttp.ClientSession, url: str, requests: int, concurrency: int) -> Tuple[float, List[float], int]:
+    """requests GET-запросов не более чем concurrency одновременно"""
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def client():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors += 1
+                        continue
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return len(latencies) / (time.perf_counter() - start), latencies, errors
+
+
+async def hold_sse(session: aiohttp.ClientSession, url: str, hold: float, alive: List[int]):
+    """Держать SSE-соединение hold секунд; засчитать, если оно не оборвалось"""
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, sock_read=hold + 30)) as resp:
+            if resp.status != 200:
+                return
+            deadline = time.monotonic() + hold
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(resp.content.readline(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+                if resp.content.at_eof():
+                    return
+            alive.append(1)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+
+
+def _report(label: str, rps: float, latencies: List[float], errors: int):
+    if not latencies:
+        print(f"  {label:<20} все запросы с ошибкой ({errors})")
+        return
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"  {label:<20} {rps:8.0f} req/s | p50 {statistics.median(ordered) * 1000:7.1f} мс "
+          f"| p99 {p99 * 1000:7.1f} мс | ошибок {errors}")
+
+
+async def run_target(base: str, args):
+    print(f"▶ {base}")
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+        for path in PATHS:
+            _report(path, *await hammer(session, base + path, args.requests, args.concurrency))
+
+        if not args.sse:
+            return
+        alive: List[int] = []
+        holders = [asyncio.create_task(hold_sse(session, base + "/updates", args.sse_hold, alive))
+                   for _ in range(args.sse)]
+        await asyncio.sleep(min(2.0, args.sse_hold / 2))
+        _report(f"/schedule +{args.sse} SSE", *await hammer(session, base + "/schedule", args.requests, args.concurrency))
+        await asyncio.gather(*holders)
+        print(f"  SSE: {len(alive)}/{args.sse} соединений продержались {args.sse_hold:.0f} с")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", nargs="+", default=["http://127.0.0.1:8000"])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--sse", type=int, default=1000, help="одновременных SSE-клиентов (0 — не проверять)")
+    parser.add_argument("--sse-hold", type=float, default=20.0, help="сколько секунд держать SSE")
+    args = parser.parse_args()
+
+    for base in args.url:
+        await run_target(base.rstrip("/"), args)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
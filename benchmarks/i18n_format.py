@@ -0,0 +1,56 @@
+"""
+Стоимость локализации: холодная загрузка локалей и форматирование одного сообщения.
+
+Запуск:
+    python -m benchmarks.i18n_format --iterations 200000
+    I18N_CACHE_PATH=/tmp/fpv_i18n.json python -m benchmarks.i18n_format   # с дисковым кэшем
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.utils.i18n import CompiledYamlCore, load_locales  # noqa: E402
+
+CASES = [
+    ("buttons-schedule", {}),
+    ("stats-total", {"total": 42}),
+    ("stats-next", {"location": "Парк Победы", "date": "2025-06-01", "time": "18:00"}),
+    ("missing-key", {}),
+]
+
+
+def bench_load(repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        load_locales()
+    return (time.perf_counter() - start) / repeats
+
+
+def bench_format(core: CompiledYamlCore, locale: str, key: str, kwargs: dict, iterations: int) -> float:
+    get = core.get
+    start = time.perf_counter()
+    for _ in range(iterations):
+        get(key, locale, **kwargs)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--load-repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    cache = os.getenv("I18N_CACHE_PATH") or "выкл."
+    print(f"Загрузка локалей (кэш: {cache}): {bench_load(args.load_repeats) * 1e3:.2f} мс")
+
+    core = CompiledYamlCore()
+    for locale in core.available_locales:
+        for key, kwargs in CASES:
+            cost = bench_format(core, locale, key, kwargs, args.iterations)
+            print(f"{locale:>3} {key:<20} {cost * 1e9:8.0f} нс/сообщение")
+
+
+if __name__ == '__main__':
+    main()
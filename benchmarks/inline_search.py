@@ -0,0 +1,99 @@
+"""
+Микробенчмарк inline-поиска по индексу тренировок в памяти.
+
+Запуск:
+    python -m benchmarks.inline_search --trainings 2000 --queries 500
+
+БД не нужна: индекс заполняется синтетическим расписанием через apply().
+Каждый запрос «набирается» по буквам, как в inline-режиме Telegram: замеряется
+каждое нажатие (p50/p99/max), отдельно — холодный поиск без кэша префиксов и
+применение дельты из одной изменённой тренировки.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+from typing import List
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.database.db import TRACK_TYPES  # noqa: E402
+from bot.utils.search_index import TrainingSearchIndex  # noqa: E402
+
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Екатеринбург", "Новосибирск", "Нижний Новгород"]
+PLACES = ["Парк Победы", "Сокольники", "Крылатское", "Лужники", "Стадион Труд", "Поле у реки",
+          "Ангар", "Трасса Север", "Карьер", "Ёлочки"]
+
+
+def make_trainings(count: int, today: date) -> List[dict]:
+    tracks = list(TRACK_TYPES)
+    return [{
+        'id': i,
+        'city': random.choice(CITIES),
+        'location': random.choice(PLACES),
+        'date': (today + timedelta(days=random.randint(0, 90))).isoformat(),
+        'time': f"{random.randint(8, 21):02d}:{random.choice(('00', '30'))}",
+        'track_type': random.choice(tracks),
+        'current_pilots': random.randint(0, 10),
+        'max_pilots': 10,
+    } for i in range(1, count + 1)]
+
+
+def make_queries(count: int, trainings: List[dict]) -> List[str]:
+    queries = []
+    for _ in range(count):
+        t = random.choice(trainings)
+        words = [t['city'].split('-')[0], t['location'].split()[0], t['date'][5:7], t['track_type']]
+        queries.append(" ".join(random.sample(words, random.randint(1, 3))).lower())
+    return queries
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trainings", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(1)
+    today = date.today()
+    trainings = make_trainings(args.trainings, today)
+    index = TrainingSearchIndex()
+    start = time.perf_counter()
+    index.apply(trainings, (), today.isoformat())
+    print(f"Индекс: {len(index.docs)} тренировок за {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    queries = make_queries(args.queries, trainings)
+    keystrokes, cold, found = [], [], 0
+    for query in queries:
+        for n in range(1, len(query) + 1):
+            start = time.perf_counter()
+            results = index.search(query[:n])
+            keystrokes.append(time.perf_counter() - start)
+        found += len(results)
+        index._cache.clear()
+        start = time.perf_counter()
+        index.search(query)
+        cold.append(time.perf_counter() - start)
+
+    print(f"Нажатий: {len(keystrokes)}, p50 {percentile(keystrokes, 0.5):.1f} мкс, "
+          f"p99 {percentile(keystrokes, 0.99):.1f} мкс, max {max(keystrokes) * 1e6:.1f} мкс")
+    print(f"Без кэша префиксов: p50 {percentile(cold, 0.5):.1f} мкс, p99 {percentile(cold, 0.99):.1f} мкс")
+    print(f"Найдено в среднем: {found / len(queries):.1f} (ответ ограничен 50)")
+
+    deltas = []
+    for _ in range(1000):
+        row = dict(random.choice(trainings), current_pilots=random.randint(0, 10))
+        start = time.perf_counter()
+        index.apply([row], (), today.isoformat())
+        deltas.append(time.perf_counter() - start)
+    print(f"Дельта из одной тренировки: p50 {percentile(deltas, 0.5):.1f} мкс, p99 {percentile(deltas, 0.99):.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Микробенчмарк обработки callback-ов меню: сборка клавиатур с кэшем и без.
+
+Запуск:
+    python -m benchmarks.keyboards --iterations 20000
+
+БД не нужна: обращения к ней подменены, Telegram-ответы — заглушки.
+Замеряется полный вызов хендлера (разбор callback_data, сборка клавиатуры,
+вызов edit_text), а также сборка клавиатуры отдельно.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.handlers import user  # noqa: E402
+from bot.utils.callbacks import ACTIONS, action_name  # noqa: E402
+from bot.utils.i18n import CompiledYamlCore  # noqa: E402
+
+
+class FakeI18n:
+    """Минимальный аналог I18nContext: i18n.a.b(**kw) → core.get("a-b", locale, **kw)"""
+
+    def __init__(self, core, locale, key=""):
+        self.core, self.locale, self._key = core, locale, key
+
+    def __getattr__(self, item):
+        return FakeI18n(self.core, self.locale, f"{self._key}-{item}" if self._key else item)
+
+    def __call__(self, **kwargs):
+        return self.core.get(self._key, self.locale, **kwargs)
+
+
+class FakeMessage:
+    async def edit_text(self, *args, **kwargs):
+        pass
+
+
+class FakeCallback:
+    def __init__(self, data):
+        self.data, self.message = data, FakeMessage()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+async def fake_bitmap(training_id: int) -> int:
+    # R1, R2, F5, E8 заняты
+    return 0b11 | (1 << (8 + 4)) | (1 << (16 + 7))
+
+
+def clear_caches():
+    user._main_menu_cache.clear()
+    for fn in (user.get_pagination_keyboard, user.get_register_method_keyboard,
+               user.get_band_keyboard, user.get_channel_keyboard):
+        fn.cache_clear()
+
+
+async def bench_handler(handler, data, i18n, iterations, cached):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if not cached:
+            clear_caches()
+        if action_name(data):
+            # Разбор callback_data — то, что делает фильтр кодека перед вызовом хендлера
+            await handler(FakeCallback(data), i18n, cb=ACTIONS[data[1]].unpack(data))
+        else:
+            await handler(FakeCallback(data), i18n)
+    return (time.perf_counter() - start) / iterations
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    user.get_channel_bitmap = fake_bitmap
+    i18n = FakeI18n(CompiledYamlCore(), "ru")
+    cases = [
+        ("main_menu", user.main_menu, "main_menu"),
+        ("register_step1", user.register_step1, user.REGISTER.pack(42)),
+        ("register_manual_band", user.register_manual_band, user.REG_MANUAL.pack(42)),
+        ("register_manual_channel", user.register_manual_channel, user.CHOOSE_BAND.pack(42, "R")),
+    ]
+    print(f"{'хендлер':<26}{'без кэша, мкс':>16}{'с кэшем, мкс':>16}")
+    for name, handler, data in cases:
+        cold = await bench_handler(handler, data, i18n, args.iterations, cached=False)
+        warm = await bench_handler(handler, data, i18n, args.iterations, cached=True)
+        print(f"{name:<26}{cold * 1e6:>16.1f}{warm * 1e6:>16.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Подготовленные выражения против текстовых запросов через db.fetch*.
+
+Запуск (нужна БД с database/init.sql):
+    python -m benchmarks.prepared_statements --seconds 10 --concurrency 20
+
+Оба режима гоняют одну и ту же смесь горячих запросов (расписание, занятые
+каналы, согласие, админ, вставка регистрации в откатываемой транзакции)
+через общий пул. Для каждого режима печатаются запросы/сек, p50 и p99.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.database import db  # noqa: E402
+from bot.database.statements import STATEMENTS  # noqa: E402
+
+BASE_USER_ID = 9_200_000_000
+USERS = 200
+
+
+class _Rollback(Exception):
+    pass
+
+
+async def _insert_raw(training_id: int, user_id: int):
+    try:
+        async with db.transaction() as conn:
+            await conn.fetchval(STATEMENTS["registration_insert"], training_id, user_id, "R", 1)
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+async def _insert_prepared(training_id: int, user_id: int):
+    try:
+        async with db.transaction() as conn:
+            await db.insert_registration(conn, training_id, user_id, "R", 1)
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+def workloads(training_id: int) -> Dict[str, List[Callable[[int], Awaitable]]]:
+    bands = list(db.VTX_BANDS)
+    raw = [
+        lambda u: db.fetch(STATEMENTS["schedule_list"], None, None, db.local_today()),
+        lambda u: db.fetch(STATEMENTS["used_channels"], training_id),
+        lambda u: db.fetchval(STATEMENTS["channel_bitmap"], training_id, bands),
+        lambda u: db.fetchrow(STATEMENTS["consent_lookup"], u),
+        lambda u: db.fetchrow(STATEMENTS["admin_lookup"], u),
+        lambda u: _insert_raw(training_id, u),
+    ]
+    prepared = [
+        lambda u: db.get_all_trainings(),
+        lambda u: db.get_used_channels(training_id),
+        lambda u: db.get_channel_bitmap(training_id),
+        lambda u: db.get_user_consent(u),
+        lambda u: db.get_admin(u),
+        lambda u: _insert_prepared(training_id, u),
+    ]
+    return {"raw": raw, "prepared": prepared}
+
+
+async def run_mode(ops: List[Callable[[int], Awaitable]], seconds: float, concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            op = random.choice(ops)
+            start = time.perf_counter()
+            await op(BASE_USER_ID + random.randrange(USERS))
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def report(mode: str, latencies: List[float], seconds: float):
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{mode:>9}: {len(latencies) / seconds:8.0f} запросов/с | p50 {p50:6.2f} мс | p99 {p99:6.2f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    await db.init_db_pool()
+    training_id = await db.add_training("Bench", "Prepared", "2099-01-01", "12:00", "race", 10)
+    try:
+        for mode, ops in workloads(training_id).items():
+            await run_mode(ops, 1, args.concurrency)  # прогрев пула и кэша планов
+            report(mode, await run_mode(ops, args.seconds, args.concurrency), args.seconds)
+    finally:
+        await db.execute('DELETE FROM trainings WHERE id = $1', training_id)
+        await db.close_db_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""
+Очередь возвратов refund_jobs на фейковых провайдерах: пропускная способность и восстановление после падения.
+
+Запуск (нужна БД с database/init.sql):
+    python -m benchmarks.refund_queue --trainings 4 --latency 0.2 --fail 0.1 --pending 0.2 --crash-after 30
+
+Создаются тренировки с оплаченными пилотами (ЮKassa, Stripe и Telegram Stars по кругу) и отменяются
+через cancel_training — на каждую оплату в той же транзакции появляется задача возврата. Провайдеры
+заменены фейками в памяти: задержка ответа, сбои сети до и после создания возврата (ответ потерян),
+отложенное проведение. Воркер process_refund_jobs прерывается после --crash-after вызовов провайдеров
+(падение процесса посреди пачки), аренда взятых задач «истекает», и очередь дорабатывается до конца;
+время повторов и опросов проматывается. Проверяется: каждый платёж возвращён у провайдера ровно один раз
+(повтор с тем же idempotency_key получает прежний возврат), в журнале — refunded и одно событие возврата.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from decimal import Decimal
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.database import db  # noqa: E402
+from bot.utils import scheduler  # noqa: E402
+from bot.utils.payment_refunds import RefundResult  # noqa: E402
+
+BASE_USER_ID = 9_300_000_000
+CHANNELS = 24
+PROVIDERS = (('yookassa', 'RUB'), ('stripe', 'RUB'), ('telegram', 'XTR'))
+
+
+class FakeProvider:
+    """Провайдер в памяти: идемпотентность по ключу, задержка, сбои и отложенное проведение"""
+
+    def __init__(self, name: str, latency: float, fail: float, pending: float):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.pending = pending
+        self.by_key = {}       # idempotency_key → id возврата
+        self.payments = {}     # id платежа → id возвратов (больше одного — двойной возврат)
+        self.done = set()
+        self.calls = 0
+
+    async def __call__(self, job, bot) -> RefundResult:
+        self.calls += 1
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.fail:
+            raise ConnectionError("provider timeout")
+        refund_id = job['provider_refund_id']
+        if refund_id is None:
+            key = str(job['idempotency_key'])
+            if key not in self.by_key:
+                self.by_key[key] = refund_id = f"{self.name}-{len(self.by_key) + 1}"
+                self.payments.setdefault(job['payment_id'], []).append(refund_id)
+            refund_id = self.by_key[key]
+            if random.random() < self.fail:
+                raise ConnectionError("connection reset after refund was created")
+            if refund_id not in self.done and random.random() < self.pending:
+                return RefundResult(refund_id, False)
+        self.done.add(refund_id)
+        return RefundResult(refund_id, True)
+
+
+async def fill(trainings: int):
+    """Тренировки с оплаченными пилотами → id тренировок и пользователей"""
+    training_ids, users = [], []
+    for n in range(trainings):
+        training_id = await db.add_training("Bench", f"Refunds #{n}", "2099-01-01", "12:00", "race", CHANNELS)
+        training_ids.append(training_id)
+        for i in range(CHANNELS):
+            user_id = BASE_USER_ID + n * 1000 + i
+            users.append(user_id)
+            ok, reason, reg = await db.register_pilot_with_channel(training_id, user_id, "bench", "bench")
+            assert ok, reason
+            reg_id = reg['reg_id']
+            provider, currency = PROVIDERS[(n * CHANNELS + i) % len(PROVIDERS)]
+            await db.mark_registration_paid(reg_id, provider, f"bench-{provider}-{reg_id}", Decimal("500.00"), currency)
+    return training_ids, users
+
+
+async def crash(refunds, crash_after: int):
+    """Воркер, убитый после crash_after вызовов провайдеров (задачи пачки остаются взятыми)"""
+    task = asyncio.create_task(scheduler.process_refund_jobs(None, refunds=refunds, receipts=False))
+    while not task.done() and sum(p.calls for p in refunds.values()) < crash_after:
+        await asyncio.sleep(0.005)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trainings", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--fail", type=float, default=0.1)
+    parser.add_argument("--pending", type=float, default=0.2)
+    parser.add_argument("--crash-after", type=int, default=30)
+    args = parser.parse_args()
+
+    random.seed(1)
+    refunds = {name: FakeProvider(name, args.latency, args.fail, args.pending) for name, _ in PROVIDERS}
+    await db.init_db_pool()
+    training_ids, users = [], []
+    try:
+        training_ids, users = await fill(args.trainings)
+        payment_ids = []
+        start = time.perf_counter()
+        for training_id in training_ids:
+            payment_ids += (await db.cancel_training(training_id, "бенчмарк"))['refund_payment_ids']
+        print(f"Отмена {len(training_ids)} тренировок: {(time.perf_counter() - start) * 1000:.1f} мс, "
+              f"задач возврата: {len(payment_ids)}")
+        jobs = await db.fetchval('SELECT COUNT(*) FROM refund_jobs WHERE payment_id = ANY($1::bigint[])', payment_ids)
+        assert jobs == len(payment_ids), (jobs, len(payment_ids))
+
+        await crash(refunds, args.crash_after)
+        leased = await db.fetchval('''
+            SELECT COUNT(*) FROM refund_jobs
+            WHERE payment_id = ANY($1::bigint[]) AND status = 'pending' AND next_attempt_at > NOW()
+        ''', payment_ids)
+        print(f"Падение после {args.crash_after} вызовов: взято и не завершено {leased} задач")
+
+        passes, busy = 0, 0.0
+        while await db.fetchval("SELECT COUNT(*) FROM refund_jobs WHERE payment_id = ANY($1::bigint[]) "
+                                "AND status = 'pending'", payment_ids):
+            # Аренда истекла, время повторов и опросов прошло
+            await db.execute("UPDATE refund_jobs SET next_attempt_at = NOW() WHERE status = 'pending' "
+                             "AND payment_id = ANY($1::bigint[])", payment_ids)
+            start = time.perf_counter()
+            await scheduler.process_refund_jobs(None, refunds=refunds, receipts=False)
+            busy += time.perf_counter() - start
+            passes += 1
+            assert passes < 100, "очередь не сходится"
+
+        stats = await db.fetchrow('''
+            SELECT
+                COUNT(*) FILTER (WHERE p.status = 'refunded' AND p.refunded_amount = p.amount) AS refunded,
+                (SELECT COUNT(*) FROM refund_jobs j WHERE j.payment_id = ANY($1::bigint[]) AND j.status = 'failed')
+                    AS failed,
+                (SELECT COUNT(*) FROM payment_events e WHERE e.payment_id = ANY($1::bigint[])
+                    AND e.status = 'refunded') AS events
+            FROM payments p
+            WHERE p.id = ANY($1::bigint[])
+        ''', payment_ids)
+        doubled = sum(1 for p in refunds.values() for ids in p.payments.values() if len(ids) > 1)
+        calls = sum(p.calls for p in refunds.values())
+        print(f"Доработка: {passes} проходов, {busy:.2f} с, {len(payment_ids) / busy:.1f} возвратов/с, "
+              f"вызовов провайдеров {calls}")
+        print(f"Итог: возвращено {stats['refunded']}/{len(payment_ids)}, событий refunded {stats['events']}, "
+              f"снято с очереди {stats['failed']}, двойных возвратов у провайдера {doubled}")
+        assert doubled == 0
+        assert stats['refunded'] + stats['failed'] == len(payment_ids)
+        assert stats['events'] == stats['refunded']
+    finally:
+        for training_id in training_ids:
+            await db.execute('DELETE FROM trainings WHERE id = $1', training_id)
+        await db.execute('DELETE FROM notifications_outbox WHERE user_id = ANY($1::bigint[])', users)
+        await db.execute('DELETE FROM payments WHERE user_id = ANY($1::bigint[])', users)
+        await db.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
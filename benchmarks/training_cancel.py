@@ -0,0 +1,107 @@
+"""
+Отмена заполненной тренировки: время ответа админу и фоновая рассылка с повторами.
+
+Запуск (нужна БД с database/init.sql):
+    python -m benchmarks.training_cancel --rounds 5 --waiting 26 --paid 0.5
+
+Каждый раунд заполняет тренировку (24 канала) и лист ожидания, часть записей оплачивает,
+затем отменяет тренировку через cancel_training и замеряет время транзакции. Проверяется:
+тренировки и записей нет, на каждую оплату — заявка на возврат, на каждого пилота и
+ожидающего — одно уведомление в outbox. Затем outbox рассылается фейковым ботом (без сети,
+--fail — доля ошибок отправки): темп не выше NOTIFY_RATE_PER_SECOND, ошибки уходят на повтор.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from decimal import Decimal
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.database import db  # noqa: E402
+from bot.utils import scheduler  # noqa: E402
+
+BASE_USER_ID = 9_200_000_000
+CHANNELS = 24
+
+
+class FakeBot:
+    def __init__(self, fail: float, users):
+        self.fail = fail
+        self.users = set(users)
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str):
+        assert chat_id in self.users, chat_id
+        if random.random() < self.fail:
+            raise ConnectionError("network is unreachable")
+        self.sent += 1
+
+
+async def run_round(round_no: int, waiting: int, paid_share: float, fail: float):
+    users = [BASE_USER_ID + round_no * 1000 + i for i in range(CHANNELS + waiting)]
+    pilots, queue = users[:CHANNELS], users[CHANNELS:]
+    training_id = await db.add_training("Bench", f"Cancel #{round_no}", "2099-01-01", "12:00", "race", CHANNELS)
+    try:
+        paid = 0
+        for user_id in pilots:
+            ok, reason, reg = await db.register_pilot_with_channel(training_id, user_id, "bench", "bench")
+            assert ok, reason
+            reg_id = reg['reg_id']
+            if random.random() < paid_share:
+                await db.mark_registration_paid(reg_id, 'telegram', f"bench-{reg_id}", Decimal("500.00"))
+                paid += 1
+        for user_id in queue:
+            ok, reason, _ = await db.join_waitlist(training_id, user_id)
+            assert ok, reason
+
+        start = time.perf_counter()
+        canceled = await db.cancel_training(training_id, "бенчмарк")
+        elapsed = time.perf_counter() - start
+
+        assert canceled['registrations'] == CHANNELS and canceled['waitlisted'] == waiting, canceled
+        assert len(canceled['refund_payment_ids']) == paid, (canceled['refund_payment_ids'], paid)
+        assert not await db.fetchval('SELECT COUNT(*) FROM registrations WHERE training_id = $1', training_id)
+        outbox = await db.fetchval(
+            'SELECT COUNT(*) FROM notifications_outbox WHERE user_id = ANY($1::bigint[]) AND sent_at IS NULL', users
+        )
+        assert outbox == len(users), (outbox, len(users))
+
+        bot = FakeBot(fail, users)
+        start = time.perf_counter()
+        await scheduler.send_pending_notifications(bot)
+        delivery = time.perf_counter() - start
+        retrying = await db.fetchval('''
+            SELECT COUNT(*) FROM notifications_outbox
+            WHERE user_id = ANY($1::bigint[]) AND sent_at IS NULL AND failed_at IS NULL AND attempts > 0
+        ''', users)
+        print(f"Раунд {round_no}: отмена {elapsed * 1000:.1f} мс ({len(users)} уведомлений, {paid} возвратов), "
+              f"рассылка {delivery:.2f} с — отправлено {bot.sent}, отложено на повтор {retrying}")
+    finally:
+        await db.execute('DELETE FROM trainings WHERE id = $1', training_id)
+        await db.execute('DELETE FROM notifications_outbox WHERE user_id = ANY($1::bigint[])', users)
+        await db.execute('DELETE FROM payment_events WHERE payment_id IN '
+                         '(SELECT id FROM payments WHERE user_id = ANY($1::bigint[]))', users)
+        await db.execute('DELETE FROM payments WHERE user_id = ANY($1::bigint[])', users)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--waiting", type=int, default=26)
+    parser.add_argument("--paid", type=float, default=0.5)
+    parser.add_argument("--fail", type=float, default=0.05)
+    args = parser.parse_args()
+
+    random.seed(1)
+    await db.init_db_pool()
+    try:
+        for round_no in range(args.rounds):
+            await run_round(round_no, args.waiting, args.paid, args.fail)
+    finally:
+        await db.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
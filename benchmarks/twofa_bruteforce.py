@@ -0,0 +1,114 @@
+"""
+Проверка 2FA под перебором кодов.
+
+Запуск (нужна БД с database/init.sql):
+    python -m benchmarks.twofa_bruteforce --attempts 20000 --concurrency 200 --users 50 --ips 100
+
+Атакующие с --ips адресов подбирают коды --users админов так же, как вход
+веб-админки: сначала проверка ограничителей в памяти (по IP и по админу),
+затем verify_2fa_code в БД. С --no-throttle ограничители выключены и каждая
+попытка идёт в БД — видно, сколько выдерживает сама проверка и как быстро
+сгорают коды по счётчику попыток. Печатаются попытки/сек, p50/p99 отдельно
+для отсечённых в памяти и проверенных в БД, угаданные и сгоревшие коды.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from typing import List
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.database import db  # noqa: E402
+from bot.utils.twofa import TWOFA_MAX_ATTEMPTS, FailureThrottle  # noqa: E402
+
+BASE_USER_ID = 9_200_000_000
+
+
+class Stats:
+    def __init__(self):
+        self.blocked: List[float] = []
+        self.checked: List[float] = []
+        self.guessed = 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+async def attacker(queue: asyncio.Queue, users: List[int], ips: List[str], throttled: bool,
+                   ip_throttle: FailureThrottle, user_throttle: FailureThrottle, stats: Stats):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        user_id, ip = random.choice(users), random.choice(ips)
+        code = str(random.randint(100000, 999999))
+        start = time.perf_counter()
+        if throttled and (ip_throttle.retry_after(ip) or user_throttle.retry_after(user_id)):
+            stats.blocked.append(time.perf_counter() - start)
+            continue
+        ok = await db.verify_2fa_code(user_id, code)
+        stats.checked.append(time.perf_counter() - start)
+        if ok:
+            stats.guessed += 1
+        elif throttled:
+            ip_throttle.failure(ip)
+            user_throttle.failure(user_id)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--ips", type=int, default=100)
+    parser.add_argument("--no-throttle", action="store_true")
+    args = parser.parse_args()
+
+    await db.init_db_pool()
+    users = [BASE_USER_ID + i for i in range(args.users)]
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(args.ips)]
+    try:
+        for user_id in users:
+            await db.create_2fa_session(user_id)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.attempts):
+            queue.put_nowait(i)
+        stats = Stats()
+        ip_throttle = FailureThrottle(limit=20, window=15 * 60)
+        user_throttle = FailureThrottle(limit=TWOFA_MAX_ATTEMPTS, window=15 * 60)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            attacker(queue, users, ips, not args.no_throttle, ip_throttle, user_throttle, stats)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+        alive = await db.fetchval(
+            "SELECT COUNT(*) FROM admin_2fa_sessions WHERE user_id = ANY($1::bigint[])", users
+        )
+        total = len(stats.blocked) + len(stats.checked)
+        print(f"Режим: {'без ограничителей' if args.no_throttle else 'с ограничителями'}")
+        print(f"Попыток: {total} за {elapsed:.2f} с ({total / elapsed:.0f}/с)")
+        print(f"Отсечено в памяти: {len(stats.blocked)}, p50 {percentile(stats.blocked, 0.5):.3f} мс, "
+              f"p99 {percentile(stats.blocked, 0.99):.3f} мс")
+        print(f"Проверено в БД: {len(stats.checked)}, p50 {percentile(stats.checked, 0.5):.2f} мс, "
+              f"p99 {percentile(stats.checked, 0.99):.2f} мс"
+              + (f", среднее {statistics.mean(stats.checked) * 1000:.2f} мс" if stats.checked else ""))
+        print(f"Угадано кодов: {stats.guessed}, сгорело: {args.users - alive - stats.guessed} из {args.users}")
+    finally:
+        await db.execute("DELETE FROM admin_2fa_sessions WHERE user_id = ANY($1::bigint[])", users)
+        await db.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
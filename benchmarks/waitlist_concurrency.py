@@ -0,0 +1,86 @@
+"""
+Проверка листа ожидания под конкурентной нагрузкой.
+
+Запуск (нужна БД с database/init.sql):
+    python -m benchmarks.waitlist_concurrency --rounds 20
+
+Каждый раунд создаёт тренировку, заполняет её и лист ожидания, затем
+одновременно отменяет записи, удаляет пользователей и ставит новых пилотов
+в очередь. После раунда проверяются инварианты: счётчик равен числу записей,
+лимит не превышен, каналы не дублируются, продвижение идёт строго по FIFO
+и на каждое продвижение есть уведомление в outbox.
+"""
+import argparse
+import asyncio
+import os
+import random
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+from bot.database import db  # noqa: E402
+
+BASE_USER_ID = 9_100_000_000
+MAX_PILOTS = 4
+
+
+async def run_round(round_no: int, waiting: int) -> None:
+    users = [BASE_USER_ID + round_no * 1000 + i for i in range(MAX_PILOTS + waiting + 10)]
+    pilots, queue, late = users[:MAX_PILOTS], users[MAX_PILOTS:MAX_PILOTS + waiting], users[MAX_PILOTS + waiting:]
+
+    training_id = await db.add_training("Bench", f"Waitlist #{round_no}", "2099-01-01", "12:00", "race", MAX_PILOTS)
+    try:
+        for user_id in pilots:
+            ok, reason, _ = await db.register_pilot_with_channel(training_id, user_id, "bench", "bench")
+            assert ok, reason
+        for user_id in queue:
+            ok, reason, _ = await db.join_waitlist(training_id, user_id)
+            assert ok, reason
+
+        # Одновременно: отмены, удаление данных, новые желающие в очередь
+        random.shuffle(pilots)
+        cancel, wipe = pilots[:2], pilots[2:]
+        tasks = [db.unregister_pilot(training_id, u) for u in cancel]
+        tasks += [db.delete_user_data(u) for u in wipe]
+        tasks += [db.join_waitlist(training_id, u) for u in late]
+        await asyncio.gather(*tasks)
+
+        training = await db.fetchrow('SELECT current_pilots, max_pilots FROM trainings WHERE id = $1', training_id)
+        regs = await db.fetch('SELECT user_id, vtx_band, vtx_channel FROM registrations WHERE training_id = $1', training_id)
+        channels = [(r['vtx_band'], r['vtx_channel']) for r in regs]
+        registered = {r['user_id'] for r in regs}
+
+        assert training['current_pilots'] == len(regs), (training['current_pilots'], len(regs))
+        assert len(regs) <= training['max_pilots'], len(regs)
+        assert len(channels) == len(set(channels)), channels
+
+        # Все освободившиеся места ушли первым в очереди — FIFO
+        promoted_expected = set(queue[:MAX_PILOTS])
+        assert promoted_expected <= registered, (promoted_expected, registered)
+
+        notified = await db.fetch(
+            'SELECT DISTINCT user_id FROM notifications_outbox WHERE user_id = ANY($1::bigint[])',
+            list(registered)
+        )
+        assert {r['user_id'] for r in notified} == registered - set(pilots), notified
+    finally:
+        await db.execute('DELETE FROM trainings WHERE id = $1', training_id)
+        await db.execute('DELETE FROM notifications_outbox WHERE user_id = ANY($1::bigint[])', users)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--waiting", type=int, default=8)
+    args = parser.parse_args()
+
+    await db.init_db_pool()
+    try:
+        for round_no in range(args.rounds):
+            await run_round(round_no, args.waiting)
+        print(f"✅ {args.rounds} раундов: инварианты листа ожидания соблюдены")
+    finally:
+        await db.close_db_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
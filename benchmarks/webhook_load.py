@@ -0,0 +1,147 @@
+"""
+Нагрузочный тест очереди апдейтов: приёмник вебхука + N процессов bot.worker.
+
+Запуск (нужна БД с database/init.sql; очередь update_queue должна быть пустой):
+    python -m benchmarks.webhook_load --updates 5000 --chats 200 --workers 1 2 4 8
+
+Для каждого числа процессов синтетические апдейты отправляются POST-запросами
+в приёмник (update_receiver на локальном порту), затем запускаются воркеры
+с тестовым диспетчером: хендлер имитирует работу (--work-ms) и записывает
+порядковый номер сообщения в update_queue_bench. Печатаются апдейты/сек
+приёма и обработки; в конце проверяется порядок внутри каждого чата.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+os.environ.setdefault("ADMIN_ID", "0")
+
+import aiohttp  # noqa: E402
+from aiogram import Bot, Dispatcher, Router  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from bot.database import db  # noqa: E402
+from bot.utils.update_queue import update_receiver  # noqa: E402
+
+BASE_UPDATE_ID = 9_300_000_000
+BASE_CHAT_ID = 9_300_000_000
+PORT = 18080
+FAKE_TOKEN = "123456:BENCHMARK"
+
+
+def synthetic_update(update_id: int, chat_id: int, seq: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": seq,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": str(seq),
+        },
+    }
+
+
+def _worker_process(concurrency: int, work_ms: float):
+    from bot.worker import run_worker
+
+    router = Router()
+
+    @router.message()
+    async def record(message: Message):
+        await asyncio.sleep(work_ms / 1000)
+        await db.execute(
+            'INSERT INTO update_queue_bench (chat_id, seq) VALUES ($1, $2)',
+            message.chat.id, int(message.text)
+        )
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    asyncio.run(run_worker(concurrency, dp=dp, bot=Bot(token=FAKE_TOKEN)))
+
+
+async def post_updates(round_no: int, updates: int, chats: int) -> float:
+    """Отправить апдейты в приёмник по порядку update_id, как это делает Telegram"""
+    bodies = [
+        json.dumps(synthetic_update(BASE_UPDATE_ID + round_no * updates + i, BASE_CHAT_ID + i % chats, i // chats))
+        for i in range(updates)
+    ]
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        for body in bodies:
+            async with session.post(f"http://127.0.0.1:{PORT}/webhook", data=body) as resp:
+                assert resp.status == 200, resp.status
+    return updates / (time.perf_counter() - start)
+
+
+async def drain(workers: int, concurrency: int, work_ms: float, updates: int) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_worker_process, args=(concurrency, work_ms)) for _ in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    try:
+        while await db.fetchval('SELECT COUNT(*) FROM update_queue_bench') < updates:
+            await asyncio.sleep(0.05)
+        return updates / (time.perf_counter() - start)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+async def check_order() -> int:
+    """Номера сообщений каждого чата должны обрабатываться по возрастанию"""
+    broken = await db.fetchval('''
+        SELECT COUNT(*) FROM (
+            SELECT seq < LAG(seq) OVER (PARTITION BY chat_id ORDER BY id) AS out_of_order
+            FROM update_queue_bench
+        ) s
+        WHERE out_of_order
+    ''')
+    return broken
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=8, help="апдейтов одновременно на процесс")
+    parser.add_argument("--work-ms", type=float, default=5.0, help="имитация работы хендлера")
+    args = parser.parse_args()
+
+    await db.init_db_pool()
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS update_queue_bench (
+            id BIGSERIAL PRIMARY KEY, chat_id BIGINT NOT NULL, seq INTEGER NOT NULL
+        )
+    ''')
+
+    app = web.Application()
+    app.router.add_post('/webhook', update_receiver())
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+
+    try:
+        for round_no, workers in enumerate(args.workers):
+            await db.execute('TRUNCATE update_queue_bench')
+            ingest = await post_updates(round_no, args.updates, args.chats)
+            processed = await drain(workers, args.concurrency, args.work_ms, args.updates)
+            broken = await check_order()
+            status = "✅" if broken == 0 else f"❌ {broken} нарушений порядка"
+            print(f"воркеров {workers:>2}: приём {ingest:7.0f} апд/с | обработка {processed:7.0f} апд/с | {status}")
+    finally:
+        await runner.cleanup()
+        await db.execute('DROP TABLE IF EXISTS update_queue_bench')
+        await db.close_db_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
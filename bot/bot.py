@@ -1,25 +1,33 @@
+import time
+
+_STARTED_AT = time.perf_counter()
+
 import asyncio
 import logging
 import signal
-import os
 from aiogram import Bot, Dispatcher
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
-from aiogram_i18n import I18nMiddleware
-from aiogram_i18n.cores import FluentRuntimeCore as YamlCore   # alias для совместимости
-from aiogram_i18n.exceptions import NoLocalesError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from aiohttp import web
+from prometheus_client import start_http_server
 from .config import (
-    BOT_TOKEN, SENTRY_DSN, WEBHOOK_URL,
-    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+    BOT_TOKEN, SENTRY_DSN, SENTRY_TRACES_SAMPLE_RATE, SENTRY_PROFILES_SAMPLE_RATE,
+    WEBHOOK_URL, WEBHOOK_SECRET, UPDATE_WORKERS, METRICS_PORT, OPENAI_API_KEY, SHUTDOWN_TIMEOUT
 )
 from .database.db import init_db_pool, close_db_pool
+from .lifecycle import Lifecycle, drain_outbox, wait_or_timeout
 from .middlewares.i18n import ACLMiddleware
-from .handlers.user import router as user_router
-from .handlers.admin import router as admin_router
-from .handlers.payments import router as payments_router, setup_payment_webhooks
-from .handlers.voice import router as voice_router
-import sentry_sdk
+from .middlewares.inflight import InFlightMiddleware
+from .middlewares.throttling import ThrottlingMiddleware
+from .middlewares.metrics import (
+    MetricsMiddleware, TelegramMetricsMiddleware, metrics_handler, http_metrics_middleware
+)
+from .utils.scheduler import setup_maintenance_jobs
+from .utils.search_index import training_index
+from .utils.i18n import setup_i18n
+from .utils.update_queue import setup_update_receiver
+
+_IMPORTS_DONE = time.perf_counter()
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,157 +36,184 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация Sentry
-if SENTRY_DSN:
+
+def init_sentry():
+    """Sentry (и его интеграции) импортируется только при заданном SENTRY_DSN"""
+    if not SENTRY_DSN:
+        return
+    import sentry_sdk
     sentry_sdk.init(
         dsn=SENTRY_DSN,
-        traces_sample_rate=1.0,
-        profiles_sample_rate=1.0,
+        traces_sample_rate=SENTRY_TRACES_SAMPLE_RATE,
+        profiles_sample_rate=SENTRY_PROFILES_SAMPLE_RATE,
         environment="production",
     )
     logger.info("✅ Sentry initialized")
 
-# Глобальные переменные для graceful shutdown
-runner = None
-site = None
-
-async def on_startup(bot: Bot):
-    """Действия при старте бота"""
-    logger.info("🚀 Bot starting...")
-    await init_db_pool()
-    logger.info("✅ Database pool initialized")
-
-    if WEBHOOK_URL:
-        webhook_info = await bot.get_webhook_info()
-        if webhook_info.url != f"{WEBHOOK_URL}/webhook":
-            await bot.set_webhook(url=f"{WEBHOOK_URL}/webhook")
-            logger.info(f"🔗 Webhook set to {WEBHOOK_URL}/webhook")
-        else:
-            logger.info("🔗 Webhook already set")
 
-async def on_shutdown(bot: Bot):
-    """Действия при остановке бота"""
-    logger.info("🛑 Bot shutting down...")
+def create_bot() -> Bot:
+    """Экземпляр Bot с метриками исходящих вызовов"""
+    bot = Bot(token=BOT_TOKEN)
+    bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
 
-    # Остановка веб-сервера
-    global runner, site
-    if site:
-        await site.stop()
-        logger.info("✅ Web server stopped")
-    if runner:
-        await runner.cleanup()
 
-    # Остановка шедулера
-    if hasattr(bot, 'scheduler') and bot.scheduler:
-        bot.scheduler.shutdown()
-        logger.info("✅ Scheduler shutdown")
+def build_dispatcher() -> Dispatcher:
+    """Диспетчер с локализацией, middleware и роутерами (общий для бота и bot.worker)"""
+    dp = Dispatcher()
 
-    # Закрытие пула БД
-    await close_db_pool()
-    logger.info("✅ Database pool closed")
+    # Настройка интернационализации (локали предкомпилированы, язык — из user_consent.lang)
+    setup_i18n(dp)
+    dp.message.middleware(ACLMiddleware())
+    dp.callback_query.middleware(ACLMiddleware())
+    logger.info("✅ i18n middleware configured")
 
-    # Закрытие сессии бота
-    await bot.session.close()
-    logger.info("✅ Bot session closed")
+    # Антифлуд до фильтров и хендлеров: сообщения и callback-и одним набором вёдер
+    throttling = ThrottlingMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+
+    # Подключение роутеров; голосовой помощник (openai) — только если задан ключ
+    from .handlers.user import router as user_router
+    from .handlers.admin import router as admin_router
+    from .handlers.payments import router as payments_router
+    routers = [("user", user_router), ("admin", admin_router), ("payments", payments_router)]
+    if OPENAI_API_KEY:
+        from .handlers.voice import router as voice_router
+        routers.append(("voice", voice_router))
+    from .handlers.fallback import router as fallback_router
+    routers.append(("fallback", fallback_router))
+
+    for name, router in routers:
+        dp.include_router(router)
+        router.message.middleware(MetricsMiddleware(name))
+        router.callback_query.middleware(MetricsMiddleware(name))
+    logger.info(f"✅ Routers registered: {', '.join(name for name, _ in routers)}")
+    return dp
 
 
 async def main():
     """Главная функция запуска бота"""
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
-
-    # Инициализация шедулера
-    scheduler = AsyncIOScheduler()
-    scheduler.start()
-    bot.scheduler = scheduler  # Привязываем к боту для доступа в хендлерах
-    logger.info("✅ Scheduler started")
+    lifecycle = Lifecycle(_STARTED_AT)
+    lifecycle.record("imports", _IMPORTS_DONE - _STARTED_AT)
+
+    with lifecycle.phase("sentry"):
+        init_sentry()
+
+    with lifecycle.phase("dispatcher"):
+        bot = create_bot()
+        dp = build_dispatcher()
+        inflight = InFlightMiddleware()
+        dp.update.outer_middleware(inflight)
+
+    # Шедулер только в этом процессе — воркеры очереди его не запускают
+    with lifecycle.phase("scheduler"):
+        scheduler = AsyncIOScheduler()
+        setup_maintenance_jobs(scheduler, bot)
+        scheduler.start()
+        bot.scheduler = scheduler  # Привязываем к боту для доступа в хендлерах
+
+    runner = None
+    site = None
+
+    async def stop_intake():
+        if site:
+            await site.stop()
+
+    async def stop_scheduler():
+        scheduler.shutdown(wait=False)
+
+    async def stop_web_server():
+        if runner:
+            await runner.cleanup()
+
+    # Порядок остановки: перестать принимать апдейты → дождаться текущих → остановить
+    # шедулер → дослать outbox → закрыть сервер, пул и сессию (каждый шаг ровно один раз)
+    lifecycle.on_shutdown("Intake stopped", stop_intake)
+    lifecycle.on_shutdown("In-flight updates drained",
+                          lambda: wait_or_timeout(inflight.wait_idle(), SHUTDOWN_TIMEOUT, "Обработка апдейтов"))
+    lifecycle.on_shutdown("Scheduler shutdown", stop_scheduler)
+    lifecycle.on_shutdown("Outbox drained", lambda: drain_outbox(bot, SHUTDOWN_TIMEOUT))
+    lifecycle.on_shutdown("Search index stopped", training_index.stop)
+    lifecycle.on_shutdown("Web server stopped", stop_web_server)
+    lifecycle.on_shutdown("Database pool closed", close_db_pool)
+    lifecycle.on_shutdown("Bot session closed", bot.session.close)
+
+    async def on_startup(bot: Bot):
+        """Действия при старте бота"""
+        with lifecycle.phase("database"):
+            await init_db_pool()
+
+        # Индекс inline-поиска: в памяти процесса, дальше обновляется по NOTIFY
+        with lifecycle.phase("search_index"):
+            await training_index.start()
 
-    
-    
-    # Настройка интернационализации
-    base_dir = os.path.dirname(os.path.abspath(__file__))  # /app/bot
-    localization_path = os.path.join(base_dir, "utils", "localization")  # /app/bot/utils/localization
-
-    print(f"📂 Абсолютный путь к localization: {localization_path}")
-    print(f"📄 Файлы в папке: {os.listdir(localization_path)}")
-
-    try:
-        core = YamlCore(path=localization_path)
-        # Принудительно загружаем локали
-        core.default_locale = "ru"
-        
-        #core.load()
-        logger.info(f"✅ Загруженные локали: {list(core.locales)}")
-    except NoLocalesError as e:
-        logger.info(f"❌ Ошибка загрузки локалей: {e}")
-        raise
-    except Exception as e:
-        logger.info(f"💥 Неизвестная ошибка: {e}")
-        raise
-
-    i18n_middleware = I18nMiddleware(
-        core=core,
-        default_locale="ru",
-    )
-    i18n_middleware.setup(dp)
-    dp.message.middleware(ACLMiddleware())
-    dp.callback_query.middleware(ACLMiddleware())
-    logger.info("✅ i18n middleware configured")
+        if WEBHOOK_URL:
+            with lifecycle.phase("webhook"):
+                webhook_info = await bot.get_webhook_info()
+                if webhook_info.url != f"{WEBHOOK_URL}/webhook":
+                    await bot.set_webhook(url=f"{WEBHOOK_URL}/webhook", secret_token=WEBHOOK_SECRET or None)
+                    logger.info(f"🔗 Webhook set to {WEBHOOK_URL}/webhook")
+                else:
+                    logger.info("🔗 Webhook already set")
 
-    # Подключение роутеров
-    dp.include_router(user_router)
-    dp.include_router(admin_router)
-    dp.include_router(payments_router)
-    dp.include_router(voice_router)
-    logger.info("✅ All routers registered")
+    async def on_shutdown():
+        await lifecycle.shutdown()
 
-    # Настройка startup/shutdown
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
     try:
         if WEBHOOK_URL:
-            # Создаем aiohttp приложение
-            app = web.Application()
+            from .handlers.payments import setup_payment_webhooks
+
+            app = web.Application(middlewares=[http_metrics_middleware])
+            app.router.add_get('/metrics', metrics_handler)
 
             # Регистрируем обработчики вебхуков платежей
             setup_payment_webhooks(app, bot)
 
-            # Регистрируем основной вебхук бота
-            SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path="/webhook")
+            # Регистрируем основной вебхук бота: либо обработка на месте, либо очередь для bot.worker
+            if UPDATE_WORKERS > 0:
+                setup_update_receiver(app, path="/webhook", secret=WEBHOOK_SECRET)
+            else:
+                SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None).register(app, path="/webhook")
 
-            # Настраиваем приложение
+            # dp.startup/dp.shutdown вызываются вместе с запуском/остановкой приложения
             setup_application(app, dp, bot=bot)
 
-            # Запускаем веб-сервер
-            global runner, site
             runner = web.AppRunner(app)
             await runner.setup()
-            site = web.TCPSite(runner, '0.0.0.0', 8080)
-            await site.start()
+            with lifecycle.phase("server"):
+                site = web.TCPSite(runner, '0.0.0.0', 8080)
+                await site.start()
             logger.info(f"🌐 Webhook server started on http://0.0.0.0:8080")
-            logger.info(f"🔗 Webhook URL: {WEBHOOK_URL}/webhook")
+            lifecycle.report()
 
-            # Бот будет работать до прерывания
-            while True:
-                await asyncio.sleep(3600)  # Спим 1 час, пока работает вебхук
+            # Работаем до SIGTERM/SIGINT
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+            await stop.wait()
 
         else:
             # Запуск в режиме long polling
+            start_http_server(METRICS_PORT)
+            logger.info(f"📈 Metrics exposed on http://0.0.0.0:{METRICS_PORT}/metrics")
+            dp.startup.register(lifecycle.report)
             logger.info("📡 Starting bot in polling mode...")
             await dp.start_polling(bot)
 
-    except KeyboardInterrupt:
-        logger.info("🛑 Bot stopped by user")
     except Exception as e:
         logger.error(f"❌ Bot crashed: {e}")
         raise
     finally:
-        await on_shutdown(bot)
+        await lifecycle.shutdown()
 
 
 if __name__ == '__main__':
     try:
         asyncio.run(main())
     except Exception as e:
-        logger.critical(f"💥 Fatal error: {e}")
\ No newline at end of file
+        logger.critical(f"💥 Fatal error: {e}")
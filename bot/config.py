@@ -13,9 +13,24 @@ DB_NAME = os.getenv("DB_NAME", "fpv_bot")
 DB_USER = os.getenv("DB_USER", "fpv_user")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # X-Telegram-Bot-Api-Secret-Token
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "0"))  # >0: вебхук только ставит апдейты в очередь для bot.worker
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))  # секунд на дообработку апдейтов и outbox при остановке
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))  # апдейтов разных чатов одновременно на процесс
+API_KEY = os.getenv("API_KEY", "")  # ключ подписи cookie-сессий веб-админки
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "")  # пароль веб-админки (пусто = вход закрыт)
+TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")  # чат для алертов /api/alert
 SCHEDULE_URL = os.getenv("SCHEDULE_URL", "https://example.com/schedule")
 SENTRY_DSN = os.getenv("SENTRY_DSN", "")
+SENTRY_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "0.05"))  # доля апдейтов с трассировкой
+SENTRY_PROFILES_SAMPLE_RATE = float(os.getenv("SENTRY_PROFILES_SAMPLE_RATE", "0"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))  # порог лога медленных запросов
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))  # доля медленных чтений с EXPLAIN ANALYZE
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8080"))  # /metrics в режиме polling
 TIMEZONE = os.getenv("TIMEZONE", "Europe/Moscow")
+I18N_CACHE_PATH = os.getenv("I18N_CACHE_PATH", "")  # JSON-кэш скомпилированных локалей (пусто = выкл.)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))  # токенов в секунду на пользователя (антифлуд)
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "10"))  # запас токенов на серию быстрых нажатий
 
 YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID", "")
 YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY", "")
@@ -1,8 +1,19 @@
+import sys
+import hmac
+import json
+import time
 import asyncpg
 import pytz
 from typing import Optional, List, Dict, Any, Tuple
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from ..config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+from decimal import Decimal
+from ..config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD, TIMEZONE, ADMIN_ID, TELEGRAM_CHAT_ID
+from ..utils.metrics import bind_pool_metrics
+from ..utils.payment_refunds import can_refund_automatically
+from ..utils.twofa import TWOFA_TTL_MINUTES, TWOFA_MAX_ATTEMPTS, generate_2fa_code, hash_2fa_code
+from .statements import PreparedConnection, prepare_statements, run_prepared
+from .tracing import run_query, run_statement, traced_transaction
 
 # Глобальные константы (можно вынести в config, если нужно)
 TRACK_TYPES = {
@@ -21,10 +32,27 @@ VTX_BANDS = {
     "E": [5705, 5685, 5665, 5645, 5885, 5905, 5925, 5945]
 }
 
+# Через сколько дней после даты тренировка с записями уходит в архив.
+# Больше окна истории календарных лент (30 дней), чтобы ленты читали только горячие таблицы
+ARCHIVE_AFTER_DAYS = 35
+
+# Справочник площадок для клавиатур и подсказок: меняется редко, перечитывается не чаще раза в минуту
+LOCATIONS_CACHE_SECONDS = 60
+# Outbox уведомлений: попыток доставки и сколько взятое уведомление скрыто от других процессов
+NOTIFY_MAX_ATTEMPTS = 5
+NOTIFY_LEASE_SECONDS = 120
+# Куда слать алерты, требующие рук организатора (ручной возврат): чат алертов, иначе главный админ
+ALERT_CHAT_ID = int(TELEGRAM_CHAT_ID) if TELEGRAM_CHAT_ID.lstrip('-').isdigit() else ADMIN_ID
+# Очередь возвратов у провайдеров: попыток при ошибках и время аренды взятой задачи
+REFUND_MAX_ATTEMPTS = 8
+REFUND_LEASE_SECONDS = 300
+# Аренда апдейта очереди вебхука: столько он скрыт от других обработчиков, если процесс упал
+UPDATE_LEASE_SECONDS = 300
+
 _pool = None
 
 
-async def init_db_pool():
+async def init_db_pool(max_size: int = 20):
     """Инициализация пула соединений к PostgreSQL"""
     global _pool
     _pool = await asyncpg.create_pool(
@@ -34,9 +62,19 @@ async def init_db_pool():
         user=DB_USER,
         password=DB_PASSWORD,
         min_size=5,
-        max_size=20,
-        command_timeout=60
+        max_size=max_size,
+        command_timeout=60,
+        connection_class=PreparedConnection,
+        init=_init_connection
     )
+    bind_pool_metrics(_pool)
+
+
+async def _init_connection(conn: PreparedConnection):
+    """JSON/JSONB ↔ dict/list (managed_locations, details аудита), затем реестр выражений"""
+    for typename in ('json', 'jsonb'):
+        await conn.set_type_codec(typename, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+    await prepare_statements(conn)
 
 
 async def close_db_pool():
@@ -44,45 +82,107 @@ async def close_db_pool():
     global _pool
     if _pool:
         await _pool.close()
+        _pool = None
 
 
 # Вспомогательные функции для выполнения запросов
-async def fetch(query: str, *args) -> List[Dict[str, Any]]:
-    async with _pool.acquire() as conn:
-        return await conn.fetch(query, *args)
+def _query_name(depth: int = 2) -> str:
+    """Имя функции, из которой пришёл запрос (get_used_channels, my_registrations, ...) — метка метрик"""
+    return sys._getframe(depth).f_code.co_name
+
+
+@asynccontextmanager
+async def transaction(name: Optional[str] = None):
+    """Соединение из пула с открытой транзакцией"""
+    # 0 — _query_name, 1 — этот генератор, 2 — __aenter__, 3 — вызывающая функция
+    name = name or f"tx:{_query_name(3)}"
+    async with traced_transaction(_pool, name) as conn:
+        yield conn
+
 
+# name= переопределяет метку запроса, по умолчанию — имя вызывающей функции
+async def fetch(query: str, *args, name: Optional[str] = None) -> List[Dict[str, Any]]:
+    return await run_query(_pool, 'fetch', name or _query_name(), query, args)
 
-async def fetchrow(query: str, *args) -> Optional[Dict[str, Any]]:
-    async with _pool.acquire() as conn:
-        return await conn.fetchrow(query, *args)
 
+async def fetchrow(query: str, *args, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    return await run_query(_pool, 'fetchrow', name or _query_name(), query, args)
 
-async def execute(query: str, *args) -> str:
-    async with _pool.acquire() as conn:
-        return await conn.execute(query, *args)
+
+async def fetchval(query: str, *args, name: Optional[str] = None) -> Any:
+    return await run_query(_pool, 'fetchval', name or _query_name(), query, args)
+
+
+async def execute(query: str, *args, name: Optional[str] = None) -> str:
+    return await run_query(_pool, 'execute', name or _query_name(), query, args)
+
+
+async def _prepared(conn, method: str, name: str, *args) -> Any:
+    """Выражение из реестра statements: на переданном соединении (в транзакции) или через пул"""
+    if conn is not None:
+        return await run_prepared(conn, name, method, args)
+    return await run_statement(_pool, method, name, args)
 
 
 # Основные функции логики бота
 
+def local_today() -> str:
+    """Сегодняшняя дата в часовом поясе площадок (YYYY-MM-DD) — граница предстоящих тренировок"""
+    return datetime.now(pytz.timezone(TIMEZONE)).date().isoformat()
+
+
+def archive_cutoff() -> str:
+    """Тренировки с датой раньше этой лежат (или скоро окажутся) в архиве"""
+    return (datetime.now(pytz.timezone(TIMEZONE)).date() - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+
+
+def history_tables(date_from: Optional[str]) -> Tuple[str, str]:
+    """
+    Источники (тренировки, записи) для отчёта с периодом от date_from:
+    архив подключается, только если период в него заходит (или начало не задано).
+    """
+    if date_from and date_from >= archive_cutoff():
+        return "trainings", "registrations"
+    return "trainings_all", "registrations_all"
+
+
 async def get_all_trainings() -> List[Dict[str, Any]]:
-    """Получить все тренировки"""
-    return await fetch('''
-        SELECT id, city, location, date, time, track_type, current_pilots, max_pilots
-        FROM trainings
-        ORDER BY date, time
-    ''')
+    """Получить все предстоящие тренировки"""
+    return await search_trainings()
+
+
+async def search_trainings(city: Optional[str] = None, date: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Предстоящие тренировки по подстроке города и/или точной дате (None — без фильтра)"""
+    return await _prepared(None, 'fetch', 'schedule_list', f"%{city}%" if city else None, date, local_today())
 
 
-async def get_used_channels(training_id: int) -> List[Tuple[str, int]]:
+async def get_used_channels(training_id: int, conn=None) -> List[Tuple[str, int]]:
     """Получить занятые каналы на тренировке"""
-    rows = await fetch('''
-        SELECT vtx_band, vtx_channel
-        FROM registrations
-        WHERE training_id = $1
-    ''', training_id)
+    rows = await _prepared(conn, 'fetch', 'used_channels', training_id)
     return [(row['vtx_band'], row['vtx_channel']) for row in rows]
 
 
+_BAND_ORDER = list(VTX_BANDS)
+
+
+async def get_channel_bitmap(training_id: int) -> int:
+    """
+    Занятость каналов одним числом: бит (индекс band в VTX_BANDS) * 8 + (канал - 1).
+    Одна агрегирующая строка вместо списка записей — удобно для ключей кэша клавиатур.
+    """
+    return await _prepared(None, 'fetchval', 'channel_bitmap', training_id, _BAND_ORDER)
+
+
+async def insert_registration(conn, training_id: int, user_id: int, band: str, channel: int) -> int:
+    """Вставить регистрацию внутри транзакции вызывающего; возвращает id"""
+    return await _prepared(conn, 'fetchval', 'registration_insert', training_id, user_id, band, channel)
+
+
+def band_occupancy(bitmap: int, band: str) -> int:
+    """8-битная маска занятых каналов одного band из общей битовой карты"""
+    return (bitmap >> (list(VTX_BANDS).index(band) * 8)) & 0xFF
+
+
 def suggest_free_channel(used: List[Tuple[str, int]]) -> Tuple[Optional[str], Optional[int], Optional[int]]:
     """Предложить свободный канал (синхронная логика)"""
     used_set = set(used)
@@ -100,80 +200,765 @@ async def register_pilot_with_channel(
     full_name: str,
     preferred_band: str = None,
     preferred_channel: int = None
-) -> Tuple[bool, str, Optional[int]]:
+) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
     """
     Регистрация пилота с автоматическим или ручным выбором канала.
-    Возвращает: (успех, сообщение, reg_id)
+    Строка тренировки блокируется на время транзакции, поэтому параллельные
+    записи и продвижение из листа ожидания не выдадут один канал дважды.
+    Возвращает: (успех, код, данные). Код — ключ текста в группе registration локалей:
+    registered (данные: reg_id, band, channel, freq), not_found, already_registered,
+    no_seats, channel_taken (данные: band, channel), bad_channel, no_channels
+    """
+    async with transaction() as conn:
+        # Проверка: есть ли тренировка и свободные места?
+        training = await conn.fetchrow(
+            'SELECT current_pilots, max_pilots FROM trainings WHERE id = $1 FOR UPDATE',
+            training_id
+        )
+        if not training:
+            return False, 'not_found', None
+
+        # Проверка: уже записан?
+        existing = await conn.fetchrow(
+            'SELECT id FROM registrations WHERE training_id = $1 AND user_id = $2',
+            training_id, user_id
+        )
+        if existing:
+            return False, 'already_registered', None
+
+        if training['current_pilots'] >= training['max_pilots']:
+            return False, 'no_seats', None
+
+        used = await get_used_channels(training_id, conn)
+        band, channel, freq = None, None, None
+
+        # Если указаны предпочтения
+        if preferred_band and preferred_channel:
+            if preferred_band in VTX_BANDS and 1 <= preferred_channel <= 8:
+                if (preferred_band, preferred_channel) not in used:
+                    band, channel = preferred_band, preferred_channel
+                    freq = VTX_BANDS[preferred_band][channel - 1]
+                else:
+                    return False, 'channel_taken', {'band': preferred_band, 'channel': preferred_channel}
+            else:
+                return False, 'bad_channel', None
+
+        # Если не указаны — подбираем автоматически
+        if not band:
+            band, channel, freq = suggest_free_channel(used)
+            if not band:
+                return False, 'no_channels', None
+
+        # Вставляем регистрацию (счётчик пилотов обновит триггер)
+        reg_id = await insert_registration(conn, training_id, user_id, band, channel)
+
+        # Записался сам — из листа ожидания больше не нужен
+        await conn.execute(
+            'DELETE FROM waitlist WHERE training_id = $1 AND user_id = $2',
+            training_id, user_id
+        )
+
+    return True, 'registered', {'reg_id': reg_id, 'band': band, 'channel': channel, 'freq': freq}
+
+
+async def unregister_pilot(training_id: int, user_id: int) -> Tuple[bool, str]:
     """
-    # Проверка: уже записан?
-    existing = await fetchrow(
-        'SELECT id FROM registrations WHERE training_id = $1 AND user_id = $2',
+    Отмена записи пилота (освободившееся место сразу уходит листу ожидания).
+    Возвращает (успех, код); код — ключ группы unregister локалей: canceled, not_registered
+    """
+    async with transaction() as conn:
+        result = await conn.execute(
+            'DELETE FROM registrations WHERE training_id = $1 AND user_id = $2',
+            training_id, user_id
+        )
+        if "DELETE 0" in result:
+            return False, 'not_registered'
+        await promote_from_waitlist(conn, training_id)
+    return True, 'canceled'
+
+
+async def delete_registration(reg_id: int, refund: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Удалить регистрацию по id и продвинуть лист ожидания. None — записи уже нет.
+    refund — в той же транзакции оформить заявку на возврат: в ответе 'payment' — платёж из журнала
+    (с задачей в refund_jobs) или None. У оплаченной записи без платежа в журнале (оплата до появления
+    журнала, отметка без суммы) возвращать нечего автоматически — организатору уходит алерт в outbox.
+    """
+    async with transaction() as conn:
+        reg = await conn.fetchrow(
+            'SELECT training_id, user_id, paid, payment_id FROM registrations WHERE id = $1 FOR UPDATE', reg_id
+        )
+        if reg is None:
+            return None
+        payment = None
+        if refund:
+            payment = await request_refund(conn, reg_id, {'source': 'user'})
+            if payment is None and reg['paid']:
+                await enqueue_notification(conn, ALERT_CHAT_ID, (
+                    f"⚠️ Нужен ручной возврат: пилот {reg['user_id']} отменил оплаченную запись #{reg_id} "
+                    f"(тренировка #{reg['training_id']}), платёж {reg['payment_id'] or '—'} "
+                    f"не найден в журнале платежей."
+                ))
+        await conn.execute('DELETE FROM registrations WHERE id = $1', reg_id)
+        await promote_from_waitlist(conn, reg['training_id'])
+    return {'training_id': reg['training_id'], 'paid': bool(reg['paid']), 'payment': payment}
+
+
+# Лист ожидания
+
+async def join_waitlist(training_id: int, user_id: int) -> Tuple[bool, str, Optional[int]]:
+    """
+    Встать в лист ожидания. Возвращает (успех, код, позиция в очереди);
+    код — ключ группы waitlist локалей: joined, not_found, already_registered, has_seats
+    """
+    async with transaction() as conn:
+        training = await conn.fetchrow(
+            'SELECT current_pilots, max_pilots FROM trainings WHERE id = $1 FOR UPDATE',
+            training_id
+        )
+        if not training:
+            return False, 'not_found', None
+        registered = await conn.fetchval(
+            'SELECT 1 FROM registrations WHERE training_id = $1 AND user_id = $2',
+            training_id, user_id
+        )
+        if registered:
+            return False, 'already_registered', None
+        if training['current_pilots'] < training['max_pilots']:
+            return False, 'has_seats', None
+
+        await conn.execute('''
+            INSERT INTO waitlist (training_id, user_id)
+            VALUES ($1, $2)
+            ON CONFLICT (training_id, user_id) DO NOTHING
+        ''', training_id, user_id)
+        position = await conn.fetchval('''
+            SELECT COUNT(*) FROM waitlist
+            WHERE training_id = $1
+              AND id <= (SELECT id FROM waitlist WHERE training_id = $1 AND user_id = $2)
+        ''', training_id, user_id)
+
+    return True, 'joined', position
+
+
+async def leave_waitlist(training_id: int, user_id: int) -> bool:
+    """Покинуть лист ожидания"""
+    result = await execute(
+        'DELETE FROM waitlist WHERE training_id = $1 AND user_id = $2',
         training_id, user_id
     )
-    if existing:
-        return False, "Вы уже записаны на эту тренировку.", None
+    return result != "DELETE 0"
 
-    # Проверка: есть ли тренировка и свободные места?
-    training = await fetchrow(
-        'SELECT current_pilots, max_pilots FROM trainings WHERE id = $1',
-        training_id
-    )
+
+async def promote_from_waitlist(conn, training_id: int) -> List[int]:
+    """
+    Перевести пилотов из листа ожидания на свободные места (FIFO).
+    Выполняется внутри транзакции вызывающего кода: запись, выбор канала
+    и уведомление фиксируются атомарно. Возвращает user_id продвинутых.
+    """
+    training = await conn.fetchrow('''
+        SELECT location, date, time, current_pilots, max_pilots
+        FROM trainings WHERE id = $1 FOR UPDATE
+    ''', training_id)
     if not training:
-        return False, "Тренировка не найдена.", None
-    if training['current_pilots'] >= training['max_pilots']:
-        return False, "Нет свободных мест.", None
-
-    band, channel, freq = None, None, None
-
-    # Если указаны предпочтения
-    if preferred_band and preferred_channel:
-        if preferred_band in VTX_BANDS and 1 <= preferred_channel <= 8:
-            used = await get_used_channels(training_id)
-            if (preferred_band, preferred_channel) not in used:
-                band, channel = preferred_band, preferred_channel
-                freq = VTX_BANDS[preferred_band][channel - 1]
-            else:
-                return False, f"Канал {preferred_band}{preferred_channel} уже занят. Выберите другой.", None
-        else:
-            return False, "Неверный формат канала. Используйте: R3, F5, E1.", None
+        return []
+
+    promoted = []
+    free_seats = training['max_pilots'] - training['current_pilots']
+    used = await get_used_channels(training_id, conn) if free_seats > 0 else []
 
-    # Если не указаны — подбираем автоматически
-    if not band:
-        used = await get_used_channels(training_id)
+    while free_seats > 0:
         band, channel, freq = suggest_free_channel(used)
         if not band:
-            return False, "Нет свободных каналов для записи.", None
+            # Каналы кончились раньше мест — очередь не трогаем
+            break
+
+        entry = await conn.fetchrow('''
+            DELETE FROM waitlist
+            WHERE id = (
+                SELECT id FROM waitlist
+                WHERE training_id = $1
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING user_id
+        ''', training_id)
+        if not entry:
+            break
+
+        inserted = await conn.fetchval('''
+            INSERT INTO registrations (training_id, user_id, vtx_band, vtx_channel)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (training_id, user_id) DO NOTHING
+            RETURNING id
+        ''', training_id, entry['user_id'], band, channel)
+        if inserted is None:
+            continue
+
+        used.append((band, channel))
+        free_seats -= 1
+        promoted.append(entry['user_id'])
+        await enqueue_message(conn, entry['user_id'], ('notifications-promoted', {
+            'location': training['location'], 'date': training['date'], 'time': training['time'],
+            'band': band, 'channel': channel, 'freq': freq,
+        }))
+
+    return promoted
+
+
+# Очередь уведомлений (transactional outbox)
+# Пилотам в очередь пишется не текст, а сообщение — строки (ключ локали, параметры): бот переводит
+# его при отправке на язык получателя. Готовый текст — для алертов организатору (у чата нет языка).
+
+OutboxMessage = List[Tuple[str, Dict[str, Any]]]
+
+
+async def enqueue_notification(conn, user_id: int, text: str):
+    """Поставить уведомление с готовым текстом в очередь в рамках текущей транзакции"""
+    await conn.execute(
+        'INSERT INTO notifications_outbox (user_id, text) VALUES ($1, $2)',
+        user_id, text
+    )
 
-    # Вставляем регистрацию
-    row = await fetchrow('''
-        INSERT INTO registrations (training_id, user_id, vtx_band, vtx_channel)
-        VALUES ($1, $2, $3, $4)
+
+async def enqueue_message(conn, user_id: int, *lines: Tuple[str, Dict[str, Any]]):
+    """Поставить в очередь сообщение из строк (ключ локали, параметры) в рамках текущей транзакции"""
+    await conn.execute(
+        'INSERT INTO notifications_outbox (user_id, message) VALUES ($1, $2)',
+        user_id, [list(line) for line in lines]
+    )
+
+
+async def enqueue_messages(conn, items: List[Tuple[int, OutboxMessage]]) -> int:
+    """Пачка сообщений одним INSERT в рамках текущей транзакции: [(user_id, [(ключ, параметры), ...])]"""
+    if not items:
+        return 0
+    await conn.execute('''
+        INSERT INTO notifications_outbox (user_id, message)
+        SELECT u, m::jsonb FROM unnest($1::bigint[], $2::text[]) AS t(u, m)
+    ''', [user_id for user_id, _ in items], [json.dumps([list(line) for line in message]) for _, message in items])
+    return len(items)
+
+
+async def enqueue_notifications(conn, items: List[Tuple[int, str]]) -> int:
+    """Пачка уведомлений одним INSERT в рамках текущей транзакции: [(user_id, текст)]"""
+    if not items:
+        return 0
+    await conn.execute('''
+        INSERT INTO notifications_outbox (user_id, text)
+        SELECT * FROM unnest($1::bigint[], $2::text[])
+    ''', [user_id for user_id, _ in items], [text for _, text in items])
+    return len(items)
+
+
+async def claim_pending_notifications(limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Взять пачку уведомлений к отправке (безопасно при нескольких процессах). Взятые скрыты на
+    NOTIFY_LEASE_SECONDS: если процесс упадёт до complete/retry, их возьмут снова (at-least-once).
+    """
+    return await fetch('''
+        WITH claimed AS (
+            UPDATE notifications_outbox
+            SET attempts = attempts + 1, next_attempt_at = NOW() + make_interval(secs => $2)
+            WHERE id IN (
+                SELECT id FROM notifications_outbox
+                WHERE sent_at IS NULL AND failed_at IS NULL AND next_attempt_at <= NOW()
+                ORDER BY next_attempt_at, id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id, text, message, attempts
+        )
+        SELECT c.*, uc.lang
+        FROM claimed c
+        LEFT JOIN user_consent uc ON uc.user_id = c.user_id
+    ''', limit, NOTIFY_LEASE_SECONDS)
+
+
+async def complete_notifications(ids: List[int]):
+    """Отметить пачку отправленной одним запросом"""
+    if ids:
+        await execute('UPDATE notifications_outbox SET sent_at = NOW() WHERE id = ANY($1::bigint[])', ids)
+
+
+async def retry_notifications(failures: List[Tuple[int, Optional[float], str]]):
+    """
+    Неудачные отправки: [(id, задержка в секундах, ошибка)]. Задержка None — повтор бесполезен;
+    после NOTIFY_MAX_ATTEMPTS попыток уведомление тоже снимается с очереди (failed_at).
+    """
+    if not failures:
+        return
+    await execute('''
+        UPDATE notifications_outbox o
+        SET next_attempt_at = NOW() + make_interval(secs => COALESCE(f.delay, 0)),
+            last_error = f.error,
+            failed_at = CASE WHEN f.delay IS NULL OR o.attempts >= $4 THEN NOW() END
+        FROM unnest($1::bigint[], $2::float8[], $3::text[]) AS f(id, delay, error)
+        WHERE o.id = f.id
+    ''', [f[0] for f in failures], [f[1] for f in failures], [f[2][:500] for f in failures], NOTIFY_MAX_ATTEMPTS)
+
+
+# Журнал платежей
+
+# Статусы, деньги по которым получены (выручка = amount - refunded_amount)
+PAYMENT_SETTLED_STATUSES = ('succeeded', 'refund_requested', 'partially_refunded', 'refunded')
+
+
+async def record_payment(conn, provider: str, provider_payment_id: str, registration_id: int,
+                         amount: Decimal, currency: str = 'RUB', status: str = 'succeeded',
+                         details: dict = None) -> Optional[int]:
+    """
+    Записать платёж в журнал в рамках текущей транзакции (идемпотентно по provider + provider_payment_id).
+    Повторный вебхук ничего не меняет; pending переходит в succeeded/canceled с событием в payment_events.
+    None — записи registration_id нет.
+    """
+    prev = await conn.fetchrow(
+        'SELECT id, status FROM payments WHERE provider = $1 AND provider_payment_id = $2 FOR UPDATE',
+        provider, provider_payment_id
+    )
+    if prev is None:
+        payment_id = await conn.fetchval('''
+            INSERT INTO payments (provider, provider_payment_id, registration_id, training_id, user_id,
+                                  amount, currency, status, city, location, track_type, training_date)
+            SELECT $1, $2, r.id, t.id, r.user_id, $4, $5, $6, t.city, t.location, t.track_type, stats_day(t.date)
+            FROM registrations r
+            JOIN trainings t ON t.id = r.training_id
+            WHERE r.id = $3
+            ON CONFLICT (provider, provider_payment_id) DO NOTHING
+            RETURNING id
+        ''', provider, provider_payment_id, registration_id, amount, currency, status)
+        if payment_id is None:
+            return None
+    elif prev['status'] == status or prev['status'] != 'pending':
+        # Повтор или платёж уже дальше по жизненному циклу (например, возвращён)
+        return prev['id']
+    else:
+        payment_id = prev['id']
+        await conn.execute('''
+            UPDATE payments
+            SET status = $2, amount = $3, currency = $4, registration_id = $5, updated_at = NOW()
+            WHERE id = $1
+        ''', payment_id, status, amount, currency, registration_id)
+
+    await conn.execute(
+        'INSERT INTO payment_events (payment_id, status, amount, details) VALUES ($1, $2, $3, $4)',
+        payment_id, status, amount, details or {}
+    )
+    return payment_id
+
+
+async def mark_registration_paid(registration_id: int, provider: str, provider_payment_id: str,
+                                 amount: Decimal, currency: str = 'RUB', details: dict = None) -> Optional[int]:
+    """Отметить запись оплаченной и записать платёж в журнал одной транзакцией"""
+    async with transaction(name="tx:mark_registration_paid") as conn:
+        await conn.execute('''
+            UPDATE registrations
+            SET paid = 1, payment_id = $1, payment_date = COALESCE(payment_date, NOW())
+            WHERE id = $2
+        ''', provider_payment_id, registration_id)
+        return await record_payment(
+            conn, provider, provider_payment_id, registration_id, amount, currency, 'succeeded', details
+        )
+
+
+async def request_refund(conn, registration_id: int, details: dict = None) -> Optional[Dict[str, Any]]:
+    """
+    Заявка на возврат по оплате записи (в транзакции отмены, до удаления записи) и задача
+    в refund_jobs. Сумма остаётся в выручке, пока провайдер не подтвердит возврат (record_refund / сверка).
+    """
+    payment = await conn.fetchrow('''
+        UPDATE payments
+        SET status = 'refund_requested', updated_at = NOW()
+        WHERE registration_id = $1 AND status IN ('succeeded', 'partially_refunded')
+        RETURNING id, provider, provider_payment_id, amount, refunded_amount, currency
+    ''', registration_id)
+    if payment:
+        await conn.execute(
+            'INSERT INTO payment_events (payment_id, status, amount, details) VALUES ($1, $2, $3, $4)',
+            payment['id'], 'refund_requested', payment['amount'] - payment['refunded_amount'], details or {}
+        )
+        await enqueue_refund_jobs(conn, [payment['id']], details)
+    return dict(payment) if payment else None
+
+
+async def record_refund(conn, provider: str, provider_payment_id: str, amount: Optional[Decimal] = None,
+                        details: dict = None) -> Optional[str]:
+    """Провайдер вернул деньги: amount=None — весь остаток. Возвращает новый статус или None, если платежа нет"""
+    payment = await conn.fetchrow('''
+        SELECT id, amount, refunded_amount FROM payments
+        WHERE provider = $1 AND provider_payment_id = $2
+        FOR UPDATE
+    ''', provider, provider_payment_id)
+    if payment is None:
+        return None
+    remaining = payment['amount'] - payment['refunded_amount']
+    refund = remaining if amount is None else min(amount, remaining)
+    status = 'refunded' if refund >= remaining else 'partially_refunded'
+    await conn.execute('''
+        UPDATE payments
+        SET status = $2, refunded_amount = refunded_amount + $3, updated_at = NOW()
+        WHERE id = $1
+    ''', payment['id'], status, refund)
+    await conn.execute(
+        'INSERT INTO payment_events (payment_id, status, amount, details) VALUES ($1, $2, $3, $4)',
+        payment['id'], status, refund, details or {}
+    )
+    return status
+
+
+# Очередь возвратов у провайдеров (refund_jobs)
+
+async def enqueue_refund_jobs(conn, payment_ids: List[int], details: dict = None) -> int:
+    """
+    Задачи на возврат остатка платежей в рамках текущей транзакции — до удаления записи
+    и тренировки: канал, дата и время для чека копируются в details. Повтор не создаёт вторую задачу.
+    """
+    if not payment_ids:
+        return 0
+    rows = await conn.fetch('''
+        INSERT INTO refund_jobs (payment_id, amount, details)
+        SELECT p.id, p.amount - p.refunded_amount, $2::jsonb || jsonb_strip_nulls(jsonb_build_object(
+            'channel', r.vtx_band || r.vtx_channel, 'date', t.date, 'time', t.time
+        ))
+        FROM payments p
+        LEFT JOIN registrations r ON r.id = p.registration_id
+        LEFT JOIN trainings t ON t.id = p.training_id
+        WHERE p.id = ANY($1::bigint[]) AND p.amount > p.refunded_amount
+        ON CONFLICT DO NOTHING
         RETURNING id
-    ''', training_id, user_id, band, channel)
+    ''', payment_ids, details or {})
+    return len(rows)
+
 
-    # Обновляем счётчик пилотов
-    await execute(
-        'UPDATE trainings SET current_pilots = current_pilots + 1 WHERE id = $1',
-        training_id
+async def claim_refund_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Взять пачку возвратов к отправке провайдеру (безопасно при нескольких процессах). Взятые скрыты
+    на REFUND_LEASE_SECONDS: если процесс упадёт, задачу возьмут снова с тем же idempotency_key.
+    """
+    return await fetch('''
+        UPDATE refund_jobs j
+        SET attempts = j.attempts + 1, next_attempt_at = NOW() + make_interval(secs => $2)
+        FROM payments p
+        WHERE p.id = j.payment_id AND j.id IN (
+            SELECT id FROM refund_jobs
+            WHERE status = 'pending' AND next_attempt_at <= NOW()
+            ORDER BY next_attempt_at, id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING j.id, j.payment_id, j.amount, j.idempotency_key, j.provider_refund_id, j.attempts, j.details,
+                  p.provider, p.provider_payment_id, p.currency, p.user_id, p.registration_id, p.location,
+                  (SELECT COALESCE(u.nickname, u.username) FROM user_consent u WHERE u.user_id = p.user_id)
+                      AS user_name
+    ''', limit, REFUND_LEASE_SECONDS)
+
+
+async def settle_refund_jobs(settled: List[Tuple[int, str]]) -> List[int]:
+    """
+    Провайдер провёл возвраты: [(id задачи, id возврата у провайдера)]. Задачи закрываются и возвраты
+    пишутся в журнал одной транзакцией; уже закрытые (повтор после падения) пропускаются.
+    Возвращает id закрытых сейчас задач.
+    """
+    if not settled:
+        return []
+    async with transaction(name="tx:settle_refund_jobs") as conn:
+        jobs = await conn.fetch('''
+            UPDATE refund_jobs j
+            SET status = 'succeeded', provider_refund_id = f.refund_id, finished_at = NOW(), last_error = NULL
+            FROM unnest($1::bigint[], $2::text[]) AS f(id, refund_id), payments p
+            WHERE j.id = f.id AND j.status = 'pending' AND p.id = j.payment_id
+            RETURNING j.id, j.amount, f.refund_id, p.provider, p.provider_payment_id
+        ''', [job_id for job_id, _ in settled], [refund_id for _, refund_id in settled])
+        for job in jobs:
+            await record_refund(conn, job['provider'], job['provider_payment_id'], job['amount'], {
+                'source': 'refund_job', 'job_id': job['id'], 'refund_id': job['refund_id'],
+            })
+    return [job['id'] for job in jobs]
+
+
+async def reschedule_refund_jobs(jobs: List[Tuple[int, Optional[float], Optional[str], Optional[str]]]) -> List[int]:
+    """
+    Неудачные и ещё не проведённые возвраты: [(id, задержка в секундах, ошибка, id возврата у провайдера)].
+    Задержка None — повтор бесполезен; после REFUND_MAX_ATTEMPTS ошибок задача тоже снимается (failed),
+    а ожидание проведения (ошибки нет) попытки не ограничивает. На каждую снятую задачу в той же
+    транзакции — алерт организатору о ручном возврате. Возвращает id снятых задач.
+    """
+    if not jobs:
+        return []
+    async with transaction(name="tx:reschedule_refund_jobs") as conn:
+        rows = await conn.fetch('''
+            UPDATE refund_jobs j
+            SET next_attempt_at = NOW() + make_interval(secs => COALESCE(f.delay, 0)),
+                provider_refund_id = COALESCE(f.refund_id, j.provider_refund_id),
+                last_error = COALESCE(f.error, j.last_error),
+                status = CASE WHEN f.delay IS NULL OR (f.error IS NOT NULL AND j.attempts >= $5)
+                              THEN 'failed' ELSE 'pending' END,
+                finished_at = CASE WHEN f.delay IS NULL OR (f.error IS NOT NULL AND j.attempts >= $5)
+                                   THEN NOW() END
+            FROM unnest($1::bigint[], $2::float8[], $3::text[], $4::text[]) AS f(id, delay, error, refund_id),
+                 payments p
+            WHERE j.id = f.id AND j.status = 'pending' AND p.id = j.payment_id
+            RETURNING j.id, j.status, j.payment_id, j.amount, j.last_error,
+                      p.provider, p.provider_payment_id, p.currency, p.user_id
+        ''', [j[0] for j in jobs], [j[1] for j in jobs], [j[2][:500] if j[2] else None for j in jobs],
+            [j[3] for j in jobs], REFUND_MAX_ATTEMPTS)
+        failed = [r for r in rows if r['status'] == 'failed']
+        await enqueue_notifications(conn, [(ALERT_CHAT_ID, (
+            f"⚠️ Нужен ручной возврат: {r['amount']} {r['currency']} пилоту {r['user_id']}, "
+            f"платёж #{r['payment_id']} ({r['provider']} {r['provider_payment_id']}).\n"
+            f"Причина: {r['last_error']}"
+        )) for r in failed])
+    return [r['id'] for r in failed]
+
+
+async def reconcile_payments(provider: str, export: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Сверка пачки выгрузки провайдера с журналом одним запросом.
+    export: provider_payment_id, status, amount, refunded_amount, currency.
+    Расхождения исправляются по данным провайдера (с событием source=reconcile), пропущенные
+    платежи по записям с тем же payment_id добавляются; неизвестные провайдерские id возвращаются.
+    Заявку на возврат не откатываем в succeeded: провайдер ещё не успел вернуть деньги.
+    """
+    row = await fetchrow('''
+        WITH export AS (
+            SELECT * FROM unnest($2::text[], $3::text[], $4::numeric[], $5::numeric[], $6::text[])
+                AS e(provider_payment_id, status, amount, refunded_amount, currency)
+        ),
+        changed AS (
+            UPDATE payments p
+            SET status = e.status, amount = e.amount, refunded_amount = e.refunded_amount,
+                currency = e.currency, updated_at = NOW()
+            FROM export e, payments old
+            WHERE p.provider = $1 AND p.provider_payment_id = e.provider_payment_id AND old.id = p.id
+              AND (p.status, p.amount, p.refunded_amount, p.currency)
+                  IS DISTINCT FROM (e.status, e.amount, e.refunded_amount, e.currency)
+              AND NOT (p.status = 'refund_requested' AND e.status = 'succeeded')
+            RETURNING p.id, p.status, p.amount, old.status AS previous_status, old.amount AS previous_amount
+        ),
+        added AS (
+            INSERT INTO payments (provider, provider_payment_id, registration_id, training_id, user_id,
+                                  amount, refunded_amount, currency, status,
+                                  city, location, track_type, training_date)
+            SELECT $1, e.provider_payment_id, r.id, t.id, r.user_id,
+                   e.amount, e.refunded_amount, e.currency, e.status,
+                   t.city, t.location, t.track_type, stats_day(t.date)
+            FROM export e
+            JOIN registrations_all r ON r.payment_id = e.provider_payment_id
+            JOIN trainings_all t ON t.id = r.training_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM payments p WHERE p.provider = $1 AND p.provider_payment_id = e.provider_payment_id
+            )
+            ON CONFLICT (provider, provider_payment_id) DO NOTHING
+            RETURNING id, status, amount
+        ),
+        events AS (
+            INSERT INTO payment_events (payment_id, status, amount, details)
+            SELECT id, status, amount, jsonb_build_object(
+                'source', 'reconcile', 'previous_status', previous_status, 'previous_amount', previous_amount
+            ) FROM changed
+            UNION ALL
+            SELECT id, status, amount, jsonb_build_object('source', 'reconcile', 'previous_status', NULL)
+            FROM added
+        )
+        SELECT
+            (SELECT COUNT(*) FROM changed) AS changed,
+            (SELECT COUNT(*) FROM added) AS added,
+            (SELECT COALESCE(array_agg(e.provider_payment_id), '{}') FROM export e
+             WHERE NOT EXISTS (SELECT 1 FROM payments p
+                               WHERE p.provider = $1 AND p.provider_payment_id = e.provider_payment_id)
+               AND NOT EXISTS (SELECT 1 FROM registrations_all r WHERE r.payment_id = e.provider_payment_id)
+            ) AS unknown
+    ''',
+        provider,
+        [p['provider_payment_id'] for p in export],
+        [p['status'] for p in export],
+        [p['amount'] for p in export],
+        [p['refunded_amount'] for p in export],
+        [p['currency'] for p in export],
+        name="reconcile_payments",
     )
+    return dict(row)
 
-    return True, f"Вы успешно записаны! Ваш канал: {band}{channel} ({freq} MHz)", row['id']
 
+# Очередь входящих апдейтов (вебхук → bot.worker)
 
-async def unregister_pilot(training_id: int, user_id: int) -> Tuple[bool, str]:
-    """Отмена записи пилота"""
+UPDATE_QUEUE_CHANNEL = 'update_queue'
+
+
+async def enqueue_update(update_id: int, chat_id: int, payload: str) -> bool:
+    """Положить апдейт в очередь и разбудить обработчиков; False — такой update_id уже был"""
+    notified = await fetchval('''
+        WITH ins AS (
+            INSERT INTO update_queue (update_id, chat_id, payload)
+            VALUES ($1, $2, $3::text::jsonb)
+            ON CONFLICT (update_id) DO NOTHING
+            RETURNING id
+        )
+        SELECT pg_notify($4, '') IS NOT NULL FROM ins
+    ''', update_id, chat_id, payload, UPDATE_QUEUE_CHANNEL)
+    return bool(notified)
+
+
+async def claim_update() -> Optional[Dict[str, Any]]:
+    """
+    Арендовать самый старый апдейт среди чатов, у которых нет более раннего необработанного.
+    Аренда фиксируется сразу, обработчик выполняется без открытой транзакции, после него
+    строку удаляет complete_update. Пока строка в очереди, следующие апдейты её чата не
+    выдаются; если процесс упал, по истечении аренды апдейт достаётся другому обработчику.
+    """
+    return await fetchrow('''
+        UPDATE update_queue SET locked_until = NOW() + make_interval(secs => $1)
+        WHERE id = (
+            SELECT q.id
+            FROM update_queue q
+            WHERE (q.locked_until IS NULL OR q.locked_until < NOW())
+              AND NOT EXISTS (
+                  SELECT 1 FROM update_queue p
+                  WHERE p.chat_id = q.chat_id AND p.id < q.id
+              )
+            ORDER BY q.id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, payload::text AS payload, created_at
+    ''', UPDATE_LEASE_SECONDS, name="claim_update")
+
+
+async def complete_update(queue_id: int):
+    """Апдейт обработан — убрать из очереди и открыть следующий апдейт его чата"""
+    await execute('DELETE FROM update_queue WHERE id = $1', queue_id, name="complete_update")
+
+
+async def listen(channel: str, callback):
+    """Подписаться на LISTEN channel; держит отдельное соединение из пула до unlisten"""
+    conn = await _pool.acquire()
+    await conn.add_listener(channel, callback)
+    return conn
+
+
+async def unlisten(conn, channel: str, callback):
+    await conn.remove_listener(channel, callback)
+    await _pool.release(conn)
+
+
+async def reconcile_pilot_counts() -> List[Dict[str, Any]]:
+    """
+    Сверить current_pilots с фактическим числом записей и исправить расхождения одним запросом.
+    Возвращает список исправленных тренировок: id, old_count, new_count.
+    """
+    return await fetch('''
+        WITH actual AS (
+            SELECT t.id, t.current_pilots AS old_count, COUNT(r.id)::int AS new_count
+            FROM trainings t
+            LEFT JOIN registrations r ON r.training_id = t.id
+            GROUP BY t.id
+        )
+        UPDATE trainings t
+        SET current_pilots = a.new_count
+        FROM actual a
+        WHERE t.id = a.id
+          AND t.current_pilots <> a.new_count
+          AND a.new_count <= t.max_pilots
+        RETURNING t.id, a.old_count, a.new_count
+    ''')
+
+
+async def get_overbooked_trainings() -> List[Dict[str, Any]]:
+    """Тренировки, где записей больше, чем max_pilots (счётчик нельзя исправить автоматически)"""
+    return await fetch('''
+        SELECT t.id, t.max_pilots, COUNT(r.id)::int AS actual
+        FROM trainings t
+        JOIN registrations r ON r.training_id = t.id
+        GROUP BY t.id
+        HAVING COUNT(r.id) > t.max_pilots
+    ''')
+
+
+async def prune_training_tombstones(retention_days: int) -> int:
+    """Удалить отметки об удалении старше срока хранения; клиентам с более старым токеном дельта ответит reset"""
     result = await execute(
-        'DELETE FROM registrations WHERE training_id = $1 AND user_id = $2',
-        training_id, user_id
+        "DELETE FROM training_tombstones WHERE deleted_at < NOW() - make_interval(days => $1)", retention_days
     )
-    if "DELETE 0" in result:
-        return False, "Вы не были записаны на эту тренировку."
+    return int(result.split()[-1])
 
-    await execute(
-        'UPDATE trainings SET current_pilots = current_pilots - 1 WHERE id = $1',
-        training_id
-    )
-    return True, "Ваша запись отменена."
+
+async def refresh_stats_rollup() -> int:
+    """
+    Пересчитать stats_daily для дней, отмеченных триггерами в stats_dirty_days.
+    Каждый день считается заново из trainings/registrations (вместе с архивом) и payments —
+    агрегат не расходится с данными.
+    Возвращает число пересчитанных дней.
+    """
+    async with transaction(name="tx:refresh_stats_rollup") as conn:
+        days = [r['day'] for r in await conn.fetch("DELETE FROM stats_dirty_days RETURNING day")]
+        if not days:
+            return 0
+        await conn.execute("DELETE FROM stats_daily WHERE day = ANY($1::date[])", days)
+        # Выручка — из журнала платежей по дате тренировки (нетто после возвратов)
+        await conn.execute('''
+            INSERT INTO stats_daily (day, city, location, track_type,
+                                     trainings, capacity, registrations, paid, revenue)
+            SELECT day, city, location, track_type,
+                   SUM(trainings), SUM(capacity), SUM(registrations), SUM(paid), SUM(revenue)
+            FROM (
+                SELECT stats_day(t.date) AS day, t.city, t.location, t.track_type,
+                       1 AS trainings, t.max_pilots AS capacity, r.registrations, r.paid, 0 AS revenue
+                FROM trainings_all t
+                CROSS JOIN LATERAL (
+                    SELECT COUNT(*) AS registrations, COUNT(*) FILTER (WHERE paid = 1) AS paid
+                    FROM registrations_all WHERE training_id = t.id
+                ) r
+                WHERE t.date = ANY($1::text[])
+                UNION ALL
+                SELECT training_date, city, location, track_type,
+                       0, 0, 0, 0, amount - refunded_amount
+                FROM payments
+                WHERE training_date = ANY($2::date[]) AND status = ANY($3::text[])
+                  AND city IS NOT NULL AND location IS NOT NULL AND track_type IS NOT NULL
+            ) s
+            GROUP BY day, city, location, track_type
+        ''', [d.isoformat() for d in days], days, list(PAYMENT_SETTLED_STATUSES))
+    return len(days)
+
+
+async def archive_past_trainings(batch_size: int = 500) -> int:
+    """
+    Перенести одну пачку тренировок старше ARCHIVE_AFTER_DAYS вместе с записями в архив.
+    Одна транзакция на пачку; SKIP LOCKED — не ждём тренировки, которые сейчас кто-то меняет.
+    Возвращает число перенесённых тренировок (меньше batch_size — хвост закончился).
+    """
+    async with transaction(name="tx:archive_past_trainings") as conn:
+        # Триггеры надгробий и аналитики пропускают перенос (см. fpv.archiving в init.sql)
+        await conn.execute("SET LOCAL fpv.archiving = 'on'")
+        ids = [r['id'] for r in await conn.fetch('''
+            SELECT id FROM trainings
+            WHERE date < $1
+            ORDER BY date, id
+            LIMIT $2
+            FOR UPDATE SKIP LOCKED
+        ''', archive_cutoff(), batch_size)]
+        if not ids:
+            return 0
+        await conn.execute('''
+            INSERT INTO trainings_archive (id, city, location, date, time, track_type, max_pilots,
+                                           current_pilots, created_at, updated_at, location_id)
+            SELECT id, city, location, date, time, track_type, max_pilots, current_pilots, created_at, updated_at,
+                   location_id
+            FROM trainings WHERE id = ANY($1::int[])
+            ON CONFLICT (id) DO NOTHING
+        ''', ids)
+        await conn.execute('''
+            INSERT INTO registrations_archive (id, training_id, user_id, vtx_band, vtx_channel, paid,
+                                               payment_id, payment_date, created_at, checked_in_at, checked_in_by)
+            SELECT id, training_id, user_id, vtx_band, vtx_channel, paid, payment_id, payment_date, created_at,
+                   checked_in_at, checked_in_by
+            FROM registrations WHERE training_id = ANY($1::int[])
+            ON CONFLICT (id) DO NOTHING
+        ''', ids)
+        # Записи и лист ожидания уходят каскадом
+        await conn.execute('DELETE FROM trainings WHERE id = ANY($1::int[])', ids)
+    return len(ids)
 
 
 async def get_pilots_for_training(training_id: int) -> List[Dict[str, Any]]:
@@ -192,9 +977,115 @@ async def get_pilots_for_training(training_id: int) -> List[Dict[str, Any]]:
     ''', training_id)
 
 
-async def delete_training(training_id: int):
-    """Удалить тренировку (каскадно удалит регистрации)"""
-    await execute('DELETE FROM trainings WHERE id = $1', training_id)
+async def get_checkin_roster(training_id: int) -> List[Dict[str, Any]]:
+    """Записи тренировки для ростера отметок (одним запросом, вместе с уже отмеченными)"""
+    return await fetch('''
+        SELECT r.id, r.user_id, COALESCE(uc.nickname, 'Аноним') AS display_name,
+               r.vtx_band, r.vtx_channel, r.paid, r.checked_in_at
+        FROM registrations r
+        LEFT JOIN user_consent uc ON r.user_id = uc.user_id
+        WHERE r.training_id = $1
+        ORDER BY r.vtx_band, r.vtx_channel
+    ''', training_id, name="checkin_roster")
+
+
+async def record_checkins(training_id: int, scans: Dict[int, datetime], admin_user_id: int) -> List[int]:
+    """
+    Пачка отметок явки одним UPDATE: {registration_id: время скана}. Уже отмеченные не перезаписываются
+    (повторная загрузка той же пачки безопасна). Возвращает id записей, отмеченных сейчас.
+    """
+    if not scans:
+        return []
+    ids = list(scans)
+    rows = await fetch('''
+        UPDATE registrations r
+        SET checked_in_at = s.scanned_at, checked_in_by = $4
+        FROM unnest($2::int[], $3::timestamptz[]) AS s(id, scanned_at)
+        WHERE r.id = s.id AND r.training_id = $1 AND r.checked_in_at IS NULL
+        RETURNING r.id
+    ''', training_id, ids, [scans[i] for i in ids], admin_user_id, name="record_checkins")
+    return [r['id'] for r in rows]
+
+
+async def cancel_training(training_id: int, reason: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Отмена тренировки одной транзакцией: снимок записей и листа ожидания одним запросом, пачкой —
+    заявки на возврат оплат (с задачами в refund_jobs) и уведомления пилотам в outbox, затем удаление
+    (записи уходят каскадом). Об оплаченных записях без платежа в журнале организатору уходит алерт.
+    Рассылку выполняет фоновая задача outbox, админ получает ответ сразу. None — тренировки нет.
+    """
+    async with transaction(name="tx:cancel_training") as conn:
+        training = await conn.fetchrow(
+            'SELECT id, city, location, location_id, date, time FROM trainings WHERE id = $1 FOR UPDATE',
+            training_id
+        )
+        if training is None:
+            return None
+
+        affected = await conn.fetch('''
+            SELECT r.id AS registration_id, r.user_id, r.paid = 1 AS paid, r.payment_id
+            FROM registrations r
+            WHERE r.training_id = $1
+            UNION ALL
+            SELECT NULL, w.user_id, FALSE, NULL
+            FROM waitlist w
+            WHERE w.training_id = $1
+        ''', training_id)
+
+        refunded = await conn.fetch('''
+            WITH requested AS (
+                UPDATE payments
+                SET status = 'refund_requested', updated_at = NOW()
+                WHERE registration_id = ANY($1::int[]) AND status IN ('succeeded', 'partially_refunded')
+                RETURNING id, registration_id, provider, currency, amount - refunded_amount AS amount
+            ), events AS (
+                INSERT INTO payment_events (payment_id, status, amount, details)
+                SELECT id, 'refund_requested', amount, $2 FROM requested
+            )
+            SELECT id, registration_id, provider, currency FROM requested
+        ''', [r['registration_id'] for r in affected if r['paid']],
+            {'source': 'training_canceled', 'training_id': training_id, 'reason': reason})
+        # Ключ строки о возврате: очередь вернёт сама, проведёт организатор, платежа нет в журнале
+        refund_keys = {
+            r['registration_id']: 'notifications-refund' if can_refund_automatically(r['provider'], r['currency'])
+            else 'notifications-refund_manual'
+            for r in refunded
+        }
+        await enqueue_refund_jobs(conn, [r['id'] for r in refunded],
+                                  {'source': 'training_canceled', 'training_id': training_id})
+        # Оплаченные записи без платежа в журнале автоматически не вернуть — алерт организатору
+        no_ledger = [r for r in affected if r['paid'] and r['registration_id'] not in refund_keys]
+        for r in no_ledger:
+            refund_keys[r['registration_id']] = 'notifications-refund_no_ledger'
+        await enqueue_notifications(conn, [
+            (ALERT_CHAT_ID,
+             f"⚠️ Нужен ручной возврат: тренировка #{training_id} отменена, у оплаченной записи "
+             f"#{r['registration_id']} пилота {r['user_id']} платёж {r['payment_id'] or '—'} "
+             f"не найден в журнале платежей.")
+            for r in no_ledger
+        ])
+
+        message = [('notifications-training_canceled', {
+            'location': training['location'], 'city': training['city'],
+            'date': training['date'], 'time': training['time'],
+        })]
+        if reason:
+            message.append(('notifications-cancel_reason', {'reason': reason}))
+        await enqueue_messages(conn, [
+            (r['user_id'], message + ([(refund_keys[r['registration_id']], {})] if r['paid'] else []))
+            for r in affected
+        ])
+
+        await conn.execute('DELETE FROM trainings WHERE id = $1', training_id)
+
+    registrations = [r for r in affected if r['registration_id'] is not None]
+    return {
+        **dict(training),
+        'registrations': len(registrations),
+        'paid': sum(1 for r in registrations if r['paid']),
+        'waitlisted': len(affected) - len(registrations),
+        'refund_payment_ids': [r['id'] for r in refunded],
+    }
 
 
 async def add_training(
@@ -205,47 +1096,93 @@ async def add_training(
     track_type: str = "other",
     max_pilots: int = 10
 ) -> int:
-    """Добавить новую тренировку, возвращает её ID"""
+    """Добавить новую тренировку, возвращает её ID (площадку по названию находит или создаёт триггер)"""
     row = await fetchrow('''
         INSERT INTO trainings (city, location, date, time, track_type, max_pilots)
         VALUES ($1, $2, $3, $4, $5, $6)
         RETURNING id
     ''', city, location, date, time, track_type, max_pilots)
+    invalidate_locations()
     return row['id']
 
 
+# Площадки
+
+_locations_cache: Tuple[float, List[Dict[str, Any]]] = (0.0, [])
+
+
+async def get_locations() -> List[Dict[str, Any]]:
+    """Справочник площадок (id, city, name), отсортированный по городу и названию; кэш в памяти процесса"""
+    global _locations_cache
+    expires, locations = _locations_cache
+    if time.monotonic() < expires:
+        return locations
+    locations = [dict(r) for r in await fetch(
+        'SELECT id, city, name FROM locations ORDER BY city, name', name="get_locations"
+    )]
+    _locations_cache = (time.monotonic() + LOCATIONS_CACHE_SECONDS, locations)
+    return locations
+
+
+def invalidate_locations():
+    """Сбросить кэш справочника (процесс сам создал площадку или алиас)"""
+    global _locations_cache
+    _locations_cache = (0.0, [])
+
+
+async def find_location(city: str, location: str) -> Optional[int]:
+    """id площадки по написанию (с учётом регистра, пробелов и алиасов); None — такой площадки нет"""
+    return await fetchval('SELECT find_location($1, $2)', city, location)
+
+
+async def add_location_alias(location_id: int, city: str, location: str):
+    """Запомнить другое написание площадки: тренировки с ним попадут на ту же площадку"""
+    await execute('''
+        INSERT INTO location_aliases (city_key, name_key, location_id)
+        VALUES (location_key($1), location_key($2), $3)
+        ON CONFLICT (city_key, name_key) DO UPDATE SET location_id = EXCLUDED.location_id
+    ''', city, location, location_id)
+    invalidate_locations()
+
+
 # Админ-функции
 
 async def get_admin(user_id: int) -> Optional[Dict[str, Any]]:
     """Получить данные админа по user_id"""
-    return await fetchrow('SELECT user_id, role, managed_locations FROM admins WHERE user_id = $1', user_id)
+    return await _prepared(None, 'fetchrow', 'admin_lookup', user_id)
 
 
-async def can_manage_training(user_id: int, city: str, location: str) -> bool:
-    """Проверить, может ли пользователь управлять этой площадкой"""
+async def can_manage_location(user_id: int, location_id: Optional[int]) -> bool:
+    """Проверить, может ли пользователь управлять площадкой (сравнение id из admin_locations)"""
     admin = await get_admin(user_id)
     if not admin:
         return False
     if admin['role'] == 'super_admin':
         return True
-    if admin['role'] == 'location_admin':
-        for loc in admin['managed_locations']:
-            if loc.get('city') == city and loc.get('location') == location:
-                return True
-    return False
+    return admin['role'] == 'location_admin' and location_id in admin['location_ids']
+
+
+async def can_manage_training(user_id: int, city: str, location: str) -> bool:
+    """Проверить, может ли пользователь управлять этой площадкой (по названию из ввода)"""
+    return await can_manage_location(user_id, await find_location(city, location))
 
 
 async def add_admin(user_id: int, role: str, managed_locations: list = None):
-    """Добавить или обновить админа"""
-    if managed_locations is None:
-        managed_locations = []
-    await execute('''
-        INSERT INTO admins (user_id, role, managed_locations)
-        VALUES ($1, $2, $3)
-        ON CONFLICT (user_id) DO UPDATE SET
-            role = EXCLUDED.role,
-            managed_locations = EXCLUDED.managed_locations
-    ''', user_id, role, managed_locations)
+    """Добавить или обновить админа; managed_locations — [{"city": ..., "location": ...}], площадки создаются при необходимости"""
+    async with transaction(name="tx:add_admin") as conn:
+        await conn.execute('''
+            INSERT INTO admins (user_id, role)
+            VALUES ($1, $2)
+            ON CONFLICT (user_id) DO UPDATE SET role = EXCLUDED.role
+        ''', user_id, role)
+        await conn.execute('DELETE FROM admin_locations WHERE admin_user_id = $1', user_id)
+        await conn.execute('''
+            INSERT INTO admin_locations (admin_user_id, location_id)
+            SELECT $1, resolve_location(loc->>'city', loc->>'location')
+            FROM jsonb_array_elements($2::jsonb) loc
+            ON CONFLICT DO NOTHING
+        ''', user_id, managed_locations or [])
+    invalidate_locations()
 
 
 async def remove_admin(user_id: int):
@@ -256,48 +1193,65 @@ async def remove_admin(user_id: int):
 # 2FA
 
 async def create_2fa_session(user_id: int) -> str:
-    """Создать сессию 2FA, вернуть код"""
-    import secrets
-    code = str(secrets.randbelow(900000) + 100000)
-    expires_at = datetime.now(pytz.UTC) + timedelta(minutes=10)
-
-    await execute('DELETE FROM admin_2fa_sessions WHERE expires_at < NOW()')
-
+    """Выдать код 2FA: у пользователя один живой код, новый заменяет прежний. В БД — только HMAC кода"""
+    code = generate_2fa_code()
+    expires_at = datetime.now(pytz.UTC) + timedelta(minutes=TWOFA_TTL_MINUTES)
     await execute('''
-        INSERT INTO admin_2fa_sessions (user_id, secret_code, expires_at)
+        INSERT INTO admin_2fa_sessions (user_id, code_hash, expires_at)
         VALUES ($1, $2, $3)
-    ''', user_id, code, expires_at)
-
+        ON CONFLICT (user_id) DO UPDATE
+        SET code_hash = EXCLUDED.code_hash, attempts = 0, expires_at = EXCLUDED.expires_at, created_at = NOW()
+    ''', user_id, hash_2fa_code(user_id, code), expires_at)
     return code
 
 
-async def verify_2fa_code(code: str) -> Optional[int]:
-    """Проверить код 2FA, вернуть user_id или None"""
-    row = await fetchrow('''
-        SELECT user_id FROM admin_2fa_sessions
-        WHERE secret_code = $1 AND expires_at > NOW()
-    ''', code)
-    if row:
-        await execute('DELETE FROM admin_2fa_sessions WHERE secret_code = $1', code)
-        return row['user_id']
-    return None
+async def verify_2fa_code(user_id: int, code: str) -> bool:
+    """
+    Проверить код пользователя по индексу user_id. Верный код одноразовый;
+    после TWOFA_MAX_ATTEMPTS неверных вводов код сгорает (счётчик общий для всех процессов веба).
+    """
+    async with transaction(name="tx:verify_2fa_code") as conn:
+        session = await conn.fetchrow('''
+            SELECT id, code_hash, attempts FROM admin_2fa_sessions
+            WHERE user_id = $1 AND expires_at > NOW()
+            FOR UPDATE
+        ''', user_id)
+        if session is None:
+            return False
+        if hmac.compare_digest(session['code_hash'], hash_2fa_code(user_id, code)):
+            await conn.execute('DELETE FROM admin_2fa_sessions WHERE id = $1', session['id'])
+            return True
+        if session['attempts'] + 1 >= TWOFA_MAX_ATTEMPTS:
+            await conn.execute('DELETE FROM admin_2fa_sessions WHERE id = $1', session['id'])
+        else:
+            await conn.execute(
+                'UPDATE admin_2fa_sessions SET attempts = attempts + 1 WHERE id = $1', session['id']
+            )
+    return False
+
+
+async def prune_2fa_sessions() -> int:
+    """Удалить истёкшие коды 2FA (задача планировщика, а не запрос входа)"""
+    result = await execute('DELETE FROM admin_2fa_sessions WHERE expires_at < NOW()')
+    return int(result.split()[-1])
 
 
 # Логирование действий админов
 
-async def log_admin_action(admin_user_id: int, action: str, target_id: int = None, details: dict = None):
-    """Записать действие админа в лог"""
+async def log_admin_action(admin_user_id: int, action: str, target_id: int = None, details: dict = None,
+                           ip_address: str = None):
+    """Записать действие админа в лог (ip_address — для действий из веб-панели)"""
     await execute('''
-        INSERT INTO admin_audit_log (admin_user_id, action, target_id, details)
-        VALUES ($1, $2, $3, $4)
-    ''', admin_user_id, action, target_id, details)
+        INSERT INTO admin_audit_log (admin_user_id, action, target_id, details, ip_address)
+        VALUES ($1, $2, $3, $4, $5)
+    ''', admin_user_id, action, target_id, details, ip_address)
 
 
 # Работа с согласием пользователя
 
 async def get_user_consent(user_id: int) -> Optional[Dict[str, Any]]:
     """Получить статус согласия пользователя"""
-    return await fetchrow('SELECT consent_given, lang FROM user_consent WHERE user_id = $1', user_id)
+    return await _prepared(None, 'fetchrow', 'consent_lookup', user_id)
 
 
 async def set_user_consent(user_id: int, username: str, full_name: str, lang: str = 'ru'):
@@ -312,12 +1266,29 @@ async def set_user_consent(user_id: int, username: str, full_name: str, lang: st
     ''', user_id, username, full_name, lang)
 
 
+async def set_user_lang(user_id: int, lang: str):
+    """Обновить язык интерфейса пользователя"""
+    await execute('UPDATE user_consent SET lang = $1 WHERE user_id = $2', lang, user_id)
+
+
 async def set_user_nickname(user_id: int, nickname: str):
     """Обновить никнейм пользователя"""
     await execute('UPDATE user_consent SET nickname = $1 WHERE user_id = $2', nickname, user_id)
 
 
 async def delete_user_data(user_id: int):
-    """Полностью удалить данные пользователя"""
-    await execute('DELETE FROM registrations WHERE user_id = $1', user_id)
-    await execute('DELETE FROM user_consent WHERE user_id = $1', user_id)
\ No newline at end of file
+    """Полностью удалить данные пользователя и отдать освободившиеся места листу ожидания"""
+    async with transaction() as conn:
+        # Блокируем тренировки в порядке id, чтобы не ловить дедлоки с параллельными отменами
+        training_ids = await conn.fetch('''
+            SELECT id FROM trainings
+            WHERE id IN (SELECT training_id FROM registrations WHERE user_id = $1)
+            ORDER BY id
+            FOR UPDATE
+        ''', user_id)
+        await conn.execute('DELETE FROM registrations WHERE user_id = $1', user_id)
+        await conn.execute('DELETE FROM registrations_archive WHERE user_id = $1', user_id)
+        await conn.execute('DELETE FROM waitlist WHERE user_id = $1', user_id)
+        await conn.execute('DELETE FROM user_consent WHERE user_id = $1', user_id)
+        for row in training_ids:
+            await promote_from_waitlist(conn, row['id'])
\ No newline at end of file
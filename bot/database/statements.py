@@ -0,0 +1,97 @@
+from typing import Any, Dict, Sequence
+
+import asyncpg
+from asyncpg.prepared_stmt import PreparedStatement
+
+# ========================
+# Реестр подготовленных выражений для горячих запросов
+# ========================
+# Каждое выражение готовится один раз на соединение (хук init пула) и дальше
+# выполняется без разбора SQL и без поиска в LRU-кэше asyncpg. Динамические
+# запросы (поиск с разным набором фильтров) больше не вытесняют горячие из кэша.
+
+STATEMENTS: Dict[str, str] = {
+    # Расписание и /search: пустые фильтры передаются как NULL — один план на все варианты.
+    # $3 — сегодняшняя дата: прошедшие тренировки в списки бота не попадают
+    "schedule_list": '''
+        SELECT id, city, location, date, time, track_type, current_pilots, max_pilots
+        FROM trainings
+        WHERE ($1::text IS NULL OR city ILIKE $1)
+          AND ($2::text IS NULL OR date = $2)
+          AND date >= $3
+        ORDER BY date, time
+    ''',
+    "used_channels": '''
+        SELECT vtx_band, vtx_channel
+        FROM registrations
+        WHERE training_id = $1
+    ''',
+    "channel_bitmap": '''
+        SELECT COALESCE(BIT_OR(1::bigint << ((array_position($2::text[], vtx_band) - 1) * 8 + vtx_channel - 1)), 0)
+        FROM registrations
+        WHERE training_id = $1
+    ''',
+    "consent_lookup": '''
+        SELECT consent_given, lang
+        FROM user_consent
+        WHERE user_id = $1
+    ''',
+    # Площадки админа: location_ids — для проверок прав, managed_locations — для вывода
+    "admin_lookup": '''
+        SELECT a.user_id, a.role,
+               COALESCE(array_agg(l.id ORDER BY l.id) FILTER (WHERE l.id IS NOT NULL), '{}') AS location_ids,
+               COALESCE(jsonb_agg(jsonb_build_object('id', l.id, 'city', l.city, 'location', l.name)
+                                  ORDER BY l.city, l.name) FILTER (WHERE l.id IS NOT NULL), '[]') AS managed_locations
+        FROM admins a
+        LEFT JOIN admin_locations al ON al.admin_user_id = a.user_id
+        LEFT JOIN locations l ON l.id = al.location_id
+        WHERE a.user_id = $1
+        GROUP BY a.user_id
+    ''',
+    "registration_insert": '''
+        INSERT INTO registrations (training_id, user_id, vtx_band, vtx_channel)
+        VALUES ($1, $2, $3, $4)
+        RETURNING id
+    ''',
+}
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Соединение пула с собственным набором подготовленных выражений"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: Dict[str, PreparedStatement] = {}
+
+
+async def prepare_statements(conn: PreparedConnection):
+    """Хук init пула: подготовить весь реестр на новом соединении"""
+    for name, query in STATEMENTS.items():
+        conn.statements[name] = await conn.prepare(query)
+
+
+def _statement(conn, name: str) -> PreparedStatement:
+    """
+    Выражение реестра для текущей аренды соединения. asyncpg привязывает объект выражения к аренде:
+    после возврата соединения в пул объект отказывается работать, хотя само выражение на сервере
+    живо (сброс соединения пулом его не удаляет) — перепривязываем без обращения к серверу.
+    """
+    stmt = conn.statements[name]
+    if stmt._con_release_ctr != stmt._connection._pool_release_ctr:
+        stmt = conn.statements[name] = PreparedStatement(stmt._connection, stmt._query, stmt._state)
+    return stmt
+
+
+async def run_prepared(conn, name: str, method: str, args: Sequence[Any]) -> Any:
+    """
+    Выполнить подготовленное выражение (method: fetch, fetchrow, fetchval).
+    После изменения схемы план становится недействительным — готовим заново и повторяем один раз
+    (внутри транзакции повтор невозможен: она уже прервана, ошибка уходит вызывающему).
+    """
+    try:
+        return await getattr(_statement(conn, name), method)(*args)
+    except (asyncpg.InvalidCachedStatementError, asyncpg.InvalidSQLStatementNameError):
+        if conn.is_in_transaction():
+            raise
+        conn.statements[name] = await conn.prepare(STATEMENTS[name])
+        return await getattr(conn.statements[name], method)(*args)
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Dict, Optional, Sequence, Set
+
+from ..config import SENTRY_DSN, SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN_RATE
+from ..utils.metrics import DB_QUERY_DURATION, DB_POOL_ACQUIRE_DURATION
+from .statements import STATEMENTS, run_prepared
+
+# Отдельный логгер, чтобы медленные запросы можно было направить в свой handler/файл
+slow_logger = logging.getLogger("bot.db.slow")
+logger = logging.getLogger(__name__)
+
+# Не чаще одного EXPLAIN ANALYZE на имя запроса за этот интервал (секунды)
+EXPLAIN_MIN_INTERVAL = 60
+# EXPLAIN ANALYZE выполняет запрос, поэтому сэмплируем только чтение
+_READ_ONLY_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_WRITE_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b|\bFOR\s+UPDATE\b", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_last_explain: Dict[str, float] = {}
+_background: Set[asyncio.Task] = set()
+
+if SENTRY_DSN:
+    import sentry_sdk
+else:
+    sentry_sdk = None
+
+
+def _compact_sql(query: str, limit: int = 300) -> str:
+    return _WHITESPACE_RE.sub(" ", query).strip()[:limit]
+
+
+def _span(name: str, query: str):
+    """Sentry-span только внутри уже сэмплированной транзакции — без неё span не нужен"""
+    if sentry_sdk is None or sentry_sdk.get_current_span() is None:
+        return nullcontext()
+    return sentry_sdk.start_span(op="db.query", description=name)
+
+
+def _is_explainable(query: str) -> bool:
+    return bool(_READ_ONLY_RE.match(query)) and not _WRITE_RE.search(query)
+
+
+def _record(pool, name: str, query: str, args: Sequence[Any], wait: float, elapsed: float):
+    DB_POOL_ACQUIRE_DURATION.labels(name).observe(wait)
+    DB_QUERY_DURATION.labels(name).observe(elapsed)
+
+    if elapsed * 1000 < SLOW_QUERY_MS:
+        return
+
+    slow_logger.warning(json.dumps({
+        "event": "slow_query",
+        "query": name,
+        "acquire_ms": round(wait * 1000, 2),
+        "exec_ms": round(elapsed * 1000, 2),
+        "threshold_ms": SLOW_QUERY_MS,
+        "sql": _compact_sql(query),
+    }, ensure_ascii=False))
+
+    if pool is None or not _is_explainable(query) or random.random() >= SLOW_QUERY_EXPLAIN_RATE:
+        return
+    now = time.monotonic()
+    if now - _last_explain.get(name, 0) < EXPLAIN_MIN_INTERVAL:
+        return
+    _last_explain[name] = now
+
+    # План снимаем в фоне на отдельном соединении — ответ пользователю не ждёт
+    task = asyncio.create_task(_explain(pool, name, query, args))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _explain(pool, name: str, query: str, args: Sequence[Any]):
+    try:
+        async with pool.acquire() as conn:
+            tr = conn.transaction()
+            await tr.start()
+            try:
+                plan = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", *args)
+            finally:
+                await tr.rollback()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        root = plan[0]
+        slow_logger.warning(json.dumps({
+            "event": "slow_query_plan",
+            "query": name,
+            "execution_ms": root.get("Execution Time"),
+            "planning_ms": root.get("Planning Time"),
+            "root_node": root["Plan"].get("Node Type"),
+            "plan": root["Plan"],
+        }, ensure_ascii=False, default=str))
+    except Exception as e:
+        logger.warning(f"EXPLAIN ANALYZE для {name} не удался: {e}")
+
+
+async def run_query(pool, method: str, name: str, query: str, args: Sequence[Any]) -> Any:
+    """Выполнить conn.<method>(query, *args) с замером ожидания пула и выполнения"""
+    start = time.perf_counter()
+    with _span(name, query):
+        async with pool.acquire() as conn:
+            acquired = time.perf_counter()
+            try:
+                return await getattr(conn, method)(query, *args)
+            finally:
+                _record(pool, name, query, args, acquired - start, time.perf_counter() - acquired)
+
+
+async def run_statement(pool, method: str, name: str, args: Sequence[Any]) -> Any:
+    """То же для выражения из реестра statements.STATEMENTS (метка — имя выражения)"""
+    start = time.perf_counter()
+    with _span(name, STATEMENTS[name]):
+        async with pool.acquire() as conn:
+            acquired = time.perf_counter()
+            try:
+                return await run_prepared(conn, name, method, args)
+            finally:
+                _record(pool, name, STATEMENTS[name], args, acquired - start, time.perf_counter() - acquired)
+
+
+@asynccontextmanager
+async def traced_transaction(pool, name: str):
+    """Транзакция с теми же замерами: ожидание пула и время от BEGIN до COMMIT"""
+    start = time.perf_counter()
+    acquired: Optional[float] = None
+    with _span(name, name):
+        try:
+            async with pool.acquire() as conn:
+                acquired = time.perf_counter()
+                async with conn.transaction():
+                    yield conn
+        finally:
+            if acquired is not None:
+                _record(None, name, name, (), acquired - start, time.perf_counter() - acquired)
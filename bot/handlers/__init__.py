@@ -1,11 +1,24 @@
-from .user import router as user_router
-from .admin import router as admin_router
-from .payments import router as payments_router
-from .voice import router as voice_router
+import importlib
+
+# Роутеры импортируются по первому обращению: voice тянет openai, payments — платёжные SDK
+_ROUTERS = {
+    "user_router": ".user",
+    "admin_router": ".admin",
+    "payments_router": ".payments",
+    "voice_router": ".voice",
+    "fallback_router": ".fallback",
+}
 
 __all__ = [
     "user_router",
     "admin_router",
     "payments_router",
-    "voice_router"
-]
\ No newline at end of file
+    "voice_router",
+    "fallback_router"
+]
+
+
+def __getattr__(name):
+    if name in _ROUTERS:
+        return importlib.import_module(_ROUTERS[name], __name__).router
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
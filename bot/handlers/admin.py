@@ -1,36 +1,31 @@
+import json
+from datetime import datetime, timezone
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.filters import Command
 from aiogram_i18n import I18nContext
 from ..database.db import *
+from ..utils.checkin import build_roster
+from ..utils.i18n import user_locale
+from ..utils.paging import PagedList
 from ..config import ADMIN_ID
 
 router = Router()
 
 
-async def notify_new_admin(bot, user_id: int, role: str, locations=None):
-    """Отправить уведомление новому админу"""
+async def notify_new_admin(bot, i18n: I18nContext, user_id: int, role: str, locations=None):
+    """Отправить уведомление новому админу (на его языке, если он уже выбирал язык в боте)"""
     try:
+        locale = await user_locale(user_id)
         if role == 'super_admin':
-            message = (
-                "🎉 *Поздравляем!*\n\n"
-                "Вам назначены права администратора FPV-платформы.\n\n"
-                "👑 *Роль:* Суперадминистратор\n"
-                "У вас есть полный доступ ко всем площадкам и функциям."
-            )
+            message = i18n.core.get("admin-welcome_super", locale)
         else:
-            message = (
-                "🎉 *Поздравляем!*\n\n"
-                "Вам назначены права администратора FPV-платформы.\n\n"
-                "📍 *Роль:* Администратор площадок\n"
-            )
             if locations:
                 loc_str = "\n".join([f" - {loc['city']} → {loc['location']}" for loc in locations])
-                message += f"Ваши площадки:\n{loc_str}"
+                loc_text = i18n.core.get("admin-welcome_locations", locale, locations=loc_str)
             else:
-                message += "Ваши площадки будут указаны отдельно."
-
-        message += "\n\nИспользуйте /admin для входа в админ-панель."
+                loc_text = i18n.core.get("admin-welcome_locations_later", locale)
+            message = i18n.core.get("admin-welcome_location", locale, locations=loc_text)
 
         await bot.send_message(chat_id=user_id, text=message, parse_mode="Markdown")
     except Exception as e:
@@ -44,22 +39,22 @@ async def add_super_admin(message: Message, i18n: I18nContext):
     admin = await get_admin(user_id)
 
     if not admin or admin['role'] != 'super_admin':
-        await message.answer("⛔ Только суперадмин может назначать админов.")
+        await message.answer(i18n.admin.only_super_add())
         return
 
     args = message.text.split()
     if len(args) != 2:
-        await message.answer("Использование: /add_super_admin USER_ID")
+        await message.answer(i18n.admin.add_super_usage())
         return
 
     try:
         new_admin_id = int(args[1])
         await add_admin(new_admin_id, 'super_admin')
-        await notify_new_admin(message.bot, new_admin_id, 'super_admin')
+        await notify_new_admin(message.bot, i18n, new_admin_id, 'super_admin')
         await log_admin_action(user_id, 'add_super_admin', new_admin_id)
-        await message.answer(f"✅ Пользователь {new_admin_id} назначен суперадмином.")
+        await message.answer(i18n.admin.super_added(user_id=new_admin_id))
     except Exception as e:
-        await message.answer(f"❌ Ошибка: {e}")
+        await message.answer(i18n.admin.error(error=e))
 
 
 @router.message(Command("add_admin"))
@@ -69,12 +64,12 @@ async def add_location_admin(message: Message, i18n: I18nContext):
     admin = await get_admin(user_id)
 
     if not admin or admin['role'] != 'super_admin':
-        await message.answer("⛔ Только суперадмин может назначать админов площадок.")
+        await message.answer(i18n.admin.only_super_add_location())
         return
 
     args = message.text.split()
     if len(args) < 4:
-        await message.answer("Использование: /add_admin USER_ID город локация [город2 локация2 ...]")
+        await message.answer(i18n.admin.add_admin_usage())
         return
 
     try:
@@ -83,7 +78,7 @@ async def add_location_admin(message: Message, i18n: I18nContext):
         loc_args = args[2:]
 
         if len(loc_args) % 2 != 0:
-            await message.answer("❌ Укажите пары: город локация город локация ...")
+            await message.answer(i18n.admin.pairs_needed())
             return
 
         for i in range(0, len(loc_args), 2):
@@ -92,14 +87,14 @@ async def add_location_admin(message: Message, i18n: I18nContext):
             locations.append({"city": city, "location": location})
 
         await add_admin(new_admin_id, 'location_admin', locations)
-        await notify_new_admin(message.bot, new_admin_id, 'location_admin', locations)
+        await notify_new_admin(message.bot, i18n, new_admin_id, 'location_admin', locations)
         await log_admin_action(user_id, 'add_location_admin', new_admin_id, {"locations": locations})
 
         loc_str = "; ".join([f"{loc['city']} - {loc['location']}" for loc in locations])
-        await message.answer(f"✅ Админ площадок {new_admin_id} назначен.\nПлощадки: {loc_str}")
+        await message.answer(i18n.admin.admin_added(user_id=new_admin_id, locations=loc_str))
 
     except Exception as e:
-        await message.answer(f"❌ Ошибка: {e}")
+        await message.answer(i18n.admin.error(error=e))
 
 
 @router.message(Command("remove_admin"))
@@ -109,50 +104,112 @@ async def remove_admin_cmd(message: Message, i18n: I18nContext):
     admin = await get_admin(user_id)
 
     if not admin or admin['role'] != 'super_admin':
-        await message.answer("⛔ Только суперадмин может удалять админов.")
+        await message.answer(i18n.admin.only_super_remove())
         return
 
     args = message.text.split()
     if len(args) != 2:
-        await message.answer("Использование: /remove_admin USER_ID")
+        await message.answer(i18n.admin.remove_usage())
         return
 
     try:
         admin_id = int(args[1])
         await remove_admin(admin_id)
         await log_admin_action(user_id, 'remove_admin', admin_id)
-        await message.answer(f"✅ Админ {admin_id} удалён.")
+        await message.answer(i18n.admin.removed(user_id=admin_id))
     except Exception as e:
-        await message.answer(f"❌ Ошибка: {e}")
+        await message.answer(i18n.admin.error(error=e))
+
+
+def _admin_entry(row, i18n: I18nContext) -> str:
+    lines = [f"🆔 {row['user_id']} | {row['role']}"]
+    if row['role'] == 'location_admin' and row['managed_locations']:
+        for loc in row['managed_locations']:
+            lines.append(f"   → {loc.get('city', '?')} - {loc.get('location', '?')}")
+    return "\n".join(lines) + "\n"
+
+
+ADMINS_LIST = PagedList(
+    3, "list_admins", '''
+        SELECT a.user_id, a.role,
+               COALESCE(jsonb_agg(jsonb_build_object('city', l.city, 'location', l.name)
+                                  ORDER BY l.city, l.name) FILTER (WHERE l.id IS NOT NULL), '[]') AS managed_locations
+        FROM admins a
+        LEFT JOIN admin_locations al ON al.admin_user_id = a.user_id
+        LEFT JOIN locations l ON l.id = al.location_id
+        WHERE TRUE {keyset}
+        GROUP BY a.user_id
+        ORDER BY {order}
+        LIMIT {limit}
+    ''',
+    key=(("a.role", "role"), ("a.user_id", "user_id")),
+    render=_admin_entry,
+    title=lambda i18n: i18n.admin.list_title(),
+    empty=lambda i18n: i18n.admin.list_empty(),
+)
 
 
 @router.message(Command("list_admins"))
 async def list_admins(message: Message, i18n: I18nContext):
-    """Показать список админов"""
+    """Показать список админов (постранично)"""
+    if not await get_admin(message.from_user.id):
+        await message.answer(i18n.admin.not_admin())
+        return
+    await ADMINS_LIST.answer(message, i18n)
+
+
+@router.callback_query(ADMINS_LIST.filter())
+async def list_admins_page(callback: CallbackQuery, i18n: I18nContext, cb):
+    if not await get_admin(callback.from_user.id):
+        await callback.answer(i18n.admin.not_admin(), show_alert=True)
+        return
+    await ADMINS_LIST.turn(callback, i18n, cb)
+
+
+@router.message(Command("locations"))
+async def list_locations(message: Message, i18n: I18nContext):
+    """Справочник площадок с id (для /location_alias)"""
+    if not await get_admin(message.from_user.id):
+        await message.answer(i18n.admin.not_admin())
+        return
+
+    locations = await get_locations()
+    if not locations:
+        await message.answer(i18n.admin.locations_empty())
+        return
+
+    text = i18n.admin.locations_title() + "\n\n"
+    for loc in locations:
+        text += f"{loc['id']}. {loc['city']} - {loc['name']}\n"
+    await message.answer(text)
+
+
+@router.message(Command("location_alias"))
+async def location_alias_cmd(message: Message, i18n: I18nContext):
+    """Другое написание площадки (только для суперадмина): тренировки с ним попадут на ту же площадку"""
     user_id = message.from_user.id
     admin = await get_admin(user_id)
 
-    if not admin:
-        await message.answer("⛔ Вы не админ.")
+    if not admin or admin['role'] != 'super_admin':
+        await message.answer(i18n.admin.only_super_locations())
         return
 
-    rows = await fetch('''
-        SELECT user_id, role, managed_locations FROM admins ORDER BY role, user_id
-    ''')
-
-    if not rows:
-        await message.answer("📋 Нет администраторов.")
+    args = message.text.split(maxsplit=3)
+    if len(args) != 4 or not args[1].isdigit():
+        await message.answer(i18n.admin.alias_usage())
         return
 
-    text = "📋 *Администраторы:*\n\n"
-    for row in rows:
-        text += f"🆔 {row['user_id']} | {row['role']}\n"
-        if row['role'] == 'location_admin' and row['managed_locations']:
-            for loc in row['managed_locations']:
-                text += f"   → {loc.get('city', '?')} - {loc.get('location', '?')}\n"
-        text += "\n"
+    location_id, city, alias = int(args[1]), args[2], args[3]
+    location = next((loc for loc in await get_locations() if loc['id'] == location_id), None)
+    if location is None:
+        await message.answer(i18n.admin.location_not_found())
+        return
 
-    await message.answer(text, parse_mode="Markdown")
+    await add_location_alias(location_id, city, alias)
+    await log_admin_action(user_id, 'add_location_alias', location_id, {'city': city, 'location': alias})
+    await message.answer(i18n.admin.alias_added(
+        city=city, alias=alias, target=f"{location['city']} - {location['name']}"
+    ))
 
 
 @router.message(Command("add_training"))
@@ -162,10 +219,7 @@ async def add_training_cmd(message: Message, i18n: I18nContext):
     args = message.text.split()
 
     if len(args) < 5:
-        await message.answer(
-            "Использование: /add_training город локация дата время [тип] [мест]\n"
-            "Пример: /add_training Москва Парк 2025-06-01 18:00 race 12"
-        )
+        await message.answer(i18n.admin.add_training_usage())
         return
 
     try:
@@ -176,7 +230,7 @@ async def add_training_cmd(message: Message, i18n: I18nContext):
 
         # Проверка прав
         if not await can_manage_training(user_id, city, location):
-            await message.answer("⛔ У вас нет прав на управление этой площадкой.")
+            await message.answer(i18n.admin.no_rights())
             return
 
         # Парсинг необязательных аргументов
@@ -204,19 +258,85 @@ async def add_training_cmd(message: Message, i18n: I18nContext):
             'max_pilots': max_pilots
         })
 
-        await message.answer(
-            f"✅ Тренировка добавлена!\n"
-            f"🏙️ {city} | 📍 {location}\n"
-            f"📅 {date} 🕒 {time}\n"
-            f"🎯 {TRACK_TYPES.get(track_type, 'Другое')} | 👥 {max_pilots} мест"
-        )
+        await message.answer(i18n.admin.training_added(
+            city=city, location=location, date=date, time=time,
+            track_type=TRACK_TYPES.get(track_type, TRACK_TYPES['other']), max_pilots=max_pilots
+        ))
 
         # Планирование напоминаний (если вы реализуете scheduler в utils)
         # from ..utils.scheduler import schedule_reminders
         # schedule_reminders(message.bot, message.bot.scheduler, training_id, date, time)
 
     except Exception as e:
-        await message.answer(f"❌ Ошибка при добавлении тренировки: {e}")
+        await message.answer(i18n.admin.add_training_error(error=e))
+
+
+@router.message(Command("cancel_training"))
+async def cancel_training_cmd(message: Message, i18n: I18nContext):
+    """Отменить тренировку: пилоты и лист ожидания получат уведомление, оплаты — заявку на возврат"""
+    user_id = message.from_user.id
+    args = message.text.split(maxsplit=2)
+    if len(args) < 2 or not args[1].isdigit():
+        await message.answer(i18n.admin.cancel_usage())
+        return
+
+    training_id = int(args[1])
+    reason = args[2].strip()[:200] if len(args) > 2 else None
+    location_id = await fetchval('SELECT location_id FROM trainings WHERE id = $1', training_id)
+    if location_id is None:
+        await message.answer(i18n.admin.training_not_found())
+        return
+    if not await can_manage_location(user_id, location_id):
+        await message.answer(i18n.admin.no_rights())
+        return
+
+    canceled = await cancel_training(training_id, reason)
+    if canceled is None:
+        await message.answer(i18n.admin.training_gone())
+        return
+    await log_admin_action(user_id, 'delete_training', training_id, {
+        'city': canceled['city'], 'location': canceled['location'], 'reason': reason,
+        'registrations': canceled['registrations'], 'waitlisted': canceled['waitlisted'],
+        'refunds': len(canceled['refund_payment_ids'])
+    })
+    await message.answer(i18n.admin.training_canceled(
+        location=canceled['location'], date=canceled['date'], time=canceled['time'],
+        registrations=canceled['registrations'], paid=canceled['paid'], waitlisted=canceled['waitlisted'],
+        refunds=len(canceled['refund_payment_ids'])
+    ))
+
+
+@router.message(Command("roster"))
+async def roster_cmd(message: Message, i18n: I18nContext):
+    """Ростер тренировки для отметки по QR без сети (отметки загружаются в веб-админке пачкой)"""
+    user_id = message.from_user.id
+    args = message.text.split()
+    if len(args) != 2 or not args[1].isdigit():
+        await message.answer(i18n.admin.roster_usage())
+        return
+
+    training_id = int(args[1])
+    training = await fetchrow(
+        'SELECT id, city, location, location_id, date, time FROM trainings WHERE id = $1', training_id
+    )
+    if not training:
+        await message.answer(i18n.admin.training_not_found())
+        return
+    if not await can_manage_location(user_id, training['location_id']):
+        await message.answer(i18n.admin.no_rights())
+        return
+
+    registrations = await get_checkin_roster(training_id)
+    roster = build_roster(training, registrations, datetime.now(timezone.utc))
+    body = json.dumps(roster, ensure_ascii=False, separators=(",", ":")).encode()
+    checked_in = sum(1 for r in registrations if r['checked_in_at'])
+    await message.answer_document(
+        BufferedInputFile(body, filename=f"roster_{training_id}.json"),
+        caption=i18n.admin.roster_caption(
+            location=training['location'], date=training['date'], time=training['time'],
+            registered=len(registrations), checked_in=checked_in
+        )
+    )
 
 
 @router.message(Command("admin"))
@@ -226,17 +346,23 @@ async def admin_panel_cmd(message: Message, i18n: I18nContext):
     admin = await get_admin(user_id)
 
     if not admin:
-        await message.answer("⛔ Доступ запрещён.")
+        await message.answer(i18n.admin.denied())
+        return
+
+    await message.answer(i18n.admin.panel(), parse_mode="Markdown")
+
+
+@router.message(Command("get_2fa_code"))
+async def get_2fa_code(message: Message, i18n: I18nContext):
+    """Одноразовый код для входа в веб-админку (новый код заменяет прежний)"""
+    user_id = message.from_user.id
+    if not await get_admin(user_id):
+        await message.answer(i18n.admin.denied())
         return
 
+    code = await create_2fa_session(user_id)
     await message.answer(
-        "🔐 *Админ-панель*\n\n"
-        "Доступные команды:\n"
-        "/add_training — добавить тренировку\n"
-        "/add_admin — назначить админа площадок\n"
-        "/add_super_admin — назначить суперадмина\n"
-        "/remove_admin — удалить админа\n"
-        "/list_admins — список админов",
+        i18n.admin.twofa(user_id=user_id, code=code, ttl=TWOFA_TTL_MINUTES, attempts=TWOFA_MAX_ATTEMPTS),
         parse_mode="Markdown"
     )
 
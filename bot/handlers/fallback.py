@@ -0,0 +1,13 @@
+from aiogram import Router, F
+from aiogram.types import CallbackQuery
+from aiogram_i18n import I18nContext
+from ..utils.callbacks import CALLBACK_PREFIX
+
+# Подключается последним: сюда доходят кнопки кодека, не прошедшие ни один фильтр
+# (подпись не сошлась, кнопка чужая или от старой версии бота)
+router = Router()
+
+
+@router.callback_query(F.data.startswith(CALLBACK_PREFIX))
+async def stale_callback(callback: CallbackQuery, i18n: I18nContext):
+    await callback.answer(i18n.common.stale_button(), show_alert=True)
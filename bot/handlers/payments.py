@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import hashlib
 import json
 import logging
@@ -14,23 +15,20 @@ from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_applicati
 from aiohttp import web
 from aiogram_i18n import I18nContext
 from ..database.db import *
+from ..utils.metrics import PAYMENT_WEBHOOKS
+from ..utils.callbacks import REFUND
+from ..utils.paging import PagedList
+from ..utils.i18n import translate, user_locale
+from ..utils.payment_refunds import can_refund_automatically
+from ..utils.pdf import render_receipt_pdf
 from ..config import (
     PROVIDER_TOKEN, YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY,
-    STRIPE_SECRET_KEY, WEBHOOK_URL, SCHEDULE_URL
+    STRIPE_SECRET_KEY, WEBHOOK_URL
 )
 import uuid
-from datetime import datetime
-import pytz
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle
+from decimal import Decimal
 import os
 from io import BytesIO
-import qrcode
-from PIL import Image
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
@@ -48,23 +46,6 @@ if STRIPE_SECRET_KEY:
 
 router = Router()
 
-# Регистрация шрифта для PDF
-FONT_PATH = os.path.join(os.path.dirname(__file__), "..", "DejaVuSans.ttf")
-if os.path.exists(FONT_PATH):
-    pdfmetrics.registerFont(TTFont('DejaVu', FONT_PATH))
-
-
-def generate_qr_code(data: str) -> BytesIO:
-    """Генерация QR-кода для PDF"""
-    qr = qrcode.QRCode(version=1, box_size=4, border=2)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-    return buffer
-
 
 async def generate_receipt_pdf(
     reg_id: int,
@@ -74,79 +55,37 @@ async def generate_receipt_pdf(
     date_str: str,
     location: str,
     payment_id: str,
+    training_id: int = None,
+    user_id: int = None,
     is_refund: bool = False
 ) -> BytesIO:
-    """Генерация PDF-чека с QR-кодом"""
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Шрифт
-    font_name = "DejaVu" if os.path.exists(FONT_PATH) else "Helvetica"
-    p.setFont(font_name, 12)
-
-    # Заголовок
-    p.setFillColor(colors.blue)
-    p.setFont("Helvetica-Bold", 16)
-    title = "FPV TRAINING — КВИТАНЦИЯ" if not is_refund else "FPV TRAINING — ЧЕК ВОЗВРАТА"
-    p.drawCentredString(width / 2, height - 50, title)
-    p.setFillColor(colors.black)
-    p.setFont(font_name, 12)
-
-    # Данные
-    y = height - 100
-    lines = [
-        f"ID регистрации: {reg_id}",
-        f"Пилот: {user_name}",
-        f"Сумма: {amount} руб.",
-        f"Канал VTX: {channel}",
-        f"Тренировка: {location}",
-        f"Дата: {date_str}",
-        f"ID платежа: {payment_id[:8]}...",
-        f"Время выдачи: {datetime.now(pytz.timezone('Europe/Moscow')).strftime('%Y-%m-%d %H:%M:%S')}",
-    ]
-
-    if is_refund:
-        lines.append("Статус: ВОЗВРАТ СРЕДСТВ")
-
-    lines.append("")
-    lines.append("Спасибо за участие! Приятных полётов 🚁")
-
-    for line in lines:
-        p.drawString(50, y, line)
-        y -= 20
-
-        # QR-код для верификации
-    qr_data = f"fpv_verify:{reg_id}:{payment_id}:{int(amount * 100)}:{int(is_refund)}"
-    qr_buffer = generate_qr_code(qr_data)
-    p.drawImage(Image.open(qr_buffer), width - 150, 100, 100, 100)
-
-    p.setFont("Helvetica", 10)
-    p.drawString(width - 150, 85, "Сканируйте для проверки")
-
-    # Добавляем гиперссылку "Записаться на тренировку"
-    p.setFillColor(colors.blue)
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, 70, "Записаться на тренировку")
-    p.linkURL(SCHEDULE_URL, (50, 70, 250, 90), relative=0)  # Координаты: x1, y1, x2, y2
-    p.setFillColor(colors.black)
-
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return buffer
+    """PDF-чек в потоке исполнителя: reportlab и QR не блокируют цикл событий"""
+    return await asyncio.to_thread(
+        render_receipt_pdf, reg_id, user_name, amount, channel, date_str, location, payment_id,
+        training_id, user_id, is_refund
+    )
 
 
-@router.message(Command("my_payments"))
-async def my_payments(message: Message, i18n: I18nContext):
-    """История платежей пользователя"""
-    user_id = message.from_user.id
+def _payment_entry(p, i18n: I18nContext) -> str:
+    status = i18n.payments.paid() if p['is_paid'] else i18n.payments.pending()
+    if p['payment_date']:
+        date_str = p['payment_date'].strftime('%Y-%m-%d %H:%M')
+    else:
+        date_str = i18n.payments.not_paid()
+    return (
+        f"🆔 {p['reg_id']} | {p['location']} ({p['date']} {p['time']})\n"
+        f"📡 {p['vtx_band']}{p['vtx_channel']} | {status} | {date_str}\n"
+        f"💳 {p['payment_id'][:8] if p['payment_id'] else 'N/A'}\n"
+    )
+
 
-    payments = await fetch('''
-        SELECT 
+# Новые записи сверху (по id записи — ключ листания без NULL, в отличие от payment_date).
+# История целиком: прошедшие оплаченные тренировки лежат в архиве (id записей при переносе не меняются)
+MY_PAYMENTS = PagedList(
+    2, "my_payments", '''
+        SELECT
             r.id as reg_id,
             r.payment_id,
-            r.paid,
             r.payment_date,
             t.location,
             t.date,
@@ -154,30 +93,29 @@ async def my_payments(message: Message, i18n: I18nContext):
             r.vtx_band,
             r.vtx_channel,
             r.paid as is_paid
-        FROM registrations r
-        JOIN trainings t ON r.training_id = t.id
-        WHERE r.user_id = $1
-        ORDER BY r.payment_date DESC NULLS LAST, r.created_at DESC
-    ''', user_id)
+        FROM registrations_all r
+        JOIN trainings_all t ON r.training_id = t.id
+        WHERE r.user_id = $1 {keyset}
+        ORDER BY {order}
+        LIMIT {limit}
+    ''',
+    key=(("r.id", "reg_id"),),
+    descending=True,
+    render=_payment_entry,
+    title=lambda i18n: i18n.payments.title(),
+    empty=lambda i18n: i18n.payments.empty(),
+)
 
-    if not payments:
-        await message.answer("У вас пока нет платежей.")
-        return
 
-    text = "📋 *История платежей:*\n\n"
-    for p in payments:
-        status = "✅ Оплачено" if p['is_paid'] else "⏳ Ожидает оплаты"
-        if p['payment_date']:
-            date_str = p['payment_date'].strftime('%Y-%m-%d %H:%M')
-        else:
-            date_str = "Не оплачено"
-        text += (
-            f"🆔 {p['reg_id']} | {p['location']} ({p['date']} {p['time']})\n"
-            f"📡 {p['vtx_band']}{p['vtx_channel']} | {status} | {date_str}\n"
-            f"💳 {p['payment_id'][:8] if p['payment_id'] else 'N/A'}\n\n"
-        )
+@router.message(Command("my_payments"))
+async def my_payments(message: Message, i18n: I18nContext):
+    """История платежей пользователя (постранично)"""
+    await MY_PAYMENTS.answer(message, i18n, message.from_user.id)
+
 
-    await message.answer(text, parse_mode="Markdown")
+@router.callback_query(MY_PAYMENTS.filter())
+async def my_payments_page(callback: CallbackQuery, i18n: I18nContext, cb):
+    await MY_PAYMENTS.turn(callback, i18n, cb, callback.from_user.id)
 
 
 @router.message(F.text == "/refund")
@@ -189,65 +127,69 @@ async def refund_menu(message: Message, i18n: I18nContext):
         SELECT r.id, r.payment_id, r.paid, t.location, t.date, t.time, r.vtx_band, r.vtx_channel
         FROM registrations r
         JOIN trainings t ON r.training_id = t.id
-        WHERE r.user_id = $1 AND r.paid = 1
+        WHERE r.user_id = $1 AND r.paid = 1 AND t.date >= $2
         ORDER BY t.date DESC, t.time DESC
-    ''', user_id)
+    ''', user_id, local_today())
 
     if not registrations:
-        await message.answer("У вас нет оплаченных регистраций для возврата.")
+        await message.answer(i18n.refund.empty())
         return
 
     keyboard = []
     for reg in registrations:
-        btn_text = f"Вернуть: {reg['location']} ({reg['date']} {reg['time']}) — {reg['vtx_band']}{reg['vtx_channel']}"
-        keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"refund_{reg['id']}")])
+        btn_text = i18n.refund.button(
+            location=reg['location'], date=reg['date'], time=reg['time'],
+            channel=f"{reg['vtx_band']}{reg['vtx_channel']}"
+        )
+        keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=REFUND.pack(reg['id'], user_id=user_id))])
 
-    keyboard.append([InlineKeyboardButton(text="⬅️ Отмена", callback_data="cancel_refund")])
+    keyboard.append([InlineKeyboardButton(text=i18n.refund.cancel(), callback_data="cancel_refund")])
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-    await message.answer("Выберите регистрацию для возврата средств:", reply_markup=markup)
+    await message.answer(i18n.refund.choose(), reply_markup=markup)
 
 
-@router.callback_query(F.data.startswith("refund_"))
-async def process_refund(callback: CallbackQuery, bot: Bot, i18n: I18nContext):
-    """Обработка запроса на возврат"""
-    reg_id = int(callback.data.split('_')[1])
+@router.callback_query(REFUND.filter())
+async def process_refund(callback: CallbackQuery, bot: Bot, i18n: I18nContext, cb):
+    """Обработка запроса на возврат (кнопка подписана для владельца записи)"""
+    reg_id = cb.registration_id
     user_id = callback.from_user.id
 
     reg = await fetchrow('''
-        SELECT r.id, r.payment_id, r.paid, t.location, t.date, t.time, r.vtx_band, r.vtx_channel, r.user_id, r.training_id
+        SELECT r.id, r.paid, r.user_id, t.location, t.date, t.time
         FROM registrations r
         JOIN trainings t ON r.training_id = t.id
         WHERE r.id = $1
     ''', reg_id)
 
     if not reg or reg['user_id'] != user_id or not reg['paid']:
-        await callback.answer("Неверная регистрация.", show_alert=True)
+        await callback.answer(i18n.refund.invalid(), show_alert=True)
         return
 
-    # Отменяем регистрацию
-    await execute('DELETE FROM registrations WHERE id = $1', reg_id)
-    await execute('UPDATE trainings SET current_pilots = current_pilots - 1 WHERE id = $1', reg['training_id'])
-
-    # Генерируем PDF чек возврата
-    pdf_buffer = await generate_receipt_pdf(
-        reg_id,
-        callback.from_user.full_name,
-        0.0,
-        f"{reg['vtx_band']}{reg['vtx_channel']}",
-        f"{reg['date']} {reg['time']}",
-        reg['location'],
-        reg['payment_id'],
-        is_refund=True
-    )
+    # Отменяем регистрацию, оформляем заявку на возврат и задачу для провайдера одной транзакцией
+    # (место сразу получит первый из листа ожидания). Деньги возвращает фоновая очередь refund_jobs,
+    # чек возврата придёт, когда провайдер проведёт возврат
+    result = await delete_registration(reg_id, refund=True)
+    if result is None:
+        await callback.answer(i18n.refund.already_canceled(), show_alert=True)
+        return
 
-    await bot.send_document(
-        chat_id=user_id,
-        document=("refund_receipt.pdf", pdf_buffer),
-        caption="✅ Регистрация отменена и возврат инициирован.\n\nЧек возврата:"
-    )
+    text = i18n.refund.canceled(location=reg['location'], date=reg['date'], time=reg['time']) + "\n"
+    payment = result['payment']
+    automatic = payment is not None and can_refund_automatically(payment['provider'], payment['currency'])
+    if payment is None:
+        # Оплаты нет в журнале — сумму и способ возврата знает только организатор
+        text += i18n.refund.no_ledger()
+    else:
+        amount = payment['amount'] - payment['refunded_amount']
+        if automatic:
+            text += i18n.refund.automatic(amount=amount, currency=payment['currency'])
+        else:
+            # Например, оплата картой через Telegram Payments: Bot API такие платежи не возвращает
+            text += i18n.refund.manual(amount=amount, currency=payment['currency'])
+    await bot.send_message(chat_id=user_id, text=text)
 
-    await callback.answer("Возврат выполнен. Чек отправлен.", show_alert=True)
+    await callback.answer(i18n.refund.done() if automatic else i18n.refund.done_manual(), show_alert=True)
     await callback.message.delete()
 
 
@@ -256,29 +198,30 @@ async def pay_custom_amount(message: Message, i18n: I18nContext):
     """Оплата с выбором суммы"""
     args = message.text.split()
     if len(args) != 3:
-        await message.answer("Использование: /pay_custom TRAINING_ID СУММА_В_РУБЛЯХ")
+        await message.answer(i18n.pay.custom_usage())
         return
 
     try:
         training_id = int(args[1])
-        amount_rub = float(args[2])
-        amount_kopek = int(amount_rub * 100)
+        amount_kopek = int(Decimal(args[2]) * 100)  # без ошибок округления float: 10.01 → 1001
 
         if amount_kopek < 100:
-            await message.answer("Минимальная сумма — 1 рубль.")
+            await message.answer(i18n.pay.min_amount())
             return
 
         training = await fetchrow('SELECT location, date, time FROM trainings WHERE id = $1', training_id)
         if not training:
-            await message.answer("Тренировка не найдена.")
+            await message.answer(i18n.pay.not_found())
             return
 
-        prices = [LabeledPrice(label=f"Оплата участия: {training['location']}", amount=amount_kopek)]
+        prices = [LabeledPrice(label=i18n.pay.custom_label(location=training['location']), amount=amount_kopek)]
 
         await message.bot.send_invoice(
             chat_id=message.chat.id,
-            title="FPV Тренировка — Произвольная сумма",
-            description=f"Оплата участия в тренировке {training['location']} ({training['date']} {training['time']})",
+            title=i18n.pay.custom_title(),
+            description=i18n.pay.custom_description(
+                location=training['location'], date=training['date'], time=training['time']
+            ),
             payload=f"fpv_{training_id}_{message.from_user.id}",
             provider_token=PROVIDER_TOKEN,
             currency="RUB",
@@ -292,26 +235,26 @@ async def pay_custom_amount(message: Message, i18n: I18nContext):
         )
 
     except Exception as e:
-        await message.answer(f"Ошибка: {e}")
+        await message.answer(i18n.pay.error(error=e))
 
 
 @router.message(F.text.startswith("/pay_yoo"))
 async def pay_with_yookassa(message: Message, i18n: I18nContext):
     """Оплата через ЮKassa"""
     if not yoo_client:
-        await message.answer("ЮKassa не настроен.")
+        await message.answer(i18n.pay.yoo_disabled())
         return
 
     args = message.text.split()
     if len(args) != 2:
-        await message.answer("Использование: /pay_yoo TRAINING_ID")
+        await message.answer(i18n.pay.yoo_usage())
         return
 
     try:
         training_id = int(args[1])
         training = await fetchrow('SELECT location, date, time FROM trainings WHERE id = $1', training_id)
         if not training:
-            await message.answer("Тренировка не найдена.")
+            await message.answer(i18n.pay.not_found())
             return
 
         amount = 500.0
@@ -336,31 +279,56 @@ async def pay_with_yookassa(message: Message, i18n: I18nContext):
             }
         })
 
-        # Сохраняем как незавершенную регистрацию
-        reg_id = await fetchrow('''
-            INSERT INTO registrations (training_id, user_id, vtx_band, vtx_channel, paid, payment_id)
-            VALUES ($1, $2, $3, $4, 0, $5)
-            RETURNING id
-        ''', training_id, user_id, "R", 1, payment.id)
+        # Сохраняем как незавершенную регистрацию и ожидающий платёж в журнале
+        async with transaction(name="tx:pay_with_yookassa") as conn:
+            reg_id = await conn.fetchval('''
+                INSERT INTO registrations (training_id, user_id, vtx_band, vtx_channel, paid, payment_id)
+                VALUES ($1, $2, $3, $4, 0, $5)
+                RETURNING id
+            ''', training_id, user_id, "R", 1, payment.id)
+            await record_payment(conn, 'yookassa', payment.id, reg_id, Decimal(f"{amount:.2f}"), "RUB", 'pending')
 
         await message.answer(
-            f"🔷 Оплата через ЮKassa\n\n"
-            f"Тренировка: {training['location']}\n"
-            f"Дата: {training['date']} {training['time']}\n"
-            f"Сумма: {amount} руб.\n\n"
-            f"👉 [Оплатить]({payment.confirmation.confirmation_url})",
+            i18n.pay.yoo_invoice(
+                location=training['location'], date=training['date'], time=training['time'],
+                amount=amount, url=payment.confirmation.confirmation_url
+            ),
             parse_mode="Markdown"
         )
 
     except Exception as e:
         logger.error(f"ЮKassa ошибка: {e}")
-        await message.answer(f"Ошибка ЮKassa: {e}")
+        await message.answer(i18n.pay.yoo_error(error=e))
 
 
 # ========================
 # WEBHOOKS
 # ========================
 
+def counted_webhook(provider: str):
+    """Считать вебхуки платёжки в payment_webhooks_total по типу события и исходу"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            response = await handler(request)
+            try:
+                body = await request.json()  # aiohttp кэширует тело, повторное чтение бесплатно
+                event = body.get('event') or body.get('type') or 'unknown'
+            except Exception:
+                event = 'invalid'
+            if response.status < 300:
+                outcome = 'ok'
+            elif response.status < 500:
+                outcome = 'rejected'
+            else:
+                outcome = 'error'
+            PAYMENT_WEBHOOKS.labels(provider, event, outcome).inc()
+            return response
+        return wrapper
+    return decorator
+
+
+@counted_webhook('yookassa')
 async def yookassa_webhook_handler(request):
     """Обработчик вебхука от ЮKassa"""
     try:
@@ -373,6 +341,8 @@ async def yookassa_webhook_handler(request):
             return web.Response(status=200)
 
         payment_id = payment_data['id']
+        amount = Decimal(payment_data['amount']['value'])
+        currency = payment_data['amount'].get('currency', 'RUB')
         metadata = payment_data.get('metadata', {})
         training_id = int(metadata.get('training_id', 0))
         user_id = int(metadata.get('user_id', 0))
@@ -384,16 +354,19 @@ async def yookassa_webhook_handler(request):
         reg = await fetchrow('SELECT id, vtx_band, vtx_channel FROM registrations WHERE payment_id = $1', payment_id)
         if not reg:
             # Создаем новую регистрацию
-            success, message, reg_id = await register_pilot_with_channel(
+            success, reason, registered = await register_pilot_with_channel(
                 training_id, user_id, f"user_{user_id}", f"User {user_id}"
             )
             if not success:
-                logger.error(f"Не удалось зарегистрировать после оплаты: {message}")
+                logger.error(f"Не удалось зарегистрировать после оплаты: {reason}")
                 return web.Response(status=500)
 
-            # Обновляем payment_id
-            await execute('UPDATE registrations SET payment_id = $1, paid = 1, payment_date = NOW() WHERE id = $2', payment_id, reg_id)
-            reg = await fetchrow('SELECT id, vtx_band, vtx_channel FROM registrations WHERE id = $1', reg_id)
+            reg = await fetchrow(
+                'SELECT id, vtx_band, vtx_channel FROM registrations WHERE id = $1', registered['reg_id']
+            )
+
+        # Отметка об оплате и журнал платежей — одной транзакцией (повтор вебхука идемпотентен)
+        await mark_registration_paid(reg['id'], 'yookassa', payment_id, amount, currency, {'event': event})
 
         # Отправляем уведомление пользователю
         bot = Bot(token=PROVIDER_TOKEN.split(":")[0])  # HACK: берем токен из PROVIDER_TOKEN
@@ -404,17 +377,19 @@ async def yookassa_webhook_handler(request):
                 pdf_buffer = await generate_receipt_pdf(
                     reg['id'],
                     f"User {user_id}",
-                    float(payment_data['amount']['value']),
+                    float(amount),
                     channel_str,
                     f"{training['date']} {training['time']}",
                     training['location'],
-                    payment_id
+                    payment_id,
+                    training_id,
+                    user_id
                 )
 
                 await bot.send_document(
                     chat_id=user_id,
                     document=("receipt.pdf", pdf_buffer),
-                    caption=f"✅ Оплата прошла!\nВаш канал: {channel_str}\n\nЧек прикреплен."
+                    caption=translate("pay-webhook_receipt", await user_locale(user_id), channel=channel_str)
                 )
         except Exception as e:
             logger.error(f"Не удалось отправить чек: {e}")
@@ -426,6 +401,7 @@ async def yookassa_webhook_handler(request):
         return web.Response(status=500)
 
 
+@counted_webhook('stripe')
 async def stripe_webhook_handler(request):
     """Обработчик вебхука от Stripe (опционально)"""
     if not STRIPE_SECRET_KEY:
@@ -451,11 +427,15 @@ async def stripe_webhook_handler(request):
 
         if training_id and user_id:
             # Аналогично ЮKassa — регистрируем пилота
-            success, message, reg_id = await register_pilot_with_channel(
+            success, reason, registered = await register_pilot_with_channel(
                 training_id, user_id, f"user_{user_id}", f"User {user_id}"
             )
             if success:
-                await execute('UPDATE registrations SET paid = 1, payment_id = $1 WHERE id = $2', payment_intent['id'], reg_id)
+                await mark_registration_paid(
+                    registered['reg_id'], 'stripe', payment_intent['id'],
+                    Decimal(payment_intent['amount_received']) / 100, payment_intent['currency'].upper(),
+                    {'event': event['type']}
+                )
 
     return web.Response(status=200)
 
@@ -495,39 +475,44 @@ async def successful_payment_handler(message: Message, bot: Bot, i18n: I18nConte
             raise ValueError("User mismatch")
 
     except Exception as e:
-        await message.answer("❌ Ошибка при обработке платежа.")
+        await message.answer(i18n.pay.failed())
         return
 
     consent = await get_user_consent(user_id)
     if not consent or not consent.get('consent_given'):
-        await message.answer("Сначала дайте согласие: /start")
+        await message.answer(i18n.common.need_consent())
         return
 
     nickname = consent.get('nickname') if consent else None
     if not nickname:
         nickname = message.from_user.full_name
 
-    success, reg_message, reg_id = await register_pilot_with_channel(
+    success, reason, registered = await register_pilot_with_channel(
         training_id,
         user_id,
         message.from_user.username or f"user_{user_id}",
         nickname
     )
+    reg_message = i18n.get(f"registration-{reason}", **(registered or {}))
 
     if not success:
-        await message.answer(f"❌ Ошибка записи: {reg_message}")
+        PAYMENT_WEBHOOKS.labels('telegram', 'successful_payment', 'error').inc()
+        await message.answer(i18n.pay.register_failed(error=reg_message))
         return
-
-    await execute('''
-        UPDATE registrations
-        SET paid = 1, payment_id = $1, payment_date = NOW()
-        WHERE id = $2
-    ''', payment.telegram_payment_charge_id, reg_id)
+    PAYMENT_WEBHOOKS.labels('telegram', 'successful_payment', 'ok').inc()
+    reg_id = registered['reg_id']
+
+    # Сумма из счёта (в т.ч. /pay_custom) сохраняется в журнал вместе с отметкой об оплате
+    await mark_registration_paid(
+        reg_id, 'telegram', payment.telegram_payment_charge_id,
+        Decimal(payment.total_amount) / 100, payment.currency,
+        {'provider_payment_charge_id': payment.provider_payment_charge_id, 'invoice_payload': payload}
+    )
 
     # Генерация PDF-чека
     training = await fetchrow('SELECT location, date, time FROM trainings WHERE id = $1', training_id)
     if training:
-        channel_str = reg_message.split("Ваш канал: ")[-1].split(" ")[0] if "Ваш канал: " in reg_message else "N/A"
+        channel_str = f"{registered['band']}{registered['channel']}"
         pdf_buffer = await generate_receipt_pdf(
             reg_id,
             nickname,
@@ -535,13 +520,15 @@ async def successful_payment_handler(message: Message, bot: Bot, i18n: I18nConte
             channel_str,
             f"{training['date']} {training['time']}",
             training['location'],
-            payment.telegram_payment_charge_id
+            payment.telegram_payment_charge_id,
+            training_id,
+            user_id
         )
 
         await bot.send_document(
             chat_id=user_id,
             document=("receipt.pdf", pdf_buffer),
-            caption="✅ Оплата прошла! Ваш чек:"
+            caption=i18n.pay.receipt()
         )
 
-    await message.answer(f"✅ {reg_message}\n\nСпасибо за участие! 🚁", parse_mode="Markdown")
\ No newline at end of file
+    await message.answer(i18n.pay.thanks(message=reg_message), parse_mode="Markdown")
\ No newline at end of file
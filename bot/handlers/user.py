@@ -1,58 +1,144 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import (
+    Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+)
 from aiogram.filters import Command
 from aiogram_i18n import I18nContext
 from ..database.db import *
+from ..database.db import VTX_BANDS as VTX_FREQUENCIES
 from ..config import SCHEDULE_URL
-import qrcode
+from ..utils.i18n import pick_locale
+from ..utils.ical import user_feed_url, city_feed_url
+from ..utils.search_index import training_index
+from ..utils.paging import PagedList
+from ..utils.callbacks import (
+    VIEW_TRAININGS, SEARCH_RESULTS, REGISTER, REG_AUTO, REG_MANUAL, CHOOSE_BAND, SET_CHANNEL, WAITLIST, UNREGISTER
+)
 from io import BytesIO
-from PIL import Image
-from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Tuple
 
 router = Router()
 
 # Константы
 VTX_BANDS = ["R", "F", "E"]
 ITEMS_PER_PAGE = 5
+# Inline-поиск: Telegram показывает не больше 50 результатов; короткий кэш — места меняются
+INLINE_RESULTS_LIMIT = 50
+INLINE_CACHE_SECONDS = 5
 
 
-def get_main_menu_keyboard(i18n: I18nContext) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=i18n.buttons.schedule(), callback_data="view_trainings_1")],
-        [InlineKeyboardButton(text=i18n.buttons.search(), callback_data="search_menu")],
-        [InlineKeyboardButton(text=i18n.buttons.register(), callback_data="view_trainings_1")],
-        [InlineKeyboardButton(text=i18n.buttons.cancel(), callback_data="cancel_registration")],
-        [InlineKeyboardButton(text=i18n.buttons.stats(), callback_data="show_stats")],
-        [InlineKeyboardButton(text=i18n.buttons.web(), callback_data="web_schedule")],
-    ])
+# Кэши готовых клавиатур. InlineKeyboardMarkup нигде не изменяется после создания,
+# поэтому один объект безопасно отдавать во все ответы с теми же параметрами.
+_main_menu_cache: Dict[str, InlineKeyboardMarkup] = {}
+_consent_cache: Dict[str, InlineKeyboardMarkup] = {}
 
 
-def get_consent_keyboard(i18n: I18nContext) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=i18n.consent.agree(), callback_data="consent_given")]
-    ])
+def get_main_menu_keyboard(i18n: I18nContext) -> InlineKeyboardMarkup:
+    keyboard = _main_menu_cache.get(i18n.locale)
+    if keyboard is None:
+        keyboard = _main_menu_cache[i18n.locale] = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=i18n.buttons.schedule(), callback_data=VIEW_TRAININGS.pack(1))],
+            [InlineKeyboardButton(text=i18n.buttons.search(), callback_data="search_menu")],
+            [InlineKeyboardButton(text=i18n.buttons.register(), callback_data=VIEW_TRAININGS.pack(1))],
+            [InlineKeyboardButton(text=i18n.buttons.cancel(), callback_data="cancel_registration")],
+            [InlineKeyboardButton(text=i18n.buttons.stats(), callback_data="show_stats")],
+            [InlineKeyboardButton(text=i18n.buttons.web(), callback_data="web_schedule")],
+        ])
+    return keyboard
 
 
-def get_pagination_keyboard(current_page: int, total_pages: int, prefix: str = "view_trainings") -> InlineKeyboardMarkup:
-    """Генерация клавиатуры пагинации"""
+def get_consent_keyboard(i18n: I18nContext) -> InlineKeyboardMarkup:
+    keyboard = _consent_cache.get(i18n.locale)
+    if keyboard is None:
+        keyboard = _consent_cache[i18n.locale] = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=i18n.consent.agree(), callback_data="consent_given")]
+        ])
+    return keyboard
+
+
+def _search_query(city: str = None, date: str = None) -> bytes:
+    """Параметры поиска в хвост кнопки страницы; не помещаются в 64 байта — страницы без фильтра"""
+    query = f"{city or ''}\0{date or ''}".encode()
+    try:
+        SEARCH_RESULTS.pack(1, query)
+    except ValueError:
+        return b"\0"
+    return query
+
+
+@lru_cache(maxsize=1024)
+def get_pagination_keyboard(
+    current_page: int,
+    total_pages: int,
+    is_search: bool = False,
+    back_text: str = "⬅️ Назад",
+    query: bytes = b"\0"
+) -> InlineKeyboardMarkup:
+    """Генерация клавиатуры пагинации (кэшируется по всем параметрам, включая текст локали)"""
     buttons = []
 
+    def page_data(page: int) -> str:
+        return SEARCH_RESULTS.pack(page, query) if is_search else VIEW_TRAININGS.pack(page)
+
     # Кнопки пагинации
     if total_pages > 1:
         row = []
         if current_page > 1:
-            row.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}_{current_page - 1}"))
+            row.append(InlineKeyboardButton(text="⬅️", callback_data=page_data(current_page - 1)))
         row.append(InlineKeyboardButton(text=f"{current_page}/{total_pages}", callback_data="noop"))
         if current_page < total_pages:
-            row.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}_{current_page + 1}"))
+            row.append(InlineKeyboardButton(text="➡️", callback_data=page_data(current_page + 1)))
         buttons.append(row)
 
     # Кнопка назад
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")])
+    buttons.append([InlineKeyboardButton(text=back_text, callback_data="main_menu")])
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=1024)
+def get_register_method_keyboard(training_id: int, auto_text: str, manual_text: str, back_text: str) -> InlineKeyboardMarkup:
+    """Выбор способа подбора канала"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=auto_text, callback_data=REG_AUTO.pack(training_id))],
+        [InlineKeyboardButton(text=manual_text, callback_data=REG_MANUAL.pack(training_id))],
+        [InlineKeyboardButton(text=back_text, callback_data=VIEW_TRAININGS.pack(1))]
+    ])
+
+
+@lru_cache(maxsize=1024)
+def get_band_keyboard(training_id: int, full_bands: Tuple[str, ...], back_text: str) -> InlineKeyboardMarkup:
+    """Выбор Band: полностью занятые диапазоны не показываются"""
+    keyboard = [
+        [InlineKeyboardButton(text=f"Band {band}", callback_data=CHOOSE_BAND.pack(training_id, band))]
+        for band in VTX_BANDS
+        if band not in full_bands
+    ]
+    keyboard.append([InlineKeyboardButton(text=back_text, callback_data=REGISTER.pack(training_id))])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+@lru_cache(maxsize=4096)
+def get_channel_keyboard(training_id: int, band: str, occupied: int, back_text: str) -> InlineKeyboardMarkup:
+    """
+    Выбор канала по 8-битной маске занятости band: занятые каналы скрыты.
+    Ключ кэша — маска, поэтому клавиатура пересобирается только при смене занятости.
+    """
+    free = [
+        InlineKeyboardButton(
+            text=f"{band}{ch} · {VTX_FREQUENCIES[band][ch - 1]}",
+            callback_data=SET_CHANNEL.pack(training_id, band, ch)
+        )
+        for ch in range(1, 9)
+        if not occupied & (1 << (ch - 1))
+    ]
+    keyboard = [free[i:i + 2] for i in range(0, len(free), 2)]
+    keyboard.append([InlineKeyboardButton(text=back_text, callback_data=REG_MANUAL.pack(training_id))])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 @router.message(Command("start"))
 async def start(message: Message, i18n: I18nContext):
     user_id = message.from_user.id
@@ -62,6 +148,16 @@ async def start(message: Message, i18n: I18nContext):
         await ask_consent(message, i18n)
         return
 
+    # Переход из inline-результата: /start reg_<id> — сразу к выбору канала
+    parts = message.text.split(maxsplit=1)
+    payload = parts[1] if len(parts) > 1 else ""
+    if payload.startswith("reg_") and payload[4:].isdigit():
+        reply_markup = get_register_method_keyboard(
+            int(payload[4:]), i18n.register.auto(), i18n.register.manual(), i18n.common.back()
+        )
+        await message.answer(i18n.register.how(), reply_markup=reply_markup)
+        return
+
     await message.answer(
         i18n.start.hello(),
         reply_markup=get_main_menu_keyboard(i18n)
@@ -83,7 +179,9 @@ async def consent_handler(callback: CallbackQuery, i18n: I18nContext):
     username = callback.from_user.username or f"user_{user_id}"
     full_name = callback.from_user.full_name
 
-    await set_user_consent(user_id, username, full_name, "ru")
+    lang = pick_locale(callback.from_user.language_code, i18n.core.available_locales)
+    await set_user_consent(user_id, username, full_name, lang)
+    await i18n.set_locale(lang)
     await callback.message.edit_text(i18n.consent.thanks())
     await callback.answer()
     await start(callback.message, i18n)
@@ -95,47 +193,96 @@ async def set_nickname(message: Message, i18n: I18nContext):
     consent = await get_user_consent(user_id)
 
     if not consent or not consent.get('consent_given'):
-        await message.answer("Сначала дайте согласие: /start")
+        await message.answer(i18n.common.need_consent())
         return
 
     args = message.text.split(maxsplit=1)
     if len(args) < 2:
-        await message.answer("Укажите никнейм: /set_nickname ВашНик")
+        await message.answer(i18n.nickname.usage())
         return
 
     nickname = args[1][:50]
     await set_user_nickname(user_id, nickname)
-    await message.answer(f"✅ Ваш никнейм: {nickname}")
+    await message.answer(i18n.nickname.saved(nickname=nickname))
+
+
+@router.message(Command("language"))
+async def set_language(message: Message, i18n: I18nContext):
+    """Смена языка интерфейса: /language ru|en"""
+    consent = await get_user_consent(message.from_user.id)
+    if not consent or not consent.get('consent_given'):
+        await message.answer(i18n.common.need_consent())
+        return
+
+    args = message.text.split()
+    if len(args) != 2 or args[1] not in i18n.core.available_locales:
+        await message.answer(i18n.language.usage())
+        return
+
+    await i18n.set_locale(args[1])
+    await message.answer(i18n.core.get("language-changed", args[1]))
 
 
 @router.message(Command("delete_me"))
 async def delete_me(message: Message, i18n: I18nContext):
     user_id = message.from_user.id
     await delete_user_data(user_id)
-    await message.answer("🗑️ Все ваши данные удалены. Чтобы вернуться — напишите /start.")
+    i18n.manager.forget(user_id)
+    await message.answer(i18n.delete_me.done())
 
 
-@router.message(Command("my_registrations"))
-async def my_registrations(message: Message, i18n: I18nContext):
-    user_id = message.from_user.id
-    registrations = await fetch('''
-        SELECT t.date, t.time, t.location, r.vtx_band, r.vtx_channel, r.paid
+def _registration_line(reg, i18n: I18nContext) -> str:
+    status = "✅" if reg['paid'] else "⏳"
+    return f"{status} {reg['location']} | 📅 {reg['date']} 🕒 {reg['time']} | 📡 {reg['vtx_band']}{reg['vtx_channel']}"
+
+
+MY_REGISTRATIONS = PagedList(
+    1, "my_registrations", '''
+        SELECT r.id, t.date, t.time, t.location, r.vtx_band, r.vtx_channel, r.paid
         FROM registrations r
         JOIN trainings t ON r.training_id = t.id
-        WHERE r.user_id = $1
-        ORDER BY t.date, t.time
-    ''', user_id)
+        WHERE r.user_id = $1 AND t.date >= $2 {keyset}
+        ORDER BY {order}
+        LIMIT {limit}
+    ''',
+    key=(("t.date", "date"), ("t.time", "time"), ("r.id", "id")),
+    render=_registration_line,
+    title=lambda i18n: i18n.registrations.title(),
+    empty=lambda i18n: i18n.registrations.empty(),
+)
 
-    if not registrations:
-        await message.answer("У вас нет активных записей.")
-        return
 
-    text = "📋 *Ваши записи:*\n\n"
-    for reg in registrations:
-        status = "✅" if reg['paid'] else "⏳"
-        text += f"{status} {reg['location']} | 📅 {reg['date']} 🕒 {reg['time']} | 📡 {reg['vtx_band']}{reg['vtx_channel']}\n"
+@router.message(Command("my_registrations"))
+async def my_registrations(message: Message, i18n: I18nContext):
+    await MY_REGISTRATIONS.answer(message, i18n, message.from_user.id, local_today())
+
 
-    await message.answer(text, parse_mode="Markdown")
+@router.callback_query(MY_REGISTRATIONS.filter())
+async def my_registrations_page(callback: CallbackQuery, i18n: I18nContext, cb):
+    await MY_REGISTRATIONS.turn(callback, i18n, cb, callback.from_user.id, local_today())
+
+
+@router.message(Command("calendar"))
+async def calendar_links(message: Message, i18n: I18nContext):
+    """Ссылки на .ics: личная лента и лента города последней записи"""
+    user_id = message.from_user.id
+    user_url = user_feed_url(user_id)
+    if not user_url:
+        await message.answer(i18n.calendar.unavailable())
+        return
+
+    city = await fetchval('''
+        SELECT t.city FROM registrations_all r
+        JOIN trainings_all t ON r.training_id = t.id
+        WHERE r.user_id = $1
+        ORDER BY r.created_at DESC
+        LIMIT 1
+    ''', user_id)
+    if city:
+        text = i18n.calendar.links(user_url=user_url, city=city, city_url=city_feed_url(city))
+    else:
+        text = i18n.calendar.links_no_city(user_url=user_url)
+    await message.answer(text, disable_web_page_preview=True)
 
 
 @router.message(Command("search"))
@@ -154,18 +301,34 @@ async def search_trainings_cmd(message: Message, i18n: I18nContext):
     await show_trainings_paginated(message, i18n, page=1, city=city, date=date, is_search=True)
 
 
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery, i18n: I18nContext):
+    """@бот запрос — поиск по индексу в памяти (utils/search_index.py), без обращения к БД"""
+    trainings = training_index.search(inline_query.query, limit=INLINE_RESULTS_LIMIT)
+    me = await inline_query.bot.me()
+    results = []
+    for t in trainings:
+        track_label = TRACK_TYPES.get(t['track_type'], "❓")
+        spots = f"{t['current_pilots']}/{t['max_pilots']}"
+        results.append(InlineQueryResultArticle(
+            id=str(t['id']),
+            title=f"{t['city']} | {t['location']}",
+            description=f"📅 {t['date']} 🕒 {t['time']} | {track_label} | 👥 {spots}",
+            input_message_content=InputTextMessageContent(
+                message_text=f"🏙️ {t['city']} | 📍 {t['location']} | 📅 {t['date']} | 🕒 {t['time']} | 🎯 {track_label} | ({spots})"
+            ),
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
+                text=i18n.trainings.register(date=t['date'], time=t['time']),
+                url=f"https://t.me/{me.username}?start=reg_{t['id']}",
+            )]]),
+        ))
+    await inline_query.answer(results, cache_time=INLINE_CACHE_SECONDS, is_personal=True)
+
+
 @router.callback_query(F.data == "search_menu")
 async def search_menu(callback: CallbackQuery, i18n: I18nContext):
     """Меню поиска"""
-    text = (
-        "🔍 *Поиск тренировок*\n\n"
-        "Используйте команду:\n"
-        "`/search город` — поиск по городу\n"
-        "`/search город дата` — поиск по городу и дате\n"
-        "Пример: `/search Москва 2025-06-01`\n\n"
-        "Дата в формате ГГГГ-ММ-ДД"
-    )
-    await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=get_main_menu_keyboard(i18n))
+    await callback.message.edit_text(i18n.search.help(), parse_mode="Markdown", reply_markup=get_main_menu_keyboard(i18n))
 
 
 async def show_trainings_paginated(
@@ -177,31 +340,10 @@ async def show_trainings_paginated(
     is_search: bool = False
 ):
     """Показать тренировки с пагинацией"""
-    # Формируем запрос
-    query = '''
-        SELECT id, city, location, date, time, track_type, current_pilots, max_pilots
-        FROM trainings
-        WHERE 1=1
-    '''
-    params = []
-    param_index = 1
-
-    if city:
-        query += f" AND city ILIKE ${param_index}"
-        params.append(f"%{city}%")
-        param_index += 1
-
-    if date:
-        query += f" AND date = ${param_index}"
-        params.append(date)
-        param_index += 1
-
-    query += " ORDER BY date, time"
-
-    all_trainings = await fetch(query, *params)
+    all_trainings = await search_trainings(city, date)
 
     if not all_trainings:
-        text = "❌ Тренировки не найдены." if is_search else "Нет запланированных тренировок."
+        text = i18n.search.not_found() if is_search else i18n.trainings.empty()
         if isinstance(obj, CallbackQuery):
             await obj.message.edit_text(text)
         else:
@@ -216,7 +358,7 @@ async def show_trainings_paginated(
     trainings = all_trainings[start_idx:end_idx]
 
     # Формируем текст
-    text = "📅 *Доступные тренировки:*\n\n" if not is_search else "🔍 *Результаты поиска:*\n\n"
+    text = f"{i18n.search.title() if is_search else i18n.trainings.title()}\n\n"
     keyboard = []
 
     for t in trainings:
@@ -224,12 +366,12 @@ async def show_trainings_paginated(
         spots = f"({t['current_pilots']}/{t['max_pilots']})"
         text += f"🏙️ {t['city']} | 📍 {t['location']} | 📅 {t['date']} | 🕒 {t['time']} | 🎯 {track_label} | {spots}\n"
 
-        btn_text = f"Записаться: {t['date']} {t['time']}"
-        keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"register_{t['id']}")])
+        btn_text = i18n.trainings.register(date=t['date'], time=t['time'])
+        keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=REGISTER.pack(t['id']))])
 
-    # Клавиатура пагинации
-    prefix = "search_results" if is_search else "view_trainings"
-    pagination_kb = get_pagination_keyboard(page, total_pages, prefix)
+    # Клавиатура пагинации (параметры поиска едут в кнопках страниц)
+    query = _search_query(city, date) if is_search else b"\0"
+    pagination_kb = get_pagination_keyboard(page, total_pages, is_search, i18n.common.back(), query)
     for row in pagination_kb.inline_keyboard:
         keyboard.append(row)
 
@@ -241,90 +383,79 @@ async def show_trainings_paginated(
         await obj.answer(text, reply_markup=reply_markup, parse_mode="Markdown")
 
 
-@router.callback_query(F.data.startswith("view_trainings_"))
-async def view_trainings(callback: CallbackQuery, i18n: I18nContext):
-    page = int(callback.data.split('_')[2])
-    await show_trainings_paginated(callback, i18n, page=page)
-
+@router.callback_query(VIEW_TRAININGS.filter())
+async def view_trainings(callback: CallbackQuery, i18n: I18nContext, cb):
+    await show_trainings_paginated(callback, i18n, page=cb.page)
 
-@router.callback_query(F.data.startswith("search_results_"))
-async def view_search_results(callback: CallbackQuery, i18n: I18nContext):
-    page = int(callback.data.split('_')[2])
-    # В реальном проекте можно сохранить параметры поиска в FSM или передавать в callback_data
-    await show_trainings_paginated(callback, i18n, page=page, is_search=True)
 
+@router.callback_query(SEARCH_RESULTS.filter())
+async def view_search_results(callback: CallbackQuery, i18n: I18nContext, cb):
+    city, _, date = cb.query.decode(errors="replace").partition("\0")
+    await show_trainings_paginated(callback, i18n, page=cb.page, city=city or None, date=date or None, is_search=True)
 
-@router.callback_query(F.data.startswith("register_"))
-async def register_step1(callback: CallbackQuery, i18n: I18nContext):
-    training_id = int(callback.data.split('_')[1])
 
-    keyboard = [
-        [InlineKeyboardButton(text="🎲 Автоматически", callback_data=f"reg_auto_{training_id}")],
-        [InlineKeyboardButton(text="🎛️ Вручную", callback_data=f"reg_manual_{training_id}")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="view_trainings_1")]
-    ]
-    reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+@router.callback_query(REGISTER.filter())
+async def register_step1(callback: CallbackQuery, i18n: I18nContext, cb):
+    training_id = cb.training_id
 
-    await callback.message.edit_text("Как выбрать канал?", reply_markup=reply_markup)
+    reply_markup = get_register_method_keyboard(
+        training_id, i18n.register.auto(), i18n.register.manual(), i18n.common.back()
+    )
+    await callback.message.edit_text(i18n.register.how(), reply_markup=reply_markup)
 
 
-@router.callback_query(F.data.startswith("reg_auto_"))
-async def register_auto(callback: CallbackQuery, i18n: I18nContext):
-    training_id = int(callback.data.split('_')[2])
+@router.callback_query(REG_AUTO.filter())
+async def register_auto(callback: CallbackQuery, i18n: I18nContext, cb):
+    training_id = cb.training_id
     user_id = callback.from_user.id
     username = callback.from_user.username or f"user_{user_id}"
     full_name = callback.from_user.full_name
 
     consent = await get_user_consent(user_id)
     if not consent or not consent.get('consent_given'):
-        await callback.message.edit_text("Сначала дайте согласие: /start")
+        await callback.message.edit_text(i18n.common.need_consent())
         return
 
     nickname = consent.get('nickname') if consent else full_name
 
-    success, message, reg_id = await register_pilot_with_channel(
+    success, reason, reg = await register_pilot_with_channel(
         training_id, user_id, username, nickname
     )
 
-    await callback.message.edit_text(message)
+    await callback.message.edit_text(
+        i18n.get(f"registration-{reason}", **(reg or {})),
+        reply_markup=get_waitlist_keyboard(i18n, training_id, reason)
+    )
 
 
-@router.callback_query(F.data.startswith("reg_manual_"))
-async def register_manual_band(callback: CallbackQuery, i18n: I18nContext):
-    training_id = int(callback.data.split('_')[2])
+@router.callback_query(REG_MANUAL.filter())
+async def register_manual_band(callback: CallbackQuery, i18n: I18nContext, cb):
+    training_id = cb.training_id
 
-    keyboard = [
-        [InlineKeyboardButton(text=f"Band {band}", callback_data=f"choose_band_{training_id}_{band}")]
-        for band in VTX_BANDS
-    ]
-    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"register_{training_id}")])
-    reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    bitmap = await get_channel_bitmap(training_id)
+    full_bands = tuple(band for band in VTX_BANDS if band_occupancy(bitmap, band) == 0xFF)
+    reply_markup = get_band_keyboard(training_id, full_bands, i18n.common.back())
 
-    await callback.message.edit_text("Выберите Band:", reply_markup=reply_markup)
+    await callback.message.edit_text(i18n.register.choose_band(), reply_markup=reply_markup)
 
 
-@router.callback_query(F.data.startswith("choose_band_"))
-async def register_manual_channel(callback: CallbackQuery, i18n: I18nContext):
-    parts = callback.data.split('_')
-    training_id = int(parts[2])
-    band = parts[3]
+@router.callback_query(CHOOSE_BAND.filter())
+async def register_manual_channel(callback: CallbackQuery, i18n: I18nContext, cb):
+    training_id, band = cb.training_id, cb.band
+    if band not in VTX_FREQUENCIES:
+        await callback.answer()
+        return
 
-    keyboard = [
-        [InlineKeyboardButton(text=f"{band}{ch}", callback_data=f"set_channel_{training_id}_{band}_{ch}")]
-        for ch in range(1, 9)
-    ]
-    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"reg_manual_{training_id}")])
-    reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    occupied = band_occupancy(await get_channel_bitmap(training_id), band)
+    reply_markup = get_channel_keyboard(training_id, band, occupied, i18n.common.back())
+    text = i18n.register.choose_channel(band=band) if occupied != 0xFF else i18n.register.band_full(band=band)
 
-    await callback.message.edit_text(f"Выберите канал в Band {band}:", reply_markup=reply_markup)
+    await callback.message.edit_text(text, reply_markup=reply_markup)
 
 
-@router.callback_query(F.data.startswith("set_channel_"))
-async def register_set_channel(callback: CallbackQuery, i18n: I18nContext):
-    parts = callback.data.split('_')
-    training_id = int(parts[2])
-    band = parts[3]
-    channel = int(parts[4])
+@router.callback_query(SET_CHANNEL.filter())
+async def register_set_channel(callback: CallbackQuery, i18n: I18nContext, cb):
+    training_id, band, channel = cb.training_id, cb.band, cb.channel
 
     user_id = callback.from_user.id
     username = callback.from_user.username or f"user_{user_id}"
@@ -332,16 +463,43 @@ async def register_set_channel(callback: CallbackQuery, i18n: I18nContext):
 
     consent = await get_user_consent(user_id)
     if not consent or not consent.get('consent_given'):
-        await callback.message.edit_text("Сначала дайте согласие: /start")
+        await callback.message.edit_text(i18n.common.need_consent())
         return
 
     nickname = consent.get('nickname') if consent else full_name
 
-    success, message, reg_id = await register_pilot_with_channel(
+    success, reason, reg = await register_pilot_with_channel(
         training_id, user_id, username, nickname, band, channel
     )
 
-    await callback.message.edit_text(message)
+    await callback.message.edit_text(
+        i18n.get(f"registration-{reason}", **(reg or {})),
+        reply_markup=get_waitlist_keyboard(i18n, training_id, reason)
+    )
+
+
+def get_waitlist_keyboard(i18n: I18nContext, training_id: int, reason: str):
+    """Кнопка листа ожидания, если мест не осталось (reason — код из register_pilot_with_channel)"""
+    if reason != 'no_seats':
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=i18n.register.waitlist(), callback_data=WAITLIST.pack(training_id))],
+        [InlineKeyboardButton(text=i18n.common.back(), callback_data=VIEW_TRAININGS.pack(1))]
+    ])
+
+
+@router.callback_query(WAITLIST.filter())
+async def waitlist_join(callback: CallbackQuery, i18n: I18nContext, cb):
+    training_id = cb.training_id
+    user_id = callback.from_user.id
+
+    consent = await get_user_consent(user_id)
+    if not consent or not consent.get('consent_given'):
+        await callback.message.edit_text(i18n.common.need_consent())
+        return
+
+    success, reason, position = await join_waitlist(training_id, user_id)
+    await callback.message.edit_text(i18n.get(f"waitlist-{reason}", position=position))
 
 
 @router.callback_query(F.data == "cancel_registration")
@@ -352,36 +510,38 @@ async def cancel_registration(callback: CallbackQuery, i18n: I18nContext):
         SELECT t.id, t.location, t.date, t.time
         FROM registrations r
         JOIN trainings t ON r.training_id = t.id
-        WHERE r.user_id = $1
+        WHERE r.user_id = $1 AND t.date >= $2
         ORDER BY t.date, t.time
-    ''', user_id)
+    ''', user_id, local_today())
 
     if not registrations:
-        await callback.message.edit_text("Вы не записаны ни на одну тренировку.")
+        await callback.message.edit_text(i18n.cancel.empty())
         return
 
     keyboard = []
     for reg in registrations:
-        btn_text = f"Отменить: {reg['date']} {reg['time']} - {reg['location']}"
-        keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"unregister_{reg['id']}")])
+        btn_text = i18n.cancel.button(date=reg['date'], time=reg['time'], location=reg['location'])
+        keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=UNREGISTER.pack(reg['id'], user_id=user_id))])
 
-    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")])
+    keyboard.append([InlineKeyboardButton(text=i18n.common.back(), callback_data="main_menu")])
     reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-    await callback.message.edit_text("Выберите тренировку для отмены:", reply_markup=reply_markup)
+    await callback.message.edit_text(i18n.cancel.choose(), reply_markup=reply_markup)
 
 
-@router.callback_query(F.data.startswith("unregister_"))
-async def unregister_confirm(callback: CallbackQuery, i18n: I18nContext):
-    training_id = int(callback.data.split('_')[1])
+@router.callback_query(UNREGISTER.filter())
+async def unregister_confirm(callback: CallbackQuery, i18n: I18nContext, cb):
+    training_id = cb.training_id
     user_id = callback.from_user.id
 
-    success, message = await unregister_pilot(training_id, user_id)
-    await callback.message.edit_text(message)
+    success, reason = await unregister_pilot(training_id, user_id)
+    await callback.message.edit_text(i18n.get(f"unregister-{reason}"))
 
 
 @router.callback_query(F.data == "web_schedule")
 async def web_schedule(callback: CallbackQuery, i18n: I18nContext):
+    import qrcode  # нужен только здесь — не тянем при старте бота
+
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(SCHEDULE_URL)
     qr.make(fit=True)
@@ -393,10 +553,10 @@ async def web_schedule(callback: CallbackQuery, i18n: I18nContext):
 
     await callback.message.answer_photo(
         photo=bio,
-        caption=f"🌐 Онлайн-расписание:\n{SCHEDULE_URL}"
+        caption=i18n.web.caption(url=SCHEDULE_URL)
     )
 
-    await callback.message.edit_text("QR-код отправлен выше.")
+    await callback.message.edit_text(i18n.web.sent())
 
 
 @router.message(Command("stats"))
@@ -405,24 +565,25 @@ async def show_stats(obj, i18n: I18nContext):  # obj = Message или CallbackQu
     """Показать личную статистику пользователя"""
     user_id = obj.from_user.id if isinstance(obj, Message) else obj.from_user.id
 
-    # Статистика
+    # Статистика за всю историю: прошедшие тренировки лежат в архиве, registrations_all объединяет оба
     total_registrations = await fetchrow('''
-        SELECT COUNT(*) as total FROM registrations WHERE user_id = $1
+        SELECT COUNT(*) as total FROM registrations_all WHERE user_id = $1
     ''', user_id)
 
     paid_registrations = await fetchrow('''
-        SELECT COUNT(*) as paid FROM registrations WHERE user_id = $1 AND paid = 1
+        SELECT COUNT(*) as paid FROM registrations_all WHERE user_id = $1 AND paid = 1
     ''', user_id)
 
     favorite_band = await fetchrow('''
         SELECT vtx_band, COUNT(*) as count
-        FROM registrations
+        FROM registrations_all
         WHERE user_id = $1
         GROUP BY vtx_band
         ORDER BY count DESC
         LIMIT 1
     ''', user_id)
 
+    # Ближайшая тренировка — только предстоящие, архив не нужен
     next_training = await fetchrow('''
         SELECT t.date, t.time, t.location
         FROM registrations r
@@ -430,24 +591,29 @@ async def show_stats(obj, i18n: I18nContext):  # obj = Message или CallbackQu
         WHERE r.user_id = $1 AND t.date >= $2
         ORDER BY t.date, t.time
         LIMIT 1
-    ''', user_id, datetime.now().strftime("%Y-%m-%d"))
+    ''', user_id, local_today())
 
     # Формируем текст
-    text = "📊 *Ваша статистика:*\n\n"
-    text += f"📝 Всего записей: {total_registrations['total']}\n"
-    text += f"💰 Оплачено: {paid_registrations['paid']}\n"
+    lines = [
+        f"{i18n.stats.title()}\n",
+        i18n.stats.total(total=total_registrations['total']),
+        i18n.stats.paid(paid=paid_registrations['paid']),
+    ]
 
     if favorite_band and favorite_band['vtx_band']:
-        text += f"📡 Любимый Band: {favorite_band['vtx_band']} ({favorite_band['count']} раз)\n"
+        lines.append(i18n.stats.favorite_band(band=favorite_band['vtx_band'], count=favorite_band['count']))
 
     if next_training:
-        text += f"🚀 Ближайшая тренировка: {next_training['location']} ({next_training['date']} в {next_training['time']})\n"
+        lines.append(i18n.stats.next(
+            location=next_training['location'], date=next_training['date'], time=next_training['time']
+        ))
     else:
-        text += "🚀 Ближайших тренировок не запланировано\n"
+        lines.append(i18n.stats.no_next())
+    text = "\n".join(lines) + "\n"
 
     # Кнопка назад
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")]
+        [InlineKeyboardButton(text=i18n.common.back(), callback_data="main_menu")]
     ])
 
     if isinstance(obj, CallbackQuery):
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, List, Tuple
+
+from aiogram import Bot
+
+from .database.db import claim_pending_notifications
+from .utils.metrics import STARTUP_PHASE_SECONDS
+from .utils.scheduler import deliver_notifications
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Запуск и остановка процесса бота: замер фаз старта и единственный проход
+    по шагам остановки в заданном порядке (повторный вызов shutdown — no-op).
+    """
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.phases: List[Tuple[str, float]] = []
+        self._shutdown_steps: List[Tuple[str, Callable[[], Awaitable]]] = []
+        self._stopping = False
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+        STARTUP_PHASE_SECONDS.labels(name).set(seconds)
+
+    def report(self):
+        total = time.perf_counter() - self.started_at
+        STARTUP_PHASE_SECONDS.labels('total').set(total)
+        parts = " | ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.phases)
+        logger.info(f"⏱️ Старт за {total * 1000:.0f} мс: {parts}")
+
+    def on_shutdown(self, name: str, step: Callable[[], Awaitable]):
+        """Шаги выполняются в порядке регистрации"""
+        self._shutdown_steps.append((name, step))
+
+    async def shutdown(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        logger.info("🛑 Bot shutting down...")
+        for name, step in self._shutdown_steps:
+            start = time.perf_counter()
+            try:
+                await step()
+            except Exception as e:
+                logger.error(f"❌ Shutdown step '{name}' failed: {e}")
+            else:
+                logger.info(f"✅ {name} ({(time.perf_counter() - start) * 1000:.0f} мс)")
+
+
+async def drain_outbox(bot: Bot, timeout: float):
+    """Дослать накопившиеся уведомления из outbox перед закрытием пула"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        notifications = await claim_pending_notifications()
+        if not notifications:
+            return
+        await deliver_notifications(bot, notifications)
+    logger.warning("⚠️ Outbox не опустошён за отведённое время — остаток уйдёт после перезапуска")
+
+
+async def wait_or_timeout(awaitable: Awaitable, timeout: float, what: str):
+    try:
+        await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ {what}: не завершено за {timeout:.0f} с")
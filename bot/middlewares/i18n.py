@@ -7,10 +7,10 @@ class ACLMiddleware(BaseMiddleware):
         self,
         handler: Callable[[Union[Message, CallbackQuery], Dict[str, Any]], Awaitable[Any]],
         event: Union[Message, CallbackQuery],
-        data: Dict[str, Any]  # ← ДОБАВЬТЕ ЭТОТ ПАРАМЕТР!
+        data: Dict[str, Any]
     ) -> Any:
-        user = data.get("event_from_user")
-        if user:
-            # Можно брать язык из БД или оставить "ru" по умолчанию
-            data["locale"] = "ru"
+        # Локаль уже определена I18nMiddleware по user_consent.lang
+        i18n = data.get("i18n")
+        if i18n:
+            data["locale"] = i18n.locale
         return await handler(event, data)
\ No newline at end of file
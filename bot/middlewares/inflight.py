@@ -0,0 +1,31 @@
+import asyncio
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from typing import Any, Awaitable, Callable, Dict
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Счётчик апдейтов в обработке; outer-middleware dp.update, нужен для остановки без потерь"""
+
+    def __init__(self):
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if self.count == 0:
+                self._idle.set()
+
+    async def wait_idle(self):
+        await self._idle.wait()
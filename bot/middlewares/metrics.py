@@ -0,0 +1,99 @@
+import time
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import Message, CallbackQuery
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST
+from typing import Any, Awaitable, Callable, Dict, Union
+from ..config import SENTRY_DSN
+from ..utils.callbacks import action_name
+from ..utils.metrics import (
+    HANDLER_DURATION, TELEGRAM_API_DURATION, HTTP_REQUEST_DURATION, callback_key, render_metrics
+)
+
+if SENTRY_DSN:
+    import sentry_sdk
+else:
+    sentry_sdk = None
+
+
+def event_key(event: Union[Message, CallbackQuery]) -> str:
+    """Метка апдейта: действие кодека или префикс callback_data, команда или тип сообщения"""
+    if isinstance(event, CallbackQuery):
+        return action_name(event.data) or callback_key(event.data)
+    if isinstance(event, Message):
+        if event.text and event.text.startswith('/'):
+            return event.text.split()[0].split('@')[0]
+        return str(event.content_type)
+    return type(event).__name__
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Гистограмма времени хендлеров; регистрируется как inner-middleware роутера.
+    При включённом Sentry открывает транзакцию — в неё попадают span'ы запросов к БД.
+    """
+
+    def __init__(self, router_name: str):
+        self.router_name = router_name
+
+    async def __call__(
+        self,
+        handler: Callable[[Union[Message, CallbackQuery], Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any]
+    ) -> Any:
+        key = event_key(event)
+        start = time.perf_counter()
+        try:
+            if sentry_sdk is None:
+                return await handler(event, data)
+            # Сэмплирование решает traces_sample_rate из sentry_sdk.init
+            with sentry_sdk.start_transaction(op="bot.update", name=f"{self.router_name}:{key}"):
+                return await handler(event, data)
+        finally:
+            HANDLER_DURATION.labels(self.router_name, key).observe(time.perf_counter() - start)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Время исходящих вызовов Bot API (send_message, edit_message_text, ...)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            TELEGRAM_API_DURATION.labels(type(method).__name__, status).observe(time.perf_counter() - start)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """GET /metrics для aiohttp-сервера бота"""
+    return web.Response(body=render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+@web.middleware
+async def http_metrics_middleware(request: web.Request, handler):
+    """http_request_duration_seconds для маршрутов aiohttp (вебхуки Telegram и платежей)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        route = request.match_info.route.resource
+        path = route.canonical if route is not None else "unmatched"
+        HTTP_REQUEST_DURATION.labels(request.method, path, status).observe(time.perf_counter() - start)
@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, Union
+from ..config import THROTTLE_RATE, THROTTLE_BURST
+from ..utils.metrics import THROTTLED_UPDATES, THROTTLE_BUCKETS
+from .metrics import event_key
+
+# Цена апдейта в токенах по метке event_key (префикс callback_data или команда).
+# Дороже — то, что пишет в БД или считает агрегаты; 0 — без учёта (ответ без обращения к БД)
+HANDLER_COSTS: Dict[str, float] = {
+    "noop": 0,
+    "main_menu": 0.5,
+    "search_menu": 0.5,
+    "view_trainings": 1,
+    "search_results": 1,
+    "register": 1,
+    "reg_manual": 1,
+    "choose_band": 1,
+    "reg_auto": 3,
+    "set_channel": 3,
+    "waitlist": 3,
+    "unregister": 3,
+    "refund": 3,
+    "list_page": 1,
+    "cancel_registration": 2,
+    "show_stats": 2,
+    "web_schedule": 2,
+    "/stats": 2,
+    "/search": 2,
+    "/my_registrations": 2,
+    "/calendar": 2,
+    "/roster": 2,
+    "/cancel_training": 5,
+    "/delete_me": 5,
+}
+DEFAULT_COST = 1
+
+# Повтор того же callback (двойное нажатие, повторная доставка) в этом окне не обрабатывается
+DUPLICATE_WINDOW = 1.0
+# Потолок ключей в памяти (ведра пользователей и недавние callback-и)
+MAX_KEYS = 100000
+
+
+class TokenBuckets:
+    """
+    Ведро токенов на ключ: rate токенов в секунду, не больше burst. Хранится пара (токены, время)
+    в порядке последнего обращения; ведро, простоявшее дольше burst / rate, снова полное —
+    такие записи выбрасываются с головы при каждом обращении (амортизированно O(1)).
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.refill_time = burst / rate
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _expire(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            _, (_, updated) = next(iter(buckets.items()))
+            if now - updated < self.refill_time and len(buckets) <= self.max_keys:
+                break
+            buckets.popitem(last=False)
+
+    def take(self, key: Hashable, cost: float) -> bool:
+        """Списать cost токенов; False — ведро пусто (токены не списываются)"""
+        now = self.clock()
+        self._expire(now)
+        state = self._buckets.pop(key, None)
+        tokens = self.burst if state is None else min(self.burst, state[0] + (now - state[1]) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        return allowed
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Защита от флуда: outer-middleware dp.message и dp.callback_query, до фильтров и хендлеров с запросами к БД.
+    Отброшенный или повторный callback гасится callback.answer() без обращения к БД; сообщения отбрасываются молча.
+    Ведра — в памяти процесса: при нескольких bot.worker лимит действует в каждом процессе отдельно.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST,
+                 costs: Dict[str, float] = None, clock: Callable[[], float] = time.monotonic):
+        self.costs = HANDLER_COSTS if costs is None else costs
+        self.clock = clock
+        self.buckets = TokenBuckets(rate, burst, clock=clock)
+        self._recent: "OrderedDict[Tuple[int, Any, str], float]" = OrderedDict()
+        THROTTLE_BUCKETS.set_function(lambda: len(self.buckets))
+
+    def _duplicate(self, event: CallbackQuery, now: float) -> bool:
+        message_id = event.message.message_id if event.message else event.inline_message_id
+        key = (event.from_user.id, message_id, event.data or "")
+        recent = self._recent
+        while recent:
+            _, seen = next(iter(recent.items()))
+            if now - seen < DUPLICATE_WINDOW and len(recent) <= MAX_KEYS:
+                break
+            recent.popitem(last=False)
+        if key in recent:
+            return True
+        recent[key] = now
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[Union[Message, CallbackQuery], Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any]
+    ) -> Any:
+        user = event.from_user
+        if user is None:
+            return await handler(event, data)
+
+        key = event_key(event)
+        cost = self.costs.get(key, DEFAULT_COST)
+        kind = "callback" if isinstance(event, CallbackQuery) else "message"
+        reason = None
+        if kind == "callback" and self._duplicate(event, self.clock()):
+            reason = "duplicate"
+        elif cost and not self.buckets.take(user.id, cost):
+            reason = "flood"
+
+        if reason is None:
+            return await handler(event, data)
+
+        THROTTLED_UPDATES.labels(kind, key, reason).inc()
+        if kind == "callback":
+            i18n = data.get("i18n")
+            text = i18n.common.too_fast() if i18n and reason == "flood" else None
+            await event.answer(text)
+        return None
@@ -0,0 +1,151 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+from collections import namedtuple
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery
+
+from ..config import API_KEY, BOT_TOKEN
+
+# ========================
+# Компактная подписанная callback_data
+# ========================
+# Формат: «~» + код действия (1 символ) + base64url(поля struct | хвост | подпись) без «=».
+# Подпись — SIGNATURE_BYTES байт keyed BLAKE2s (MAC без двойного хеширования HMAC) от кода и тела; для личных действий
+# (возврат, отмена записи) в неё входит user_id нажавшего — чужую кнопку не подделать и не переслать.
+# Разбор — одна проверка префикса, base64 и struct.unpack, без split('_').
+# Хвост (bytes переменной длины) — для курсоров и параметров поиска; всё вместе ≤ 64 байт Telegram.
+
+CALLBACK_PREFIX = "~"
+SIGNATURE_BYTES = 6
+MAX_CALLBACK_DATA = 64
+
+# Ключ подписи — секрет веб-админки, без него — токен бота. Без обоих ключ публичен и любую кнопку
+# (возврат, отмена чужой записи) можно подделать — модуль не загружается, бот не стартует
+_SECRET = API_KEY or BOT_TOKEN
+if not _SECRET:
+    raise RuntimeError("callback_data: не заданы ни API_KEY, ни BOT_TOKEN")
+_KEY = hashlib.sha256(f"callback_data:{_SECRET}".encode()).digest()
+_USER = struct.Struct(">q")
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class CallbackAction:
+    """
+    Тип кнопки: code — символ после «~», fields — пары (имя, формат struct); формат «c» — один символ str.
+    tail — имя поля-хвоста (bytes), personal — подпись привязана к пользователю.
+    """
+
+    def __init__(self, code: str, name: str, fields: Sequence[Tuple[str, str]] = (),
+                 tail: Optional[str] = None, personal: bool = False):
+        self.code = code
+        self.name = name
+        self.prefix = CALLBACK_PREFIX + code
+        self.personal = personal
+        self.tail = tail
+        self._struct = struct.Struct(">" + "".join(fmt for _, fmt in fields))
+        self._chars = tuple(i for i, (_, fmt) in enumerate(fields) if fmt == "c")
+        self._mac = hashlib.blake2s(code.encode(), digest_size=SIGNATURE_BYTES, key=_KEY)
+        self.type = namedtuple(name, [field for field, _ in fields] + ([tail] if tail else []))
+
+    def _sign(self, body: bytes, user_id: Optional[int]) -> bytes:
+        mac = self._mac.copy()
+        mac.update(body)
+        if self.personal:
+            mac.update(_USER.pack(user_id or 0))
+        return mac.digest()
+
+    def pack(self, *values: Any, user_id: Optional[int] = None) -> str:
+        """callback_data для кнопки; для personal обязателен user_id того, кому кнопка показана"""
+        values = list(values)
+        tail = b""
+        if self.tail:
+            tail = values.pop()
+            tail = tail.encode() if isinstance(tail, str) else tail
+        for i in self._chars:
+            values[i] = values[i].encode()
+        body = self._struct.pack(*values) + tail
+        data = self.prefix + _b64encode(body + self._sign(body, user_id))
+        if len(data.encode()) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data {self.name}: {len(data.encode())} > {MAX_CALLBACK_DATA} байт")
+        return data
+
+    def unpack(self, data: Optional[str], user_id: Optional[int] = None):
+        """Поля кнопки или None, если это другая кнопка, данные повреждены или подпись не сходится"""
+        if not data or not data.startswith(self.prefix):
+            return None
+        try:
+            raw = _b64decode(data[2:])
+        except (binascii.Error, ValueError):
+            return None
+        body, signature = raw[:-SIGNATURE_BYTES], raw[-SIGNATURE_BYTES:]
+        size = self._struct.size
+        if len(body) < size or (len(body) > size and not self.tail):
+            return None
+        if not hmac.compare_digest(signature, self._sign(body, user_id)):
+            return None
+        values = list(self._struct.unpack_from(body))
+        for i in self._chars:
+            values[i] = values[i].decode(errors="replace")
+        if self.tail:
+            values.append(body[size:])
+        return self.type(*values)
+
+    def filter(self) -> "CallbackActionFilter":
+        return CallbackActionFilter(self)
+
+
+class CallbackActionFilter(Filter):
+    """Фильтр хендлера: разобранные поля кнопки передаются в аргумент cb"""
+
+    def __init__(self, action: CallbackAction):
+        self.action = action
+
+    async def __call__(self, callback: CallbackQuery) -> Union[bool, Dict[str, Any]]:
+        cb = self.action.unpack(callback.data, callback.from_user.id)
+        return False if cb is None else {"cb": cb}
+
+
+ACTIONS: Dict[str, CallbackAction] = {}
+
+
+def action(code: str, name: str, fields: Sequence[Tuple[str, str]] = (), **kwargs) -> CallbackAction:
+    if code in ACTIONS:
+        raise ValueError(f"Код callback {code!r} уже занят: {ACTIONS[code].name}")
+    ACTIONS[code] = CallbackAction(code, name, fields, **kwargs)
+    return ACTIONS[code]
+
+
+def action_name(data: str) -> Optional[str]:
+    """Имя действия по callback_data кодека (метки метрик и цены антифлуда); None — не кодек"""
+    if data and data.startswith(CALLBACK_PREFIX) and len(data) > 1:
+        found = ACTIONS.get(data[1])
+        return found.name if found else "unknown"
+    return None
+
+
+# Кнопки бота. Коды не меняются: уже отправленные кнопки должны разбираться и после обновления
+VIEW_TRAININGS = action("p", "view_trainings", [("page", "H")])
+SEARCH_RESULTS = action("s", "search_results", [("page", "H")], tail="query")  # хвост: город \0 дата
+REGISTER = action("r", "register", [("training_id", "I")])
+REG_AUTO = action("a", "reg_auto", [("training_id", "I")])
+REG_MANUAL = action("m", "reg_manual", [("training_id", "I")])
+CHOOSE_BAND = action("b", "choose_band", [("training_id", "I"), ("band", "c")])
+SET_CHANNEL = action("c", "set_channel", [("training_id", "I"), ("band", "c"), ("channel", "B")])
+WAITLIST = action("w", "waitlist", [("training_id", "I")])
+UNREGISTER = action("u", "unregister", [("training_id", "I")], personal=True)
+REFUND = action("R", "refund", [("registration_id", "I")], personal=True)
+# Страница длинного списка (utils/paging.py): хвост — ключ строки, от которой листать
+LIST_PAGE = action("l", "list_page", [("list_id", "B"), ("direction", "c"), ("page", "H")],
+                   tail="cursor", personal=True)
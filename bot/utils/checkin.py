@@ -0,0 +1,115 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+from collections import namedtuple
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..config import API_KEY, BOT_TOKEN
+
+# ========================
+# Подписанные токены отметки на тренировке (QR в чеке)
+# ========================
+# Токен: «fpv1.» + base64url(registration_id, training_id, user_id | метка TAG_BYTES байт).
+# Метка — keyed BLAKE2s от полей: подделать или перенести токен на другую тренировку нельзя,
+# а проверка подписи не требует БД. Для проверки без сети организатор заранее скачивает ростер
+# тренировки: id записей и их метки — сканер сверяет метку из QR с ростером, ключ на устройство
+# не попадает. Отметки копятся на устройстве и загружаются пачкой, когда появится связь.
+
+TOKEN_PREFIX = "fpv1."
+TAG_BYTES = 8
+# Сканов в одной загрузке (больше — устройство шлёт несколькими пачками)
+MAX_BATCH = 500
+
+_KEY = hashlib.sha256(f"checkin:{API_KEY or BOT_TOKEN or ''}".encode()).digest()
+_FIELDS = struct.Struct(">IIq")
+
+CheckinToken = namedtuple("CheckinToken", "registration_id training_id user_id tag")
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _tag(body: bytes) -> bytes:
+    return hashlib.blake2s(body, digest_size=TAG_BYTES, key=_KEY).digest()
+
+
+def checkin_tag(registration_id: int, training_id: int, user_id: int) -> str:
+    """Метка записи для ростера (та же, что в QR чека)"""
+    return _b64encode(_tag(_FIELDS.pack(registration_id, training_id, user_id)))
+
+
+def issue_token(registration_id: int, training_id: int, user_id: int) -> str:
+    """Строка для QR-кода чека — 37 символов"""
+    body = _FIELDS.pack(registration_id, training_id, user_id)
+    return TOKEN_PREFIX + _b64encode(body + _tag(body))
+
+
+def read_token(token: str) -> Optional[CheckinToken]:
+    """Поля токена или None, если это не наш токен или подпись не сходится"""
+    if not token or not token.startswith(TOKEN_PREFIX):
+        return None
+    text = token[len(TOKEN_PREFIX):].strip()
+    try:
+        raw = base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) != _FIELDS.size + TAG_BYTES:
+        return None
+    body, tag = raw[:_FIELDS.size], raw[_FIELDS.size:]
+    if not hmac.compare_digest(tag, _tag(body)):
+        return None
+    return CheckinToken(*_FIELDS.unpack(body), _b64encode(tag))
+
+
+def build_roster(training: Dict[str, Any], registrations: Iterable[Dict[str, Any]],
+                 generated_at: datetime) -> Dict[str, Any]:
+    """Ростер для проверки без сети: на каждую запись — метка, ник, канал, оплата и отметка"""
+    return {
+        "version": 1,
+        "training": {
+            "id": training['id'], "city": training['city'], "location": training['location'],
+            "date": training['date'], "time": training['time'],
+        },
+        "generated_at": generated_at.isoformat(),
+        "prefix": TOKEN_PREFIX,
+        "pilots": [{
+            "registration_id": r['id'],
+            "tag": checkin_tag(r['id'], training['id'], r['user_id']),
+            "name": r['display_name'],
+            "channel": f"{r['vtx_band']}{r['vtx_channel']}",
+            "paid": bool(r['paid']),
+            "checked_in_at": r['checked_in_at'].isoformat() if r['checked_in_at'] else None,
+        } for r in registrations],
+    }
+
+
+def parse_scans(training_id: int, scans: Iterable[Any], now: datetime) -> Tuple[Dict[int, datetime], List[Dict[str, Any]]]:
+    """
+    Пачка сканов с устройства: [{"token": ..., "scanned_at": ISO-время}] → {registration_id: время}
+    (при повторе — самое раннее) и отклонённые сканы с причиной. БД не нужна.
+    """
+    accepted: Dict[int, datetime] = {}
+    rejected: List[Dict[str, Any]] = []
+    for scan in scans:
+        token = scan.get("token") if isinstance(scan, dict) else None
+        parsed = read_token(token) if isinstance(token, str) else None
+        if parsed is None:
+            rejected.append({"token": token, "reason": "invalid"})
+            continue
+        if parsed.training_id != training_id:
+            rejected.append({"token": token, "reason": "other_training"})
+            continue
+        try:
+            scanned_at = datetime.fromisoformat(scan["scanned_at"]) if scan.get("scanned_at") else now
+        except (TypeError, ValueError):
+            scanned_at = now
+        if scanned_at.tzinfo is None:
+            scanned_at = scanned_at.replace(tzinfo=now.tzinfo)
+        scanned_at = min(scanned_at, now)  # часы устройства могут спешить
+        previous = accepted.get(parsed.registration_id)
+        accepted[parsed.registration_id] = scanned_at if previous is None else min(previous, scanned_at)
+    return accepted, rejected
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from aiogram import Dispatcher
+from aiogram.types import User
+from aiogram_i18n import I18nMiddleware
+from aiogram_i18n.cores import BaseCore
+from aiogram_i18n.exceptions import NoLocalesError
+from aiogram_i18n.managers import BaseManager
+
+from ..config import I18N_CACHE_PATH
+from ..database.db import get_user_consent, set_user_lang
+
+logger = logging.getLogger(__name__)
+
+LOCALES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "localization")
+DEFAULT_LOCALE = "ru"
+# aiogram_i18n собирает ключ из атрибутов через "-": i18n.buttons.schedule() → "buttons-schedule"
+KEY_SEPARATOR = "-"
+# Сколько пользователей держать в кэше локалей и сколько секунд доверять записи:
+# /language в одном процессе-обработчике доходит до остальных не позже чем через TTL
+LOCALE_CACHE_SIZE = 10000
+LOCALE_CACHE_TTL = 30
+
+# Скомпилированное сообщение: (шаблон, нужна ли подстановка аргументов)
+CompiledMessage = Tuple[str, bool]
+
+
+def _flatten(tree: Dict[str, Any], prefix: str = "") -> Dict[str, str]:
+    """Развернуть вложенный YAML в плоский словарь ключ → текст"""
+    flat = {}
+    for key, value in tree.items():
+        full_key = f"{prefix}{KEY_SEPARATOR}{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, full_key))
+        else:
+            flat[full_key] = str(value)
+    return flat
+
+
+def _source_files(path: str) -> Dict[str, int]:
+    """YAML-файлы локалей и время их изменения (для проверки дискового кэша)"""
+    return {
+        name: os.stat(os.path.join(path, name)).st_mtime_ns
+        for name in sorted(os.listdir(path))
+        if name.endswith((".yaml", ".yml"))
+    }
+
+
+def _load_cache(path: str, sources: Dict[str, int]) -> Optional[Dict[str, Dict[str, str]]]:
+    if not I18N_CACHE_PATH or not os.path.exists(I18N_CACHE_PATH):
+        return None
+    try:
+        with open(I18N_CACHE_PATH, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("path") != path or cached.get("sources") != sources:
+        return None
+    return cached["locales"]
+
+
+def _save_cache(path: str, sources: Dict[str, int], locales: Dict[str, Dict[str, str]]):
+    if not I18N_CACHE_PATH:
+        return
+    try:
+        tmp_path = f"{I18N_CACHE_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"path": path, "sources": sources, "locales": locales}, f, ensure_ascii=False)
+        os.replace(tmp_path, I18N_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить кэш локалей: {e}")
+
+
+def load_locales(path: str = LOCALES_PATH) -> Dict[str, Dict[str, str]]:
+    """Прочитать все {locale}.yaml (или дисковый кэш, если YAML не менялись)"""
+    sources = _source_files(path)
+    locales = _load_cache(path, sources)
+    if locales is not None:
+        return locales
+
+    import yaml  # тяжёлый импорт нужен только при промахе кэша
+
+    locales = {}
+    for name in sources:
+        with open(os.path.join(path, name), encoding="utf-8") as f:
+            locales[name.rsplit(".", 1)[0]] = _flatten(yaml.safe_load(f) or {})
+    _save_cache(path, sources, locales)
+    return locales
+
+
+def compile_messages(messages: Dict[str, str]) -> Dict[str, CompiledMessage]:
+    """Предкомпиляция: строки без подстановок отдаются как есть, без format_map"""
+    return {key: (text, "{" in text) for key, text in messages.items()}
+
+
+class CompiledYamlCore(BaseCore[Dict[str, CompiledMessage]]):
+    """Ядро aiogram_i18n поверх заранее скомпилированных YAML-словарей"""
+
+    def __init__(self, path: str = LOCALES_PATH, default_locale: str = DEFAULT_LOCALE):
+        super().__init__(path=path, default_locale=default_locale)
+        self.path = path
+        self.locales = self.find_locales()
+
+    def find_locales(self) -> Dict[str, Dict[str, CompiledMessage]]:
+        locales = {locale: compile_messages(messages) for locale, messages in load_locales(self.path).items()}
+        if not locales:
+            raise NoLocalesError
+        return locales
+
+    async def startup(self) -> None:
+        # Локали уже скомпилированы в __init__, повторно YAML не читаем
+        if not self.locales:
+            self.locales = self.find_locales()
+
+    def get(self, message: str, locale: Optional[str] = None, /, **kwargs: Any) -> str:
+        compiled = self.locales.get(locale or self.default_locale)
+        entry = compiled.get(message) if compiled else None
+        if entry is None:
+            entry = self.locales[self.default_locale].get(message)
+            if entry is None:
+                return message
+        text, needs_format = entry
+        return text.format_map(kwargs) if needs_format else text
+
+
+class ConsentLocaleManager(BaseManager):
+    """Локаль пользователя из user_consent.lang с LRU-кэшем в памяти (записи живут LOCALE_CACHE_TTL)"""
+
+    def __init__(self, available_locales: Tuple[str, ...], default_locale: str = DEFAULT_LOCALE):
+        super().__init__(default_locale=default_locale)
+        self.available_locales = available_locales
+        self._cache: "OrderedDict[int, Tuple[float, str]]" = OrderedDict()
+
+    def _remember(self, user_id: int, locale: str):
+        self._cache[user_id] = (time.monotonic() + LOCALE_CACHE_TTL, locale)
+        self._cache.move_to_end(user_id)
+        if len(self._cache) > LOCALE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def forget(self, user_id: int):
+        """Сбросить кэш (например, после /delete_me)"""
+        self._cache.pop(user_id, None)
+
+    async def get_locale(self, event_from_user: Optional[User] = None, **kwargs: Any) -> str:
+        if event_from_user is None:
+            return self.default_locale
+        cached = self._cache.get(event_from_user.id)
+        locale = cached[1] if cached and cached[0] > time.monotonic() else None
+        if locale is None:
+            consent = await get_user_consent(event_from_user.id)
+            locale = consent['lang'] if consent and consent['lang'] else self.default_locale
+            if locale not in self.available_locales:
+                locale = self.default_locale
+            self._remember(event_from_user.id, locale)
+        return locale
+
+    async def set_locale(self, locale: str, event_from_user: User, **kwargs: Any) -> None:
+        await set_user_lang(event_from_user.id, locale)
+        self._remember(event_from_user.id, locale)
+
+
+_core: Optional[CompiledYamlCore] = None
+
+
+def get_core() -> CompiledYamlCore:
+    """Ядро локалей процесса: одно на диспетчер и фоновые отправки вне апдейта"""
+    global _core
+    if _core is None:
+        _core = CompiledYamlCore()
+    return _core
+
+
+async def user_locale(user_id: int) -> str:
+    """Язык пользователя из user_consent.lang (для сообщений вне апдейта: чеки, вебхуки платёжек)"""
+    consent = await get_user_consent(user_id)
+    locale = consent['lang'] if consent and consent['lang'] else DEFAULT_LOCALE
+    return locale if locale in get_core().available_locales else DEFAULT_LOCALE
+
+
+def translate(key: str, locale: Optional[str], **params: Any) -> str:
+    return get_core().get(key, locale, **params)
+
+
+def render_message(lines: Iterable[Sequence[Any]], locale: Optional[str]) -> str:
+    """Сообщение из outbox — строки [ключ, параметры] — на языке получателя"""
+    return "\n".join(translate(key, locale, **params) for key, params in lines)
+
+
+def pick_locale(language_code: Optional[str], available_locales: Tuple[str, ...]) -> str:
+    """Локаль по language_code из Telegram (en-US → en), иначе локаль по умолчанию"""
+    if language_code:
+        code = language_code.split("-")[0].lower()
+        if code in available_locales:
+            return code
+    return DEFAULT_LOCALE
+
+
+def setup_i18n(dp: Dispatcher) -> I18nMiddleware:
+    """Подключить локализацию к диспетчеру"""
+    core = get_core()
+    manager = ConsentLocaleManager(core.available_locales)
+    middleware = I18nMiddleware(core=core, manager=manager, default_locale=DEFAULT_LOCALE)
+    middleware.setup(dp)
+    logger.info(f"✅ Загруженные локали: {list(core.available_locales)}")
+    return middleware
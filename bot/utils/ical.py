@@ -0,0 +1,115 @@
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from urllib.parse import quote, urljoin
+
+import pytz
+
+from ..config import API_KEY, SCHEDULE_URL, TIMEZONE
+
+# ========================
+# iCalendar (RFC 5545): ссылки-подписки и генерация VEVENT
+# ========================
+# Общий модуль бота и веба: бот выдаёт ссылку, веб отдаёт ленту.
+# Токен личной ленты — user_id + HMAC(API_KEY), без хранения в БД; смена API_KEY отзывает все ссылки.
+
+TRAINING_DURATION = timedelta(hours=2)  # в trainings нет времени окончания
+PRODID = "-//FPV Training Platform//Schedule//RU"
+
+_tz = pytz.timezone(TIMEZONE)
+
+
+def _signature(user_id: int) -> str:
+    return hmac.new(API_KEY.encode(), f"ical:{user_id}".encode(), hashlib.sha256).hexdigest()[:20]
+
+
+def feed_token(user_id: int) -> Optional[str]:
+    """None — API_KEY не задан, личные ленты выключены"""
+    if not API_KEY:
+        return None
+    return f"{user_id}-{_signature(user_id)}"
+
+
+def verify_feed_token(token: str) -> Optional[int]:
+    if not API_KEY:
+        return None
+    user_part, _, signature = token.partition("-")
+    if not user_part.isdigit() or not hmac.compare_digest(signature, _signature(int(user_part))):
+        return None
+    return int(user_part)
+
+
+def user_feed_url(user_id: int) -> Optional[str]:
+    token = feed_token(user_id)
+    return urljoin(SCHEDULE_URL, f"/calendar/user/{token}.ics") if token else None
+
+
+def city_feed_url(city: str) -> str:
+    return urljoin(SCHEDULE_URL, f"/calendar/city/{quote(city)}.ics")
+
+
+def _escape(value: str) -> str:
+    return (str(value).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: str) -> str:
+    """Строки длиннее 75 октетов переносятся (CRLF + пробел), не разрывая UTF-8 символ"""
+    raw = line.encode()
+    if len(raw) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(raw):
+        end = min(start + limit, len(raw))
+        while end < len(raw) and (raw[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(raw[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _utc(dt: datetime) -> str:
+    return dt.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def calendar_header(name: str) -> str:
+    return "".join(_fold(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+        f"X-WR-TIMEZONE:{TIMEZONE}",
+        "REFRESH-INTERVAL;VALUE=DURATION:PT1H",
+    ))
+
+
+def calendar_footer() -> str:
+    return "END:VCALENDAR\r\n"
+
+
+def training_event(row: Dict[str, Any], track_label: str, description: str = "") -> str:
+    """VEVENT тренировки; row — id, city, location, date, time, updated_at. Строка с битой датой пропускается"""
+    try:
+        start = _tz.localize(datetime.strptime(f"{row['date']} {row['time']}", "%Y-%m-%d %H:%M"))
+    except ValueError:
+        return ""
+    updated = row.get("updated_at") or datetime.now(pytz.utc)
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:training-{row['id']}@fpv-training-platform",
+        f"DTSTAMP:{_utc(updated)}",
+        f"LAST-MODIFIED:{_utc(updated)}",
+        f"SEQUENCE:{int(updated.timestamp())}",
+        f"DTSTART:{_utc(start)}",
+        f"DTEND:{_utc(start + TRAINING_DURATION)}",
+        "SUMMARY:" + _escape(f"FPV: {track_label} — {row['location']}"),
+        "LOCATION:" + _escape(f"{row['location']}, {row['city']}"),
+        f"URL:{SCHEDULE_URL}",
+    ]
+    if description:
+        lines.append(f"DESCRIPTION:{_escape(description)}")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) for line in lines)
@@ -0,0 +1,130 @@
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# ========================
+# Метрики бота и веба (общий реестр процесса)
+# ========================
+
+STARTUP_PHASE_SECONDS = Gauge(
+    'bot_startup_phase_seconds',
+    'Длительность фаз запуска процесса (total — от старта интерпретатора модуля)',
+    ['phase'],
+)
+
+HANDLER_DURATION = Histogram(
+    'bot_handler_duration_seconds',
+    'Время обработки апдейта хендлером',
+    ['router', 'key'],
+)
+
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds',
+    'Время выполнения запроса к PostgreSQL (по имени запроса)',
+    ['query'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+DB_POOL_ACQUIRE_DURATION = Histogram(
+    'db_pool_acquire_seconds',
+    'Ожидание свободного соединения в пуле asyncpg (по имени запроса)',
+    ['query'],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections',
+    'Соединения пула asyncpg',
+    ['state'],
+)
+
+UPDATE_QUEUE_LAG = Histogram(
+    'bot_update_queue_lag_seconds',
+    'Время от приёма апдейта вебхуком до начала обработки воркером',
+)
+
+UPDATES_ENQUEUED = Counter(
+    'bot_updates_enqueued_total',
+    'Апдейты, принятые вебхуком в очередь',
+    ['outcome'],
+)
+
+TELEGRAM_API_DURATION = Histogram(
+    'telegram_api_duration_seconds',
+    'Время исходящих вызовов Telegram Bot API',
+    ['method', 'status'],
+)
+
+PAYMENT_WEBHOOKS = Counter(
+    'payment_webhooks_total',
+    'Входящие уведомления платёжных систем',
+    ['provider', 'event', 'outcome'],
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки HTTP-запроса',
+    ['method', 'path', 'status'],
+)
+
+SSE_CLIENTS = Gauge(
+    'web_sse_clients',
+    'Открытые SSE-подписки на обновления расписания',
+)
+
+INLINE_SEARCH_SECONDS = Histogram(
+    'bot_inline_search_seconds',
+    'Поиск по индексу тренировок в памяти (inline-запрос)',
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+
+SEARCH_INDEX_REFRESH_SECONDS = Histogram(
+    'bot_search_index_refresh_seconds',
+    'Обновление индекса inline-поиска из БД (дельта или полная загрузка)',
+)
+
+THROTTLED_UPDATES = Counter(
+    'bot_throttled_updates_total',
+    'Апдейты, отброшенные антифлудом до хендлера (flood — пустое ведро, duplicate — повтор callback)',
+    ['kind', 'key', 'reason'],
+)
+
+THROTTLE_BUCKETS = Gauge(
+    'bot_throttle_buckets',
+    'Ведра токенов антифлуда в памяти процесса',
+)
+
+
+NOTIFICATIONS_DELIVERED = Counter(
+    'bot_notifications_total',
+    'Отправка уведомлений из outbox (sent, retry — отложено, failed — снято с очереди)',
+    ['outcome'],
+)
+
+REFUND_JOBS = Counter(
+    'bot_refund_jobs_total',
+    'Попытки возвратов у провайдеров (succeeded, pending — ждёт проведения, retry, failed — вручную)',
+    ['provider', 'outcome'],
+)
+
+
+def bind_pool_metrics(pool):
+    """Отдавать размер пула на каждый scrape без фоновых задач"""
+    DB_POOL_CONNECTIONS.labels('size').set_function(pool.get_size)
+    DB_POOL_CONNECTIONS.labels('idle').set_function(pool.get_idle_size)
+    DB_POOL_CONNECTIONS.labels('max').set_function(pool.get_max_size)
+
+
+def callback_key(data: str) -> str:
+    """
+    Префикс callback_data без идентификаторов: set_channel_12_R_3 → set_channel.
+    Держит кардинальность меток ограниченной.
+    """
+    parts = []
+    for part in (data or "").split('_'):
+        if any(ch.isdigit() for ch in part):
+            break
+        parts.append(part)
+    return '_'.join(parts) or 'other'
+
+
+def render_metrics() -> bytes:
+    return generate_latest()
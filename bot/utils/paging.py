@@ -0,0 +1,180 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from ..database.db import fetch
+from .callbacks import LIST_PAGE
+
+# ========================
+# Постраничные списки в сообщениях бота
+# ========================
+# История пилота (записи, платежи) и список админов растут без ограничений, а сообщение
+# Telegram — не больше MESSAGE_LIMIT символов. Список читается страницами по ключу
+# (keyset: WHERE ключ > последний показанный ORDER BY ключ LIMIT n), без OFFSET и COUNT(*):
+# время и память на страницу не зависят от длины истории. Страница заканчивается на границе
+# записи, как только следующая не помещается в сообщение; ключ первой и последней показанной
+# записи едет в хвосте подписанной кнопки ⬅️ / ➡️.
+
+MESSAGE_LIMIT = 4096
+PER_PAGE = 10
+
+Row = Dict[str, Any]
+
+LISTS: Dict[int, "PagedList"] = {}
+
+
+class PagedList:
+    """
+    query — SELECT с местами {keyset}, {order} и {limit}: {keyset} — «AND (ключ) > ($n, ...)»
+    (или пусто на первой странице), параметры ключа идут после параметров запроса.
+    key — пары (выражение SQL, поле строки), по которым упорядочен и листается список.
+    """
+
+    def __init__(self, list_id: int, name: str, query: str, key: Sequence[Tuple[str, str]],
+                 render: Callable[[Row, Any], str], title: Callable[[Any], str], empty: Callable[[Any], str],
+                 descending: bool = False, per_page: int = PER_PAGE, parse_mode: Optional[str] = "Markdown"):
+        if list_id in LISTS:
+            raise ValueError(f"Список {list_id} уже занят: {LISTS[list_id].name}")
+        LISTS[list_id] = self
+        self.list_id = list_id
+        self.name = name
+        self.query = query
+        self.key = tuple(key)
+        self.render = render
+        self.title = title
+        self.empty = empty
+        self.descending = descending
+        self.per_page = per_page
+        self.parse_mode = parse_mode
+
+    # ------------------------
+    # Чтение страницы
+    # ------------------------
+
+    def _sql(self, params: int, cursor: bool, backward: bool) -> str:
+        columns = ", ".join(column for column, _ in self.key)
+        keyset = ""
+        if cursor:
+            # Вперёд по возрастанию или назад по убыванию — «больше», иначе «меньше»
+            op = "<" if backward != self.descending else ">"
+            places = ", ".join(f"${params + i + 1}" for i in range(len(self.key)))
+            keyset = f"AND ({columns}) {op} ({places})"
+        direction = "DESC" if backward != self.descending else "ASC"
+        order = ", ".join(f"{column} {direction}" for column, _ in self.key)
+        return self.query.format(keyset=keyset, order=order, limit=self.per_page + 1)
+
+    async def _load(self, params: Sequence[Any], cursor: Optional[List[Any]], backward: bool) -> Tuple[List[Row], bool]:
+        """Строки страницы в порядке показа и признак, что за ними (в сторону листания) есть ещё"""
+        args = list(params) + (cursor or [])
+        rows = await fetch(self._sql(len(params), cursor is not None, backward), *args,
+                           name=f"list_{self.name}_{'back' if backward else 'fwd'}{'' if cursor else '_first'}")
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+        return rows, more
+
+    def _cursor(self, row: Row) -> bytes:
+        return json.dumps([row[field] for _, field in self.key], ensure_ascii=False, separators=(",", ":")).encode()
+
+    # ------------------------
+    # Текст и клавиатура
+    # ------------------------
+
+    def _fit(self, header: str, items: List[str], backward: bool) -> Tuple[int, int]:
+        """Диапазон записей [start, end), который помещается в сообщение; режется по границе записи"""
+        budget = MESSAGE_LIMIT - len(header)
+        order = range(len(items) - 1, -1, -1) if backward else range(len(items))
+        kept = []
+        for i in order:
+            size = len(items[i]) + 1
+            if kept and size > budget:
+                break
+            budget -= size
+            kept.append(i)
+        return min(kept), max(kept) + 1
+
+    def _keyboard(self, rows: List[Row], page: int, has_prev: bool, has_next: bool,
+                  user_id: int) -> Optional[InlineKeyboardMarkup]:
+        if not (has_prev or has_next):
+            return None
+        row = []
+        if has_prev:
+            row.append(InlineKeyboardButton(text="⬅️", callback_data=LIST_PAGE.pack(
+                self.list_id, "<", max(page - 1, 1), self._cursor(rows[0]), user_id=user_id)))
+        row.append(InlineKeyboardButton(text=str(page), callback_data="noop"))
+        if has_next:
+            row.append(InlineKeyboardButton(text="➡️", callback_data=LIST_PAGE.pack(
+                self.list_id, ">", page + 1, self._cursor(rows[-1]), user_id=user_id)))
+        return InlineKeyboardMarkup(inline_keyboard=[row])
+
+    async def page(self, i18n, user_id: int, params: Sequence[Any], page: int = 1,
+                   cursor: Optional[List[Any]] = None, backward: bool = False):
+        """Текст и клавиатура страницы; None — список пуст"""
+        rows, more = await self._load(params, cursor, backward)
+        if not rows:
+            return None
+        header = self.title(i18n) + "\n\n"
+        items = [self.render(row, i18n) for row in rows]
+        start, end = self._fit(header, items, backward)
+        trimmed = start > 0 if backward else end < len(items)
+        rows = rows[start:end]
+        text = header + "\n".join(items[start:end])
+        if len(text) > MESSAGE_LIMIT:  # одна запись длиннее сообщения
+            text = text[:MESSAGE_LIMIT - 1] + "…"
+        if backward:
+            has_prev, has_next = more or trimmed, True
+        else:
+            has_prev, has_next = cursor is not None, more or trimmed
+        return text, self._keyboard(rows, page, has_prev, has_next, user_id)
+
+    # ------------------------
+    # Ответы
+    # ------------------------
+
+    async def answer(self, message: Message, i18n, *params: Any):
+        """Первая страница в ответ на команду"""
+        result = await self.page(i18n, message.from_user.id, params)
+        if result is None:
+            await message.answer(self.empty(i18n))
+            return
+        text, keyboard = result
+        await message.answer(text, reply_markup=keyboard, parse_mode=self.parse_mode)
+
+    async def turn(self, callback: CallbackQuery, i18n, cb, *params: Any):
+        """Соседняя страница по кнопке: сообщение редактируется на месте"""
+        try:
+            cursor = json.loads(cb.cursor)
+        except ValueError:
+            cursor = None
+        if not isinstance(cursor, list) or len(cursor) != len(self.key):
+            await callback.answer()
+            return
+        result = await self.page(i18n, callback.from_user.id, params, cb.page, cursor, backward=cb.direction == "<")
+        if result is None:
+            # Записи за курсором исчезли (отмена, перенос в архив) — начинаем сначала
+            result = await self.page(i18n, callback.from_user.id, params)
+        if result is None:
+            await callback.message.edit_text(self.empty(i18n))
+        else:
+            text, keyboard = result
+            await callback.message.edit_text(text, reply_markup=keyboard, parse_mode=self.parse_mode)
+        await callback.answer()
+
+    def filter(self) -> "PagedListFilter":
+        return PagedListFilter(self)
+
+
+class PagedListFilter(Filter):
+    """Кнопка листания именно этого списка, подписанная для нажавшего; поля — в аргумент cb"""
+
+    def __init__(self, paged: PagedList):
+        self.paged = paged
+
+    async def __call__(self, callback: CallbackQuery) -> Union[bool, Dict[str, Any]]:
+        cb = LIST_PAGE.unpack(callback.data, callback.from_user.id)
+        if cb is None or cb.list_id != self.paged.list_id:
+            return False
+        return {"cb": cb}
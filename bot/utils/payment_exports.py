@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List
+
+from ..config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY, STRIPE_SECRET_KEY
+
+# Выгрузки платежей провайдеров для сверки с журналом payments: асинхронные генераторы страниц
+# в формате reconcile_payments. SDK синхронные — страницы запрашиваются в потоке исполнителя.
+# У Telegram Payments выгрузки нет: такие платежи сверяются только по вебхукам.
+
+# Размер страницы выгрузки (максимум у обоих провайдеров — 100)
+PAGE_SIZE = 100
+
+
+def _refund_status(amount: Decimal, refunded: Decimal) -> str:
+    if refunded <= 0:
+        return 'succeeded'
+    return 'refunded' if refunded >= amount else 'partially_refunded'
+
+
+# ========================
+# ЮKassa
+# ========================
+
+YOOKASSA_STATUSES = {
+    'pending': 'pending',
+    'waiting_for_capture': 'pending',
+    'canceled': 'canceled',
+}
+
+
+def _yookassa_row(payment) -> Dict[str, Any]:
+    amount = Decimal(payment.amount.value)
+    refunded = Decimal(payment.refunded_amount.value) if payment.refunded_amount else Decimal(0)
+    status = YOOKASSA_STATUSES.get(payment.status) or _refund_status(amount, refunded)
+    return {
+        'provider_payment_id': payment.id,
+        'status': status,
+        'amount': amount,
+        'refunded_amount': refunded,
+        'currency': payment.amount.currency,
+    }
+
+
+async def yookassa_export(since: datetime) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Платежи ЮKassa, созданные после since, страницами по курсору API"""
+    if not (YOOKASSA_SHOP_ID and YOOKASSA_SECRET_KEY):
+        return
+    from yookassa import Configuration, Payment
+
+    Configuration.configure(YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY)
+    params = {'created_at.gte': since.isoformat(), 'limit': PAGE_SIZE}
+    while True:
+        page = await asyncio.to_thread(Payment.list, params)
+        if page.items:
+            yield [_yookassa_row(p) for p in page.items]
+        if not page.next_cursor:
+            return
+        params = {**params, 'cursor': page.next_cursor}
+
+
+# ========================
+# Stripe
+# ========================
+
+def _stripe_row(intent) -> Dict[str, Any]:
+    amount = Decimal(intent['amount_received'] or intent['amount']) / 100
+    charge = intent.get('latest_charge') or {}
+    refunded = Decimal(charge.get('amount_refunded', 0) if isinstance(charge, dict) else 0) / 100
+    if intent['status'] == 'succeeded':
+        status = _refund_status(amount, refunded)
+    else:
+        status = 'canceled' if intent['status'] == 'canceled' else 'pending'
+    return {
+        'provider_payment_id': intent['id'],
+        'status': status,
+        'amount': amount,
+        'refunded_amount': refunded,
+        'currency': intent['currency'].upper(),
+    }
+
+
+async def stripe_export(since: datetime) -> AsyncIterator[List[Dict[str, Any]]]:
+    """PaymentIntent Stripe, созданные после since; возвраты — из развёрнутого latest_charge"""
+    if not STRIPE_SECRET_KEY:
+        return
+    import stripe
+
+    stripe.api_key = STRIPE_SECRET_KEY
+    params = {'created': {'gte': int(since.timestamp())}, 'limit': PAGE_SIZE, 'expand': ['data.latest_charge']}
+    while True:
+        page = await asyncio.to_thread(stripe.PaymentIntent.list, **params)
+        if page.data:
+            yield [_stripe_row(intent) for intent in page.data]
+        if not page.has_more:
+            return
+        params = {**params, 'starting_after': page.data[-1]['id']}
+
+
+PROVIDER_EXPORTS = {
+    'yookassa': yookassa_export,
+    'stripe': stripe_export,
+}
@@ -0,0 +1,123 @@
+import asyncio
+from collections import namedtuple
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from ..config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY, STRIPE_SECRET_KEY
+
+# Возвраты у провайдеров для очереди refund_jobs: корутина на провайдера получает задачу
+# (сумма, платёж, idempotency_key, id уже принятого возврата) и возвращает RefundResult.
+# Ключ идемпотентности один на все попытки задачи: повтор после таймаута или падения процесса
+# получает тот же возврат, а не второй. SDK ЮKassa и Stripe синхронные — вызовы в потоке исполнителя.
+
+# refund_id — id возврата у провайдера; done=False — возврат принят, но ещё не проведён:
+# очередь опросит его статус позже, не создавая новый
+RefundResult = namedtuple("RefundResult", "refund_id done")
+
+Job = Dict[str, Any]
+
+
+class RefundError(Exception):
+    """Провайдер отказал; permanent — повтор бесполезен, нужен возврат вручную"""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+# ========================
+# ЮKassa
+# ========================
+
+async def yookassa_refund(job: Job, bot: Bot) -> RefundResult:
+    if not (YOOKASSA_SHOP_ID and YOOKASSA_SECRET_KEY):
+        raise RefundError("ЮKassa не настроена", permanent=True)
+    from yookassa import Configuration, Refund
+
+    Configuration.configure(YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY)
+    try:
+        if job['provider_refund_id']:
+            refund = await asyncio.to_thread(Refund.find_one, job['provider_refund_id'])
+        else:
+            refund = await asyncio.to_thread(Refund.create, {
+                "payment_id": job['provider_payment_id'],
+                "amount": {"value": f"{job['amount']:.2f}", "currency": job['currency']},
+                "description": f"Возврат по платежу #{job['payment_id']}",
+            }, str(job['idempotency_key']))
+    except Exception as e:
+        # 400/403/404: платёж не найден, уже возвращён или сумма больше остатка
+        if getattr(e, 'HTTP_CODE', None) in (400, 403, 404):
+            raise RefundError(f"ЮKassa: {e}", permanent=True) from e
+        raise
+    if refund.status == 'canceled':
+        details = refund.cancellation_details
+        raise RefundError(f"ЮKassa отменила возврат: {details.reason if details else 'canceled'}", permanent=True)
+    return RefundResult(refund.id, refund.status == 'succeeded')
+
+
+# ========================
+# Stripe
+# ========================
+
+async def stripe_refund(job: Job, bot: Bot) -> RefundResult:
+    if not STRIPE_SECRET_KEY:
+        raise RefundError("Stripe не настроен", permanent=True)
+    import stripe
+
+    stripe.api_key = STRIPE_SECRET_KEY
+    try:
+        if job['provider_refund_id']:
+            refund = await asyncio.to_thread(stripe.Refund.retrieve, job['provider_refund_id'])
+        else:
+            refund = await asyncio.to_thread(
+                stripe.Refund.create,
+                payment_intent=job['provider_payment_id'],
+                amount=int(job['amount'] * 100),
+                metadata={'refund_job_id': str(job['id']), 'payment_id': str(job['payment_id'])},
+                idempotency_key=str(job['idempotency_key']),
+            )
+    except stripe.error.InvalidRequestError as e:
+        raise RefundError(f"Stripe: {e}", permanent=True) from e
+    if refund['status'] in ('failed', 'canceled'):
+        raise RefundError(f"Stripe: возврат {refund['status']} ({refund.get('failure_reason')})", permanent=True)
+    return RefundResult(refund['id'], refund['status'] == 'succeeded')
+
+
+# ========================
+# Telegram
+# ========================
+
+async def telegram_refund(job: Job, bot: Bot) -> RefundResult:
+    """
+    Bot API возвращает только оплату в Telegram Stars (целиком). Платёж картой через
+    provider_token возвращается в кабинете платёжного провайдера — задача уходит в failed.
+    """
+    if job['currency'] != 'XTR':
+        raise RefundError("Telegram Payments: возврат только в кабинете платёжного провайдера", permanent=True)
+    try:
+        await bot.refund_star_payment(
+            user_id=job['user_id'], telegram_payment_charge_id=job['provider_payment_id']
+        )
+    except TelegramBadRequest as e:
+        # Повтор после падения процесса: звёзды уже вернулись — это успех
+        if 'CHARGE_ALREADY_REFUNDED' not in str(e):
+            raise RefundError(f"Telegram: {e}", permanent=True) from e
+    return RefundResult(job['provider_payment_id'], True)
+
+
+def can_refund_automatically(provider: str, currency: str) -> bool:
+    """Вернёт ли очередь деньги сама; иначе задача уйдёт в failed и организатор получит алерт"""
+    if provider == 'yookassa':
+        return bool(YOOKASSA_SHOP_ID and YOOKASSA_SECRET_KEY)
+    if provider == 'stripe':
+        return bool(STRIPE_SECRET_KEY)
+    return provider == 'telegram' and currency == 'XTR'
+
+
+PROVIDER_REFUNDS: Dict[str, Callable[[Job, Bot], Awaitable[RefundResult]]] = {
+    'yookassa': yookassa_refund,
+    'stripe': stripe_refund,
+    'telegram': telegram_refund,
+}
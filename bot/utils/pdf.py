@@ -0,0 +1,118 @@
+import functools
+import os
+from datetime import datetime
+from io import BytesIO
+
+import pytz
+
+from ..config import SCHEDULE_URL
+from .checkin import issue_token
+
+# Шрифт с кириллицей для PDF (чеки бота и выгрузки веб-админки); reportlab импортируется при первом PDF
+FONT_PATH = os.path.join(os.path.dirname(__file__), "..", "DejaVuSans.ttf")
+
+
+@functools.lru_cache(maxsize=1)
+def pdf_font() -> str:
+    """Зарегистрировать DejaVu один раз; Helvetica, если файла шрифта нет"""
+    if not os.path.exists(FONT_PATH):
+        return "Helvetica"
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    pdfmetrics.registerFont(TTFont('DejaVu', FONT_PATH))
+    return "DejaVu"
+
+
+def generate_qr_code(data: str) -> BytesIO:
+    """Генерация QR-кода для PDF"""
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=4, border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+
+def render_receipt_pdf(
+    reg_id: int,
+    user_name: str,
+    amount: float,
+    channel: str,
+    date_str: str,
+    location: str,
+    payment_id: str,
+    training_id: int = None,
+    user_id: int = None,
+    is_refund: bool = False
+) -> BytesIO:
+    """
+    PDF-чек; в чеке оплаты — QR с подписанным токеном отметки на площадке.
+    Синхронный (reportlab, PIL): из асинхронного кода — через asyncio.to_thread.
+    """
+    from PIL import Image
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    # Шрифт
+    font_name = pdf_font()
+    p.setFont(font_name, 12)
+
+    # Заголовок
+    p.setFillColor(colors.blue)
+    p.setFont("Helvetica-Bold", 16)
+    title = "FPV TRAINING — КВИТАНЦИЯ" if not is_refund else "FPV TRAINING — ЧЕК ВОЗВРАТА"
+    p.drawCentredString(width / 2, height - 50, title)
+    p.setFillColor(colors.black)
+    p.setFont(font_name, 12)
+
+    # Данные
+    y = height - 100
+    lines = [
+        f"ID регистрации: {reg_id}",
+        f"Пилот: {user_name}",
+        f"Сумма: {amount} руб.",
+        f"Канал VTX: {channel}",
+        f"Тренировка: {location}",
+        f"Дата: {date_str}",
+        f"ID платежа: {payment_id[:8]}...",
+        f"Время выдачи: {datetime.now(pytz.timezone('Europe/Moscow')).strftime('%Y-%m-%d %H:%M:%S')}",
+    ]
+
+    if is_refund:
+        lines.append("Статус: ВОЗВРАТ СРЕДСТВ")
+
+    lines.append("")
+    lines.append("Спасибо за участие! Приятных полётов 🚁")
+
+    for line in lines:
+        p.drawString(50, y, line)
+        y -= 20
+
+    # QR-код для отметки на площадке (проверяется по подписи или по ростеру без сети)
+    if not is_refund and training_id is not None and user_id is not None:
+        qr_buffer = generate_qr_code(issue_token(reg_id, training_id, user_id))
+        p.drawImage(Image.open(qr_buffer), width - 150, 100, 100, 100)
+
+        p.setFont("Helvetica", 10)
+        p.drawString(width - 150, 85, "Покажите на площадке")
+
+    # Добавляем гиперссылку "Записаться на тренировку"
+    p.setFillColor(colors.blue)
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, 70, "Записаться на тренировку")
+    p.linkURL(SCHEDULE_URL, (50, 70, 250, 90), relative=0)  # Координаты: x1, y1, x2, y2
+    p.setFillColor(colors.black)
+
+    p.showPage()
+    p.save()
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from typing import Any, Dict, List, Optional, Tuple
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from ..database.db import (
+    reconcile_pilot_counts, get_overbooked_trainings, claim_pending_notifications,
+    complete_notifications, retry_notifications,
+    claim_refund_jobs, settle_refund_jobs, reschedule_refund_jobs,
+    prune_training_tombstones, refresh_stats_rollup, reconcile_payments,
+    prune_2fa_sessions, archive_past_trainings
+)
+from .i18n import render_message, translate, user_locale
+from .metrics import NOTIFICATIONS_DELIVERED, REFUND_JOBS
+from .payment_exports import PROVIDER_EXPORTS
+from .payment_refunds import PROVIDER_REFUNDS, RefundError
+from .pdf import render_receipt_pdf
+
+logger = logging.getLogger(__name__)
+
+# Интервал сверки счётчиков пилотов (минуты)
+RECONCILE_INTERVAL_MINUTES = 60
+# Интервал отправки уведомлений из outbox (секунды)
+OUTBOX_INTERVAL_SECONDS = 5
+# Пачка outbox и темп рассылки: Telegram допускает ~30 сообщений в секунду на бота
+OUTBOX_BATCH_SIZE = 50
+NOTIFY_RATE_PER_SECOND = 25
+# Повтор после ошибки: 15 с, 30 с, 1 мин, 2 мин (далее уведомление снимается с очереди)
+NOTIFY_RETRY_BASE_SECONDS = 15
+# Очередь возвратов: интервал, пачка и одновременных запросов к провайдерам
+REFUND_INTERVAL_SECONDS = 15
+REFUND_BATCH_SIZE = 20
+REFUND_CONCURRENCY = 5
+# Повтор после ошибки провайдера: 30 с, 1 мин, 2 мин... и опрос принятого, но не проведённого возврата
+REFUND_RETRY_BASE_SECONDS = 30
+REFUND_POLL_SECONDS = 60
+# Сколько дней хранить отметки об удалённых тренировках для дельта-синхронизации
+TOMBSTONE_RETENTION_DAYS = 30
+# Интервал пересчёта дневных агрегатов аналитики (секунды)
+STATS_ROLLUP_INTERVAL_SECONDS = 60
+# Сверка журнала платежей с выгрузками провайдеров: интервал (часы) и глубина окна (дни)
+PAYMENT_RECONCILE_INTERVAL_HOURS = 24
+PAYMENT_RECONCILE_WINDOW_DAYS = 35
+# Интервал очистки истёкших кодов 2FA (минуты)
+TWOFA_JANITOR_INTERVAL_MINUTES = 15
+# Архивация прошедших тренировок: интервал (часы) и размер пачки (тренировок на транзакцию)
+ARCHIVE_INTERVAL_HOURS = 6
+ARCHIVE_BATCH_SIZE = 500
+
+
+async def reconcile_pilot_counts_job():
+    """Сверка trainings.current_pilots с таблицей registrations"""
+    fixed = await reconcile_pilot_counts()
+    for row in fixed:
+        logger.warning(
+            f"🔧 Счётчик пилотов исправлен: тренировка {row['id']} "
+            f"{row['old_count']} → {row['new_count']}"
+        )
+
+    overbooked = await get_overbooked_trainings()
+    for row in overbooked:
+        logger.error(
+            f"⚠️ Перебор записей: тренировка {row['id']} — "
+            f"{row['actual']} пилотов при лимите {row['max_pilots']}"
+        )
+
+    if fixed or overbooked:
+        logger.info(f"📊 Сверка счётчиков: исправлено {len(fixed)}, перебор {len(overbooked)}")
+
+
+async def prune_tombstones_job():
+    removed = await prune_training_tombstones(TOMBSTONE_RETENTION_DAYS)
+    if removed:
+        logger.info(f"🧹 Удалено отметок об удалённых тренировках: {removed}")
+
+
+async def archive_trainings_job():
+    """Перенос прошедших тренировок в архив пачками, пока не закончатся"""
+    total = 0
+    while True:
+        moved = await archive_past_trainings(ARCHIVE_BATCH_SIZE)
+        total += moved
+        if moved < ARCHIVE_BATCH_SIZE:
+            break
+    if total:
+        logger.info(f"🗄️ В архив перенесено тренировок: {total}")
+
+
+async def prune_2fa_sessions_job():
+    removed = await prune_2fa_sessions()
+    if removed:
+        logger.info(f"🧹 Удалено истёкших кодов 2FA: {removed}")
+
+
+async def refresh_stats_job():
+    refreshed = await refresh_stats_rollup()
+    if refreshed:
+        logger.info(f"📈 Аналитика: пересчитано дней — {refreshed}")
+
+
+async def reconcile_payments_job():
+    """Потоковая сверка: каждая страница выгрузки провайдера сверяется с журналом одним запросом"""
+    since = datetime.now(timezone.utc) - timedelta(days=PAYMENT_RECONCILE_WINDOW_DAYS)
+    for provider, export in PROVIDER_EXPORTS.items():
+        checked = changed = added = 0
+        try:
+            async for page in export(since):
+                result = await reconcile_payments(provider, page)
+                checked += len(page)
+                changed += result['changed']
+                added += result['added']
+                for unknown in result['unknown']:
+                    logger.warning(f"⚠️ Платёж {provider} {unknown} не найден ни в журнале, ни в записях")
+        except Exception as e:
+            logger.error(f"Сверка платежей {provider} прервана: {e}")
+        if checked:
+            logger.info(f"💳 Сверка {provider}: проверено {checked}, исправлено {changed}, добавлено {added}")
+
+
+async def send_pending_notifications(bot: Bot):
+    """Отправка уведомлений из notifications_outbox: пачки подряд, пока очередь не опустеет"""
+    while True:
+        notifications = await claim_pending_notifications(OUTBOX_BATCH_SIZE)
+        await deliver_notifications(bot, notifications)
+        if len(notifications) < OUTBOX_BATCH_SIZE:
+            break
+
+
+async def deliver_notifications(bot: Bot, notifications: List[Dict[str, Any]]):
+    """
+    Отправка пачки не быстрее NOTIFY_RATE_PER_SECOND. Итог пишется двумя запросами на пачку:
+    отправленные закрываются, неудачные откладываются с backoff (или снимаются, если повтор бесполезен)
+    """
+    sent: List[int] = []
+    failures: List[Tuple[int, Optional[float], str]] = []
+    interval = 1 / NOTIFY_RATE_PER_SECOND
+    for item in notifications:
+        started = time.monotonic()
+        try:
+            text = item['text'] if item['message'] is None else render_message(item['message'], item['lang'])
+            await bot.send_message(chat_id=item['user_id'], text=text)
+            sent.append(item['id'])
+        except TelegramRetryAfter as e:
+            # Флуд-контроль Telegram: это уведомление — позже, остальные ждут вместе с ним
+            failures.append((item['id'], float(e.retry_after), str(e)))
+            await asyncio.sleep(e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чата нет — повтор ничего не даст
+            failures.append((item['id'], None, str(e)))
+        except Exception as e:
+            failures.append((item['id'], NOTIFY_RETRY_BASE_SECONDS * 2 ** (item['attempts'] - 1), str(e)))
+            logger.error(f"Не удалось отправить уведомление {item['id']} пользователю {item['user_id']}: {e}")
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    await complete_notifications(sent)
+    await retry_notifications(failures)
+    NOTIFICATIONS_DELIVERED.labels('sent').inc(len(sent))
+    for _, delay, _ in failures:
+        NOTIFICATIONS_DELIVERED.labels('failed' if delay is None else 'retry').inc()
+
+
+async def process_refund_jobs(bot: Bot, refunds=None, receipts: bool = True):
+    """Возвраты у провайдеров из refund_jobs: пачки подряд, пока очередь не опустеет"""
+    refunds = refunds or PROVIDER_REFUNDS
+    while True:
+        jobs = await claim_refund_jobs(REFUND_BATCH_SIZE)
+        await run_refund_jobs(bot, jobs, refunds, receipts)
+        if len(jobs) < REFUND_BATCH_SIZE:
+            break
+
+
+async def run_refund_jobs(bot: Bot, jobs: List[Dict[str, Any]], refunds, receipts: bool = True):
+    """
+    Пачка возвратов: до REFUND_CONCURRENCY запросов к провайдерам одновременно, итог — двумя запросами
+    на пачку: проведённые закрываются вместе с записью в журнал платежей, остальные откладываются
+    (ошибка — с backoff, принятый провайдером возврат — до опроса статуса). Чеки — после фиксации в БД.
+    """
+    semaphore = asyncio.Semaphore(REFUND_CONCURRENCY)
+
+    async def attempt(job):
+        async with semaphore:
+            try:
+                refund = refunds.get(job['provider'])
+                if refund is None:
+                    raise RefundError(f"Нет возвратов для провайдера {job['provider']}", permanent=True)
+                return await refund(job, bot), None
+            except Exception as e:
+                return None, e
+
+    results = await asyncio.gather(*(attempt(job) for job in jobs))
+
+    done: List[Tuple[int, str]] = []
+    later: List[Tuple[int, Optional[float], Optional[str], Optional[str]]] = []
+    for job, (result, error) in zip(jobs, results):
+        if error is not None:
+            permanent = isinstance(error, RefundError) and error.permanent
+            delay = None if permanent else REFUND_RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1)
+            later.append((job['id'], delay, str(error) or type(error).__name__, None))
+            REFUND_JOBS.labels(job['provider'], 'failed' if permanent else 'retry').inc()
+            logger.error(f"Возврат по платежу {job['payment_id']} ({job['provider']}), попытка {job['attempts']}: {error}")
+        elif result.done:
+            done.append((job['id'], result.refund_id))
+        else:
+            later.append((job['id'], REFUND_POLL_SECONDS, None, result.refund_id))
+            REFUND_JOBS.labels(job['provider'], 'pending').inc()
+
+    settled = set(await settle_refund_jobs(done))
+    failed = await reschedule_refund_jobs(later)
+    for job_id in failed:
+        logger.error(f"⚠️ Возврат {job_id} снят с очереди — организатору отправлен алерт о ручном возврате")
+
+    for job in jobs:
+        if job['id'] in settled:
+            REFUND_JOBS.labels(job['provider'], 'succeeded').inc()
+            logger.info(f"💸 Возврат по платежу {job['payment_id']} проведён: {job['amount']} {job['currency']}")
+            if receipts:
+                await send_refund_receipt(bot, job)
+
+
+async def send_refund_receipt(bot: Bot, job: Dict[str, Any]):
+    """Чек проведённого возврата: PDF рисуется в потоке исполнителя, ошибка отправки возврат не откатывает"""
+    details = job['details'] or {}
+    try:
+        pdf = await asyncio.to_thread(
+            render_receipt_pdf,
+            job['registration_id'],
+            job['user_name'] or f"User {job['user_id']}",
+            float(job['amount']),
+            details.get('channel', '—'),
+            f"{details.get('date', '')} {details.get('time', '')}".strip(),
+            job['location'] or '—',
+            job['provider_payment_id'],
+            is_refund=True,
+        )
+        await bot.send_document(
+            chat_id=job['user_id'],
+            document=BufferedInputFile(pdf.getvalue(), filename="refund_receipt.pdf"),
+            caption=translate(
+                "refund-receipt", await user_locale(job['user_id']), amount=job['amount'], currency=job['currency']
+            ),
+        )
+    except Exception as e:
+        logger.error(f"Не удалось отправить чек возврата {job['id']} пользователю {job['user_id']}: {e}")
+
+
+def setup_maintenance_jobs(scheduler: AsyncIOScheduler, bot: Bot):
+    """Регистрация фоновых задач обслуживания БД"""
+    scheduler.add_job(
+        reconcile_pilot_counts_job,
+        'interval',
+        minutes=RECONCILE_INTERVAL_MINUTES,
+        id='reconcile_pilot_counts',
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        prune_tombstones_job,
+        'interval',
+        hours=24,
+        id='prune_training_tombstones',
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        archive_trainings_job,
+        'interval',
+        hours=ARCHIVE_INTERVAL_HOURS,
+        id='archive_past_trainings',
+        replace_existing=True,
+        max_instances=1,
+    )
+    scheduler.add_job(
+        prune_2fa_sessions_job,
+        'interval',
+        minutes=TWOFA_JANITOR_INTERVAL_MINUTES,
+        id='prune_2fa_sessions',
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        refresh_stats_job,
+        'interval',
+        seconds=STATS_ROLLUP_INTERVAL_SECONDS,
+        id='refresh_stats_rollup',
+        replace_existing=True,
+        max_instances=1,
+    )
+    scheduler.add_job(
+        reconcile_payments_job,
+        'interval',
+        hours=PAYMENT_RECONCILE_INTERVAL_HOURS,
+        id='reconcile_payments',
+        replace_existing=True,
+        max_instances=1,
+    )
+    scheduler.add_job(
+        send_pending_notifications,
+        'interval',
+        seconds=OUTBOX_INTERVAL_SECONDS,
+        args=[bot],
+        id='send_pending_notifications',
+        replace_existing=True,
+        max_instances=1,
+    )
+    scheduler.add_job(
+        process_refund_jobs,
+        'interval',
+        seconds=REFUND_INTERVAL_SECONDS,
+        args=[bot],
+        id='process_refund_jobs',
+        replace_existing=True,
+        max_instances=1,
+    )
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..database.db import TRACK_TYPES, fetch, fetchval, listen, unlisten, local_today
+from .metrics import INLINE_SEARCH_SECONDS, SEARCH_INDEX_REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Индекс предстоящих тренировок для inline-поиска (@bot запрос)
+# ========================
+# Inline-запрос приходит на каждое нажатие клавиши — ответ собирается в памяти процесса, без Postgres.
+# Слово запроса совпадает со словом тренировки (город, площадка, тип трассы, дата, время) по префиксу:
+# «моск парк 06» найдёт «Москва, Парк Победы, 2025-06-01». Индекс — по первым PREFIX_KEY_LEN буквам
+# слова, кандидаты проверяются startswith. Изменения подтягиваются дельтой по updated_at и
+# training_tombstones после NOTIFY schedule_changed (и страховочным опросом раз в REFRESH_INTERVAL).
+
+SCHEDULE_CHANNEL = 'schedule_changed'
+# Длина ключа префиксного индекса: слова короче ищутся целиком по ключу, длиннее — с проверкой кандидатов
+PREFIX_KEY_LEN = 3
+# Пачка NOTIFY (массовое изменение, записи подряд) схлопывается в одно обновление
+REFRESH_DEBOUNCE = 0.2
+# Страховка на случай потерянного NOTIFY (переподключение LISTEN-соединения)
+REFRESH_INTERVAL = 30
+# Запас при чтении дельты: транзакция с меньшим updated_at могла закоммититься позже нашего NOW()
+CHANGES_OVERLAP = timedelta(seconds=5)
+# Дельта старше — перечитываем всё (отметки об удалении могли быть вычищены)
+FULL_RELOAD_AFTER = timedelta(days=1)
+# Кэш результатов по нормализованному запросу (включая промежуточные префиксы набора)
+QUERY_CACHE_SIZE = 2048
+# Слов в запросе учитываем не больше (остальное — шум)
+MAX_QUERY_TOKENS = 6
+
+_WORD = re.compile(r"\w+")
+_EMPTY: Set[int] = frozenset()
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова в нижнем регистре, ё → е (как location_key в БД); эмодзи и разделители отбрасываются"""
+    return _WORD.findall(text.lower().replace('ё', 'е'))
+
+
+def _training_tokens(row: Dict[str, Any]) -> Tuple[str, ...]:
+    words = [row['city'], row['location'], row['track_type'], TRACK_TYPES.get(row['track_type'], ''),
+             row['date'], row['time']]
+    return tuple(dict.fromkeys(token for word in words if word for token in tokenize(word)))
+
+
+def _matches(tokens: Iterable[str], query_tokens: List[str]) -> bool:
+    return all(any(token.startswith(q) for token in tokens) for q in query_tokens)
+
+
+class TrainingSearchIndex:
+    """
+    Предстоящие тренировки и префиксный индекс по их словам. search() синхронный и не ждёт БД:
+    пока идёт обновление, отвечает прежний снимок (обновление применяется без await между шагами).
+    """
+
+    def __init__(self):
+        self.docs: Dict[int, Dict[str, Any]] = {}
+        self._tokens: Dict[int, Tuple[str, ...]] = {}
+        self._order: Dict[int, Tuple[str, str, int]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._cache: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._since = None
+        self._today: Optional[str] = None
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._conn = None
+
+    # ------------------------
+    # Изменение индекса
+    # ------------------------
+
+    def _add(self, row: Dict[str, Any]):
+        self._remove(row['id'])
+        tokens = _training_tokens(row)
+        self.docs[row['id']] = row
+        self._tokens[row['id']] = tokens
+        self._order[row['id']] = (row['date'], row['time'], row['id'])
+        for key in {token[:n] for token in tokens for n in range(1, PREFIX_KEY_LEN + 1)}:
+            self._postings.setdefault(key, set()).add(row['id'])
+
+    def _remove(self, training_id: int):
+        tokens = self._tokens.pop(training_id, None)
+        if tokens is None:
+            return
+        del self.docs[training_id]
+        del self._order[training_id]
+        for key in {token[:n] for token in tokens for n in range(1, PREFIX_KEY_LEN + 1)}:
+            ids = self._postings.get(key)
+            if ids is not None:
+                ids.discard(training_id)
+                if not ids:
+                    del self._postings[key]
+
+    def _drop_past(self, today: str) -> int:
+        past = [training_id for training_id, row in self.docs.items() if row['date'] < today]
+        for training_id in past:
+            self._remove(training_id)
+        return len(past)
+
+    def apply(self, changed: Iterable[Dict[str, Any]], deleted: Iterable[int], today: str) -> int:
+        """Применить дельту; возвращает число затронутых тренировок. Любое изменение сбрасывает кэш запросов"""
+        touched = 0
+        for row in changed:
+            if row['date'] >= today:
+                self._add(row)
+            else:
+                self._remove(row['id'])
+            touched += 1
+        for training_id in deleted:
+            if training_id in self.docs:
+                self._remove(training_id)
+                touched += 1
+        if today != self._today:
+            touched += self._drop_past(today)
+            self._today = today
+        if touched:
+            self._cache.clear()
+        return touched
+
+    def clear(self):
+        self.docs.clear()
+        self._tokens.clear()
+        self._order.clear()
+        self._postings.clear()
+        self._cache.clear()
+
+    # ------------------------
+    # Поиск
+    # ------------------------
+
+    def _all(self) -> List[int]:
+        """Все тренировки по дате и времени (кэшируется под пустым запросом до следующего изменения)"""
+        ids = self._cache.get("")
+        if ids is None:
+            ids = self._cache[""] = sorted(self.docs, key=self._order.__getitem__)
+        return ids
+
+    def _candidates(self, query_tokens: List[str], key: str) -> List[int]:
+        sets = sorted((self._postings.get(q[:PREFIX_KEY_LEN], _EMPTY) for q in query_tokens), key=len)
+        long_tokens = [q for q in query_tokens if len(q) > PREFIX_KEY_LEN]
+        # Предыдущее нажатие клавиши почти всегда в кэше: сужаем его (уже упорядоченный) результат
+        base = None
+        for cut in range(len(key) - 1, 0, -1):
+            base = self._cache.get(key[:cut])
+            if base is not None:
+                break
+        if base is None:
+            base = self._all()
+        return [i for i in base
+                if all(i in ids for ids in sets) and (not long_tokens or _matches(self._tokens[i], long_tokens))]
+
+    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Тренировки, у которых каждое слово запроса — начало какого-то их слова; по дате и времени"""
+        start = time.perf_counter()
+        query_tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+        key = " ".join(query_tokens)
+        ids = self._cache.get(key)
+        if ids is None:
+            ids = self._candidates(query_tokens, key) if query_tokens else self._all()
+            self._cache[key] = ids
+            if len(self._cache) > QUERY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        result = [self.docs[i] for i in ids[:limit]]
+        INLINE_SEARCH_SECONDS.observe(time.perf_counter() - start)
+        return result
+
+    # ------------------------
+    # Синхронизация с БД
+    # ------------------------
+
+    async def refresh(self) -> int:
+        """Подтянуть изменения с прошлого обновления (первый раз и после долгого перерыва — всё заново)"""
+        start = time.perf_counter()
+        now = await fetchval("SELECT NOW()", name="search_index_now")
+        today = local_today()
+        if self._since is None or now - self._since > FULL_RELOAD_AFTER:
+            rows = await fetch('''
+                SELECT id, city, location, date, time, track_type, current_pilots, max_pilots
+                FROM trainings
+                WHERE date >= $1
+            ''', today, name="search_index_full")
+            self.clear()
+            self._today = None
+            touched = self.apply((dict(r) for r in rows), (), today)
+        else:
+            lower = self._since - CHANGES_OVERLAP
+            rows = await fetch('''
+                SELECT id, city, location, date, time, track_type, current_pilots, max_pilots
+                FROM trainings
+                WHERE updated_at > $1
+            ''', lower, name="search_index_changes")
+            deleted = await fetch(
+                'SELECT training_id FROM training_tombstones WHERE deleted_at > $1', lower,
+                name="search_index_deleted"
+            )
+            touched = self.apply((dict(r) for r in rows), (r['training_id'] for r in deleted), today)
+        self._since = now
+        SEARCH_INDEX_REFRESH_SECONDS.observe(time.perf_counter() - start)
+        return touched
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self._dirty.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), REFRESH_INTERVAL)
+                await asyncio.sleep(REFRESH_DEBOUNCE)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Search index refresh failed: {e}")
+
+    async def start(self):
+        """Загрузить индекс и подписаться на изменения расписания (после init_db_pool)"""
+        await self.refresh()
+        self._conn = await listen(SCHEDULE_CHANNEL, self._on_notify)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🔎 Search index: {len(self.docs)} upcoming trainings")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            await unlisten(self._conn, SCHEDULE_CHANNEL, self._on_notify)
+            self._conn = None
+
+
+training_index = TrainingSearchIndex()
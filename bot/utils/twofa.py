@@ -0,0 +1,61 @@
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict, deque
+from typing import Hashable
+
+from ..config import API_KEY, BOT_TOKEN
+
+# Срок жизни кода и число неверных вводов, после которого код сгорает (общий счётчик в БД)
+TWOFA_TTL_MINUTES = 10
+TWOFA_MAX_ATTEMPTS = 5
+
+# Ключ HMAC кодов: секрет веб-админки, без него — токен бота (как у подписи QR отметки)
+_SECRET = API_KEY or BOT_TOKEN or ''
+_KEY = hashlib.sha256(f"2fa:{_SECRET}".encode()).digest()
+
+
+def generate_2fa_code() -> str:
+    return str(secrets.randbelow(900000) + 100000)
+
+
+def hash_2fa_code(user_id: int, code: str) -> str:
+    """HMAC кода с привязкой к пользователю: в БД нет кодов в открытом виде, одинаковые коды разных админов не совпадают"""
+    if not _SECRET:
+        # Без секрета HMAC вырождается в хеш, и 900 тысяч кодов перебираются по утёкшей БД
+        raise RuntimeError("2FA: не заданы ни API_KEY, ни BOT_TOKEN")
+    return hmac.new(_KEY, f"{user_id}:{code}".encode(), hashlib.sha256).hexdigest()
+
+
+class FailureThrottle:
+    """
+    Ограничение неудачных попыток в памяти процесса: не больше limit неудач за window секунд на ключ
+    (IP или пользователь). На ключ хранится не больше limit отметок времени, ключей — не больше max_keys.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._failures: "OrderedDict[Hashable, deque]" = OrderedDict()
+
+    def retry_after(self, key: Hashable) -> float:
+        """0 — попытку можно пропустить к проверке, иначе секунд до разблокировки"""
+        attempts = self._failures.get(key)
+        if attempts is None or len(attempts) < self.limit:
+            return 0
+        wait = attempts[0] + self.window - time.monotonic()
+        return max(wait, 0)
+
+    def failure(self, key: Hashable):
+        attempts = self._failures.pop(key, None)
+        if attempts is None:
+            attempts = deque(maxlen=self.limit)
+        attempts.append(time.monotonic())
+        self._failures[key] = attempts
+        while len(self._failures) > self.max_keys:
+            self._failures.popitem(last=False)
+
+    def reset(self, key: Hashable):
+        self._failures.pop(key, None)
@@ -0,0 +1,65 @@
+import hmac
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from ..database.db import enqueue_update
+from .metrics import UPDATES_ENQUEUED
+
+logger = logging.getLogger(__name__)
+
+# Апдейты без чата и пользователя (poll и т.п.) обрабатываются в одной общей очереди
+NO_CHAT_ID = 0
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """
+    Ключ упорядочивания апдейта: чат сообщения (в т.ч. у callback_query),
+    иначе пользователь (inline_query, pre_checkout_query, ...).
+    """
+    for key, event in update.items():
+        if key == 'update_id' or not isinstance(event, dict):
+            continue
+        chat = event.get('chat') or (event.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = event.get('from') or event.get('user')
+        if user:
+            return user['id']
+    return None
+
+
+def update_receiver(secret: str = ""):
+    """
+    Тонкий приёмник вебхука: проверить секрет и формат, положить апдейт в очередь.
+    Хендлеры здесь не выполняются — Telegram получает 200 сразу после INSERT.
+    """
+    async def handler(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(
+            request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret
+        ):
+            UPDATES_ENQUEUED.labels('forbidden').inc()
+            return web.Response(status=401)
+
+        body = await request.text()
+        try:
+            update = json.loads(body)
+            update_id = int(update['update_id'])
+        except (ValueError, KeyError, TypeError):
+            UPDATES_ENQUEUED.labels('invalid').inc()
+            return web.Response(status=400)
+
+        chat_id = update_chat_id(update) or NO_CHAT_ID
+        queued = await enqueue_update(update_id, chat_id, body)
+        UPDATES_ENQUEUED.labels('queued' if queued else 'duplicate').inc()
+        return web.Response()
+
+    return handler
+
+
+def setup_update_receiver(app: web.Application, path: str = '/webhook', secret: str = ""):
+    """Зарегистрировать приёмник вместо SimpleRequestHandler (режим UPDATE_WORKERS > 0)"""
+    app.router.add_post(path, update_receiver(secret))
+    logger.info(f"📥 Updates from {path} are queued for bot.worker")
@@ -0,0 +1,664 @@
+import csv
+import hmac
+import io
+import json
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse, RedirectResponse, Response
+
+from ..config import ADMIN_PASSWORD
+from ..database.db import (
+    TRACK_TYPES, fetch, fetchrow, fetchval, execute, transaction,
+    get_admin, find_location, get_locations, add_training as db_add_training,
+    cancel_training, get_used_channels,
+    verify_2fa_code, log_admin_action, enqueue_message, local_today, PAYMENT_SETTLED_STATUSES,
+    get_checkin_roster, record_checkins
+)
+from ..utils.checkin import MAX_BATCH, build_roster, parse_scans
+from ..utils.twofa import TWOFA_MAX_ATTEMPTS, FailureThrottle
+from .templating import flash, render
+
+router = APIRouter(prefix="/admin")
+
+AUDIT_PER_PAGE = 50
+ALL_CHANNELS = 24  # 3 диапазона × 8 каналов
+
+
+class LoginRequired(Exception):
+    """Нет сессии админа — обработчик в app.py уводит на /admin/login"""
+
+
+async def current_admin(request: Request) -> Dict[str, Any]:
+    """Зависимость маршрутов админки: админ из сессии (роль перечитывается из БД на каждый запрос)"""
+    user_id = request.session.get("admin_id")
+    admin = await get_admin(user_id) if user_id is not None else None
+    if not admin:
+        request.session.pop("admin_id", None)
+        raise LoginRequired()
+    return dict(admin)
+
+
+def _client_ip(request: Request) -> Optional[str]:
+    """Адрес клиента: X-Real-IP и последний хоп X-Forwarded-For ставит наш nginx, первый хоп подделывается клиентом"""
+    real_ip = request.headers.get("x-real-ip")
+    if real_ip:
+        return real_ip.strip()
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else None
+
+
+def _redirect(request: Request, name: str, **params) -> RedirectResponse:
+    return RedirectResponse(request.url_for(name, **params), status_code=303)
+
+
+class Pagination:
+    """Тот же интерфейс, что у Flask-SQLAlchemy Pagination — его ожидает audit.html"""
+
+    def __init__(self, page: int, per_page: int, total: int):
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(1, math.ceil(total / per_page))
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+        self.prev_num = page - 1
+        self.next_num = page + 1
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=5, right_edge=2):
+        last = 0
+        for num in range(1, self.pages + 1):
+            if (num <= left_edge
+                    or self.page - left_current - 1 < num < self.page + right_current
+                    or num > self.pages - right_edge):
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+
+# ========================
+# Вход и выход
+# ========================
+
+# Неудачные входы в памяти процесса: с одного IP (пароль или код) и по одному админу (код)
+LOGIN_WINDOW_SECONDS = 15 * 60
+ip_throttle = FailureThrottle(limit=20, window=LOGIN_WINDOW_SECONDS)
+user_throttle = FailureThrottle(limit=TWOFA_MAX_ATTEMPTS, window=LOGIN_WINDOW_SECONDS)
+
+
+def _login_failed(request: Request, message: str, status_code: int, ip: Optional[str], user_id: Optional[int] = None):
+    ip_throttle.failure(ip)
+    if user_id is not None:
+        user_throttle.failure(user_id)
+    flash(request, message, 'error')
+    return render(request, "admin/login.html", status_code=status_code)
+
+
+@router.api_route("/login", methods=["GET", "POST"], name="admin_login")
+async def admin_login(request: Request):
+    if request.method == "GET":
+        return render(request, "admin/login.html")
+
+    form = await request.form()
+    password = str(form.get("password", ""))
+    code = str(form.get("2fa_code", "")).strip()
+    try:
+        user_id = int(str(form.get("telegram_id", "")).strip())
+    except ValueError:
+        user_id = None
+    ip = _client_ip(request)
+
+    # Перебор отсекается до обращения к БД
+    wait = max(ip_throttle.retry_after(ip), user_throttle.retry_after(user_id) if user_id else 0)
+    if wait:
+        flash(request, f'Слишком много неудачных попыток. Повторите через {math.ceil(wait / 60)} мин.', 'error')
+        response = render(request, "admin/login.html", status_code=429)
+        response.headers["Retry-After"] = str(math.ceil(wait))
+        return response
+
+    if not ADMIN_PASSWORD or not hmac.compare_digest(password.encode(), ADMIN_PASSWORD.encode()):
+        return _login_failed(request, 'Неверный пароль', 401, ip)
+
+    if not user_id or not code:
+        flash(request, 'Введите Telegram ID и 6-значный код из Telegram (команда /get_2fa_code)', 'warning')
+        return render(request, "admin/login.html", status_code=401)
+
+    if not await verify_2fa_code(user_id, code):
+        return _login_failed(request, 'Неверный или устаревший 2FA код', 401, ip, user_id)
+    ip_throttle.reset(ip)
+    user_throttle.reset(user_id)
+
+    if not await get_admin(user_id):
+        flash(request, 'Пользователь не является администратором', 'error')
+        return render(request, "admin/login.html", status_code=403)
+
+    request.session.clear()
+    request.session["admin_id"] = user_id
+    flash(request, 'Добро пожаловать в админ-панель!', 'success')
+    return _redirect(request, "admin_dashboard")
+
+
+@router.get("/logout", name="admin_logout")
+async def admin_logout(request: Request):
+    request.session.clear()
+    return _redirect(request, "index")
+
+
+# ========================
+# Тренировки
+# ========================
+
+def scope_clause(admin: Dict[str, Any], params: List[Any], alias: str = "", by_name: bool = False) -> Optional[str]:
+    """
+    Ограничение по площадкам location_admin; None — без ограничений. alias — префикс таблицы trainings.
+    by_name — для таблиц без location_id (stats_daily): сравнение с каноническими названиями площадок
+    """
+    if admin['role'] == 'super_admin':
+        return None
+    params.append(list(admin['location_ids']))
+    prefix = f"{alias}." if alias else ""
+    if by_name:
+        return f"({prefix}city, {prefix}location) IN (SELECT city, name FROM locations WHERE id = ANY(${len(params)}::int[]))"
+    return f"{prefix}location_id = ANY(${len(params)}::int[])"
+
+
+def can_manage(admin: Dict[str, Any], location_id: Optional[int]) -> bool:
+    """Права на площадку по id — без запроса к БД: location_ids уже в данных админа"""
+    if admin['role'] == 'super_admin':
+        return True
+    return admin['role'] == 'location_admin' and location_id in admin['location_ids']
+
+
+@router.get("", name="admin_dashboard")
+async def admin_dashboard(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    q = request.query_params
+    params: List[Any] = []
+    conditions = []
+    scope = scope_clause(admin, params)
+    if scope:
+        conditions.append(scope)
+    for column, op, key in (("city", "=", "city"), ("track_type", "=", "track_type"),
+                            ("date", ">=", "date_from"), ("date", "<=", "date_to")):
+        if q.get(key):
+            params.append(q[key])
+            conditions.append(f"{column} {op} ${len(params)}")
+    if not q.get("date_from"):
+        # Без явного периода — только предстоящие; история в отчётах и статистике
+        params.append(local_today())
+        conditions.append(f"date >= ${len(params)}")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    trainings = await fetch(f'''
+        SELECT id, city, location, date, time, track_type, current_pilots, max_pilots,
+               (date < to_char(NOW(), 'YYYY-MM-DD')) AS is_past
+        FROM trainings
+        {where}
+        ORDER BY date, time
+    ''', *params)
+
+    ids = [t['id'] for t in trainings]
+    totals = await fetchrow('''
+        SELECT COUNT(*) AS total_pilots, COUNT(*) FILTER (WHERE paid = 1) AS paid_spots
+        FROM registrations
+        WHERE training_id = ANY($1::int[])
+    ''', ids)
+    revenue = await fetchval('''
+        SELECT COALESCE(SUM(amount - refunded_amount), 0)
+        FROM payments
+        WHERE training_id = ANY($1::int[]) AND status = ANY($2::text[])
+    ''', ids, list(PAYMENT_SETTLED_STATUSES))
+
+    scope_params: List[Any] = []
+    scope = scope_clause(admin, scope_params)
+    cities = await fetch(f'''
+        SELECT DISTINCT city FROM trainings {f"WHERE {scope}" if scope else ""} ORDER BY city
+    ''', *scope_params)
+
+    return render(request, "admin/dashboard.html", {
+        "trainings": trainings,
+        "cities": [c['city'] for c in cities],
+        "total_pilots": totals['total_pilots'],
+        "paid_spots": totals['paid_spots'],
+        "total_revenue": revenue,
+        "admin_role": admin['role'],
+        "locations": [loc for loc in await get_locations() if can_manage(admin, loc['id'])],
+    })
+
+
+@router.post("/add", name="add_training")
+async def add_training(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    form = await request.form()
+    city, location = form['city'], form['location']
+    date_, time_ = form['date'], form['time']
+    track_type = form.get('track_type', 'other')
+    if track_type not in TRACK_TYPES:
+        track_type = 'other'
+    try:
+        max_pilots = int(form['max_pilots'])
+    except ValueError:
+        flash(request, 'Неверное количество пилотов', 'error')
+        return _redirect(request, "admin_dashboard")
+
+    # Новую площадку (нет в справочнике) создаёт триггер при вставке — это доступно только super_admin
+    if not can_manage(admin, await find_location(city, location)):
+        flash(request, '⛔ У вас нет прав на эту площадку.', 'error')
+        return _redirect(request, "admin_dashboard")
+
+    training_id = await db_add_training(city, location, date_, time_, track_type, max_pilots)
+    await log_admin_action(admin['user_id'], 'add_training', training_id, {
+        'city': city, 'location': location, 'date': date_, 'time': time_,
+        'track_type': track_type, 'max_pilots': max_pilots
+    }, ip_address=_client_ip(request))
+
+    flash(request, 'Тренировка добавлена', 'success')
+    return _redirect(request, "admin_dashboard")
+
+
+@router.post("/delete/{training_id:int}", name="delete_training")
+async def delete_training(request: Request, training_id: int, admin: Dict[str, Any] = Depends(current_admin)):
+    """Отмена: записи, возвраты и уведомления — одной транзакцией, рассылка уходит в фоне"""
+    training = await fetchrow('SELECT location_id FROM trainings WHERE id = $1', training_id)
+    if not training:
+        flash(request, 'Тренировка не найдена.', 'error')
+        return _redirect(request, "admin_dashboard")
+
+    if not can_manage(admin, training['location_id']):
+        flash(request, '⛔ У вас нет прав на удаление этой тренировки.', 'error')
+        return _redirect(request, "admin_dashboard")
+
+    form = await request.form()
+    reason = str(form.get('reason', '')).strip()[:200] or None
+    canceled = await cancel_training(training_id, reason)
+    if canceled is None:
+        flash(request, 'Тренировка уже удалена.', 'warning')
+        return _redirect(request, "admin_dashboard")
+
+    await log_admin_action(admin['user_id'], 'delete_training', training_id, {
+        'city': canceled['city'], 'location': canceled['location'], 'reason': reason,
+        'registrations': canceled['registrations'], 'waitlisted': canceled['waitlisted'],
+        'refunds': len(canceled['refund_payment_ids'])
+    }, ip_address=_client_ip(request))
+
+    flash(request, f"Тренировка отменена: уведомлений пилотам — {canceled['registrations'] + canceled['waitlisted']}, "
+                   f"возвратов — {len(canceled['refund_payment_ids'])}", 'success')
+    return _redirect(request, "admin_dashboard")
+
+
+async def _registration_with_training(reg_id: int):
+    return await fetchrow('''
+        SELECT r.training_id, r.user_id, t.city, t.location, t.location_id, t.date, t.time
+        FROM registrations r
+        JOIN trainings t ON t.id = r.training_id
+        WHERE r.id = $1
+    ''', reg_id)
+
+
+@router.post("/edit-channel", name="edit_pilot_channel")
+async def edit_pilot_channel(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    form = await request.form()
+    try:
+        reg_id = int(form['reg_id'])
+        band = str(form['band'])
+        channel = int(form['channel'])
+    except (KeyError, ValueError):
+        return JSONResponse({'status': 'error', 'message': 'Неверные параметры'})
+
+    reg = await _registration_with_training(reg_id)
+    if not reg:
+        return JSONResponse({'status': 'error', 'message': 'Запись не найдена'})
+    if not can_manage(admin, reg['location_id']):
+        return JSONResponse({'status': 'error', 'message': 'Нет прав на эту площадку'})
+
+    try:
+        await execute('UPDATE registrations SET vtx_band = $1, vtx_channel = $2 WHERE id = $3', band, channel, reg_id)
+    except (asyncpg.UniqueViolationError, asyncpg.CheckViolationError):
+        return JSONResponse({'status': 'error', 'message': 'Канал занят или недопустим'})
+
+    await log_admin_action(admin['user_id'], 'edit_pilot_channel', reg_id, {
+        'training_id': reg['training_id'], 'user_id': reg['user_id'], 'new_band': band, 'new_channel': channel
+    }, ip_address=_client_ip(request))
+    return JSONResponse({'status': 'success'})
+
+
+@router.get("/pilots/{training_id:int}", name="get_pilots_for_admin")
+async def get_pilots_for_admin(request: Request, training_id: int, admin: Dict[str, Any] = Depends(current_admin)):
+    training = await fetchrow(
+        'SELECT id, city, location, location_id, date, time FROM trainings WHERE id = $1', training_id
+    )
+    if not training:
+        return Response("Тренировка не найдена", status_code=404)
+    if not can_manage(admin, training['location_id']):
+        return Response("Доступ запрещён", status_code=403)
+
+    pilots = await fetch('''
+        SELECT
+            r.id,
+            COALESCE(uc.nickname, 'Аноним') AS display_name,
+            uc.username,
+            r.vtx_band,
+            r.vtx_channel,
+            r.paid,
+            r.checked_in_at
+        FROM registrations r
+        LEFT JOIN user_consent uc ON r.user_id = uc.user_id
+        WHERE r.training_id = $1
+        ORDER BY r.vtx_band, r.vtx_channel
+    ''', training_id)
+    used_channels = set(await get_used_channels(training_id))
+
+    return render(request, "admin/pilots_modal.html", {
+        "training": training,
+        "pilots": pilots,
+        "used_channels": used_channels,
+        "free_channels": ALL_CHANNELS - len(used_channels),
+        "paid_count": sum(1 for p in pilots if p['paid']),
+        "checked_in_count": sum(1 for p in pilots if p['checked_in_at']),
+    })
+
+
+@router.post("/notify-pilot/{reg_id:int}", name="notify_pilot")
+async def notify_pilot(request: Request, reg_id: int, admin: Dict[str, Any] = Depends(current_admin)):
+    """Напоминание пилоту через outbox — отправит бот, веб не ходит в Telegram API сам"""
+    reg = await _registration_with_training(reg_id)
+    if not reg:
+        return JSONResponse({'status': 'error', 'message': 'Запись не найдена'})
+    if not can_manage(admin, reg['location_id']):
+        return JSONResponse({'status': 'error', 'message': 'Нет прав на эту площадку'})
+
+    async with transaction() as conn:
+        await enqueue_message(conn, reg['user_id'], ('notifications-reminder', {
+            'location': reg['location'], 'city': reg['city'], 'date': reg['date'], 'time': reg['time'],
+        }))
+    await log_admin_action(admin['user_id'], 'notify_pilot', reg_id, {
+        'training_id': reg['training_id'], 'user_id': reg['user_id']
+    }, ip_address=_client_ip(request))
+    return JSONResponse({'status': 'success'})
+
+
+# ========================
+# Отметка явки на площадке
+# ========================
+
+async def _managed_training(training_id: int, admin: Dict[str, Any]):
+    """Тренировка и ответ с ошибкой (404/403), если её нет или нет прав на площадку"""
+    training = await fetchrow(
+        'SELECT id, city, location, location_id, date, time FROM trainings WHERE id = $1', training_id
+    )
+    if not training:
+        return None, JSONResponse({'status': 'error', 'message': 'Тренировка не найдена'}, status_code=404)
+    if not can_manage(admin, training['location_id']):
+        return None, JSONResponse({'status': 'error', 'message': 'Нет прав на эту площадку'}, status_code=403)
+    return training, None
+
+
+@router.get("/checkin/{training_id:int}/roster", name="checkin_roster")
+async def checkin_roster(request: Request, training_id: int, admin: Dict[str, Any] = Depends(current_admin)):
+    """Ростер для проверки QR без сети: скачивается перед выездом на площадку"""
+    training, error = await _managed_training(training_id, admin)
+    if error:
+        return error
+    roster = build_roster(training, await get_checkin_roster(training_id), datetime.now(timezone.utc))
+    body = json.dumps(roster, ensure_ascii=False, separators=(",", ":"))
+    return Response(body, media_type="application/json", headers={
+        "Content-Disposition": f'attachment; filename="roster_{training_id}.json"',
+        "Cache-Control": "no-store",
+    })
+
+
+@router.post("/checkin/{training_id:int}", name="checkin_upload")
+async def checkin_upload(request: Request, training_id: int, admin: Dict[str, Any] = Depends(current_admin)):
+    """
+    Пачка сканов с устройства: {"scans": [{"token": "fpv1....", "scanned_at": "ISO-время"}]}.
+    Подписи проверяются в памяти, отметки пишутся одним UPDATE; повторная загрузка безопасна.
+    """
+    training, error = await _managed_training(training_id, admin)
+    if error:
+        return error
+    try:
+        scans = (await request.json()).get("scans")
+    except (ValueError, AttributeError):
+        scans = None
+    if not isinstance(scans, list) or len(scans) > MAX_BATCH:
+        return JSONResponse({'status': 'error', 'message': f'Ожидается scans: список до {MAX_BATCH} сканов'},
+                            status_code=400)
+
+    accepted, rejected = parse_scans(training_id, scans, datetime.now(timezone.utc))
+    checked_in = await record_checkins(training_id, accepted, admin['user_id'])
+    if checked_in or rejected:
+        await log_admin_action(admin['user_id'], 'checkin_batch', training_id, {
+            'checked_in': len(checked_in), 'skipped': len(accepted) - len(checked_in), 'rejected': len(rejected)
+        }, ip_address=_client_ip(request))
+    return JSONResponse({
+        'status': 'success',
+        'checked_in': checked_in,
+        # Уже отмеченные раньше или отменённые записи
+        'skipped': sorted(set(accepted) - set(checked_in)),
+        'rejected': rejected,
+    })
+
+
+# ========================
+# Аудит
+# ========================
+
+def _audit_filters(request: Request, admin: Dict[str, Any]):
+    """WHERE для журнала аудита: location_admin видит только свои действия"""
+    q = request.query_params
+    params: List[Any] = []
+    conditions = []
+    admin_filter = q.get('admin_id') or q.get('user')
+    if admin['role'] != 'super_admin':
+        admin_filter = admin['user_id']
+    if admin_filter:
+        try:
+            params.append(int(admin_filter))
+            conditions.append(f"a.admin_user_id = ${len(params)}")
+        except ValueError:
+            pass
+    if q.get('action'):
+        params.append(q['action'])
+        conditions.append(f"a.action = ${len(params)}")
+    for key, op in (('date_from', '>='), ('date_to', '<')):
+        if q.get(key):
+            try:
+                day = date.fromisoformat(q[key])
+            except ValueError:
+                continue
+            params.append(day)
+            bound = f"${len(params)}::date" if op == '>=' else f"${len(params)}::date + 1"
+            conditions.append(f"a.created_at {op} {bound}")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+@router.get("/audit", name="admin_audit")
+async def admin_audit(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    where, params = _audit_filters(request, admin)
+    try:
+        page = max(1, int(request.query_params.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    total = await fetchval(f'SELECT COUNT(*) FROM admin_audit_log a {where}', *params)
+    logs = await fetch(f'''
+        SELECT a.*, u.nickname AS admin_name
+        FROM admin_audit_log a
+        LEFT JOIN user_consent u ON a.admin_user_id = u.user_id
+        {where}
+        ORDER BY a.created_at DESC
+        LIMIT {AUDIT_PER_PAGE} OFFSET {(page - 1) * AUDIT_PER_PAGE}
+    ''', *params)
+    all_admins = await fetch('''
+        SELECT a.user_id, u.nickname
+        FROM admins a
+        LEFT JOIN user_consent u ON a.user_id = u.user_id
+        ORDER BY a.user_id
+    ''')
+    today_count = await fetchval(f'''
+        SELECT COUNT(*) FROM admin_audit_log a
+        {where + " AND" if where else "WHERE"} a.created_at >= CURRENT_DATE
+    ''', *params)
+
+    return render(request, "admin/audit.html", {
+        "logs": logs,
+        "pagination": Pagination(page, AUDIT_PER_PAGE, total),
+        "all_admins": all_admins,
+        "today_count": today_count,
+    })
+
+
+@router.get("/audit/export.csv", name="export_audit_csv")
+async def export_audit_csv(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    where, params = _audit_filters(request, admin)
+    logs = await fetch(f'''
+        SELECT a.created_at, a.admin_user_id, u.nickname AS admin_name, a.action,
+               a.target_id, a.details::text AS details, a.ip_address
+        FROM admin_audit_log a
+        LEFT JOIN user_consent u ON a.admin_user_id = u.user_id
+        {where}
+        ORDER BY a.created_at DESC
+    ''', *params)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["created_at", "admin_user_id", "admin_name", "action", "target_id", "details", "ip_address"])
+    for log in logs:
+        writer.writerow([log['created_at'].isoformat(), log['admin_user_id'], log['admin_name'] or '',
+                         log['action'], log['target_id'] or '', log['details'] or '', log['ip_address'] or ''])
+    return Response(
+        buffer.getvalue().encode('utf-8-sig'),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="audit.csv"'},
+    )
+
+
+# ========================
+# Профиль и статистика
+# ========================
+
+@router.get("/profile", name="admin_profile")
+async def admin_profile(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    user_id = admin['user_id']
+    created_at = await fetchval('SELECT created_at FROM admins WHERE user_id = $1', user_id)
+    user_data = await fetchrow(
+        'SELECT username, nickname, consent_date FROM user_consent WHERE user_id = $1', user_id
+    ) or {}
+    stats = await fetchrow('''
+        SELECT
+            COUNT(*) FILTER (WHERE action = 'add_training') AS added_trainings,
+            COUNT(*) FILTER (WHERE action = 'edit_pilot_channel') AS channel_edits,
+            MAX(created_at) AS last_activity
+        FROM admin_audit_log
+        WHERE admin_user_id = $1
+    ''', user_id)
+    params: List[Any] = []
+    scope = scope_clause(admin, params)
+    pilot_registrations = await fetchval(f'''
+        SELECT COUNT(*) FROM registrations_all
+        WHERE training_id IN (SELECT id FROM trainings_all {f"WHERE {scope}" if scope else ""})
+    ''', *params)
+
+    return render(request, "admin/profile.html", {
+        "admin": {**admin, "created_at": created_at},
+        "user_data": user_data,
+        "stats": {**dict(stats), "pilot_registrations": pilot_registrations},
+    })
+
+
+# Период графиков по умолчанию и максимальный (дней)
+STATS_DEFAULT_DAYS = 90
+STATS_MAX_DAYS = 731
+
+STATS_TOTALS = '''SUM(trainings) AS trainings, SUM(capacity) AS capacity,
+                  SUM(registrations) AS registrations, SUM(paid) AS paid, SUM(revenue) AS revenue'''
+
+
+def _stats_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    capacity = row.get('capacity') or 0
+    registrations = row.get('registrations') or 0
+    return {
+        'trainings': row.get('trainings') or 0,
+        'registrations': registrations,
+        'paid': row.get('paid') or 0,
+        'revenue': float(row.get('revenue') or 0),
+        'fill_rate': round(100 * registrations / capacity, 1) if capacity else 0,
+    }
+
+
+@router.get("/stats", name="stats")
+async def stats(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    params: List[Any] = []
+    scope = scope_clause(admin, params, by_name=True)
+    cities = await fetch(
+        f"SELECT DISTINCT city FROM stats_daily {f'WHERE {scope}' if scope else ''} ORDER BY city", *params
+    )
+    return render(request, "admin/stats.html", {
+        "admin": admin,
+        "cities": [r['city'] for r in cities],
+        "default_days": STATS_DEFAULT_DAYS,
+    })
+
+
+@router.get("/stats/data", name="stats_data")
+async def stats_data(request: Request, admin: Dict[str, Any] = Depends(current_admin)):
+    """
+    Ряды для графиков из дневных агрегатов stats_daily: по дням (пропуски — нулями),
+    по типам трасс и по площадкам. Объём чтения зависит от периода, а не от истории записей.
+    """
+    q = request.query_params
+    try:
+        date_to = date.fromisoformat(q['date_to']) if q.get('date_to') else date.today()
+        date_from = (date.fromisoformat(q['date_from']) if q.get('date_from')
+                     else date_to - timedelta(days=STATS_DEFAULT_DAYS - 1))
+    except ValueError:
+        return JSONResponse({'status': 'error', 'message': 'Даты в формате YYYY-MM-DD'}, status_code=400)
+    if date_from > date_to or (date_to - date_from).days >= STATS_MAX_DAYS:
+        return JSONResponse({'status': 'error', 'message': f'Период — не больше {STATS_MAX_DAYS} дней'},
+                            status_code=400)
+
+    params: List[Any] = [date_from, date_to]
+    conditions = ["day BETWEEN $1 AND $2"]
+    scope = scope_clause(admin, params, by_name=True)
+    if scope:
+        conditions.append(scope)
+    for key in ("city", "track_type"):
+        if q.get(key):
+            params.append(q[key])
+            conditions.append(f"{key} = ${len(params)}")
+    where = " AND ".join(conditions)
+
+    by_day = {r['day']: _stats_row(dict(r)) for r in await fetch(
+        f"SELECT day, {STATS_TOTALS} FROM stats_daily WHERE {where} GROUP BY day", *params
+    )}
+    by_track = await fetch(f'''
+        SELECT track_type, {STATS_TOTALS} FROM stats_daily WHERE {where}
+        GROUP BY track_type ORDER BY track_type
+    ''', *params)
+    by_location = await fetch(f'''
+        SELECT city, location, {STATS_TOTALS} FROM stats_daily WHERE {where}
+        GROUP BY city, location ORDER BY SUM(registrations) DESC, city, location
+    ''', *params)
+
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    daily = [by_day.get(d) or _stats_row({}) for d in days]
+    totals = _stats_row({key: sum(row[key] for row in daily) for key in ('trainings', 'registrations', 'paid', 'revenue')}
+                        | {'capacity': sum((r['capacity'] or 0) for r in by_track)})
+    return JSONResponse({
+        'status': 'success',
+        'labels': [d.isoformat() for d in days],
+        'daily': {key: [row[key] for row in daily] for key in totals},
+        'by_track': [
+            {'track_type': r['track_type'], 'label': TRACK_TYPES.get(r['track_type'], r['track_type']),
+             **_stats_row(dict(r))}
+            for r in by_track
+        ],
+        'by_location': [{'city': r['city'], 'location': r['location'], **_stats_row(dict(r))} for r in by_location],
+        'totals': totals,
+    })
+
@@ -0,0 +1,397 @@
+import base64
+import binascii
+import gzip
+import hashlib
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+import pytz
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
+
+from ..config import BOT_TOKEN, TELEGRAM_CHAT_ID, TIMEZONE
+from ..database.db import TRACK_TYPES, VTX_BANDS, fetch, fetchval
+from .events import schedule_events
+from .public import load_upcoming_trainings
+
+try:
+    import brotli
+except ImportError:  # br отдаётся, только если установлен пакет brotli
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api")
+
+
+# ========================
+# API для интеграций
+# ========================
+
+@router.get("/trainings", name="api_trainings")
+async def api_trainings():
+    trainings = await schedule_events.cached("schedule", load_upcoming_trainings)
+    result = [{
+        "id": t["id"],
+        "city": t["city"],
+        "location": t["location"],
+        "datetime": f"{t['date']}T{t['time']}:00",
+        "track_type": t["track_type"],
+        "spots": {
+            "current": t["current_pilots"],
+            "max": t["max_pilots"]
+        }
+    } for t in trainings]
+
+    return JSONResponse({
+        "status": "success",
+        "data": result,
+        "count": len(result)
+    })
+
+
+@router.post("/alert", name="handle_alert")
+async def handle_alert(request: Request):
+    """Приёмник Alertmanager: пересылает алерты в TELEGRAM_CHAT_ID"""
+    data = await request.json()
+    alerts = data.get('alerts', [])
+    if not (BOT_TOKEN and TELEGRAM_CHAT_ID):
+        logger.warning(f"⚠️ Алерты не отправлены ({len(alerts)}): не задан TELEGRAM_CHAT_ID")
+        return JSONResponse({"status": "ok"})
+
+    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+    timeout = aiohttp.ClientTimeout(total=10)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for alert in alerts:
+            labels = alert.get('labels', {})
+            message = (
+                f"🚨 *{alert.get('status', '').upper()}*: {labels.get('alertname', 'Unknown')}\n"
+                f"📍 Instance: {labels.get('instance', 'Unknown')}\n"
+                f"📝 {alert.get('annotations', {}).get('description', '')}"
+            )
+            try:
+                async with session.post(url, json={
+                    "chat_id": TELEGRAM_CHAT_ID,
+                    "text": message,
+                    "parse_mode": "Markdown"
+                }) as response:
+                    if response.status != 200:
+                        logger.error(f"Не удалось отправить алерт: HTTP {response.status}")
+            except aiohttp.ClientError as e:
+                logger.error(f"Не удалось отправить алерт: {e}")
+
+    return JSONResponse({"status": "ok"})
+
+
+# ========================
+# API v2: фильтры, курсоры, выбор полей, условный GET
+# ========================
+
+V2_FIELDS = ("id", "city", "location", "datetime", "track_type", "spots")
+V2_DEFAULT_LIMIT = 50
+V2_MAX_LIMIT = 200
+V2_MAX_IDS = 100
+# Меньше этого сжимать невыгодно: заголовки дороже экономии
+COMPRESS_MIN_BYTES = 1024
+CACHE_CONTROL = "public, max-age=10"
+
+_tz = pytz.timezone(TIMEZONE)
+
+
+class ApiError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+
+
+class CachedBody:
+    """Готовое JSON-тело со строгим ETag и лениво сжатыми вариантами — живёт в кэше до NOTIFY"""
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:24]}"'
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self._encoded[encoding]
+
+
+def _accepted_encoding(request: Request) -> Optional[str]:
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in request.headers.get("accept-encoding", "").split(",")
+        if not part.strip().endswith(";q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _cached_response(request: Request, cached: CachedBody) -> Response:
+    headers = {"ETag": cached.etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if _etag_matches(request, cached.etag):
+        return Response(status_code=304, headers=headers)
+    encoding = _accepted_encoding(request) if len(cached.body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(cached.encoded(encoding), media_type="application/json", headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+
+def _error(message: str) -> JSONResponse:
+    return JSONResponse({"status": "error", "message": message}, status_code=400)
+
+
+def _encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["date"], row["time"], row["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    try:
+        d, t, i = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(d), str(t), int(i)
+    except (binascii.Error, ValueError, TypeError):
+        raise ApiError("Некорректный cursor")
+
+
+def _iso_date(value: str, name: str) -> str:
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ApiError(f"{name}: ожидается дата YYYY-MM-DD")
+
+
+def _v2_fields(value: Optional[str]) -> Tuple[str, ...]:
+    if not value:
+        return V2_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in V2_FIELDS]
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(unknown)}; доступны: {', '.join(V2_FIELDS)}")
+    return fields or V2_FIELDS
+
+
+def _v2_item(row: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    full = {
+        "id": row["id"],
+        "city": row["city"],
+        "location": row["location"],
+        "datetime": f"{row['date']}T{row['time']}:00",
+        "track_type": row["track_type"],
+        "spots": {"current": row["current_pilots"], "max": row["max_pilots"]},
+    }
+    return {f: full[f] for f in fields}
+
+
+async def _load_trainings_page(q: Dict[str, str]) -> CachedBody:
+    """Одна страница по ключу (date, time, id): без OFFSET, стоимость не растёт к концу списка"""
+    fields = _v2_fields(q.get("fields"))
+    try:
+        limit = min(max(int(q.get("limit", V2_DEFAULT_LIMIT)), 1), V2_MAX_LIMIT)
+    except ValueError:
+        raise ApiError("limit: ожидается целое число")
+    if q.get("track_type") and q["track_type"] not in TRACK_TYPES:
+        raise ApiError(f"track_type: одно из {', '.join(TRACK_TYPES)}")
+
+    params: List[Any] = []
+    conditions = []
+
+    def where(sql: str, *values):
+        for value in values:
+            params.append(value)
+            sql = sql.replace("?", f"${len(params)}", 1)
+        conditions.append(sql)
+
+    date_from = _iso_date(q["date_from"], "date_from") if q.get("date_from") else datetime.now(_tz).date().isoformat()
+    where("date >= ?", date_from)
+    if q.get("date_to"):
+        where("date <= ?", _iso_date(q["date_to"], "date_to"))
+    if q.get("city"):
+        where("city = ?", q["city"])
+    if q.get("location"):
+        where("location = ?", q["location"])
+    if q.get("track_type"):
+        where("track_type = ?", q["track_type"])
+    if q.get("cursor"):
+        where("(date, time, id) > (?, ?, ?)", *_decode_cursor(q["cursor"]))
+
+    rows = await fetch(f'''
+        SELECT id, city, location, date, time, track_type, current_pilots, max_pilots
+        FROM trainings
+        WHERE {' AND '.join(conditions)}
+        ORDER BY date, time, id
+        LIMIT {limit + 1}
+    ''', *params, name="api_v2_trainings")
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return CachedBody({
+        "status": "success",
+        "data": [_v2_item(r, fields) for r in rows],
+        "count": len(rows),
+        "next_cursor": _encode_cursor(rows[-1]) if has_more else None,
+    })
+
+
+@router.get("/v2/trainings", name="api_v2_trainings")
+async def api_v2_trainings(request: Request):
+    """
+    Фильтры: city, location, track_type, date_from (по умолчанию сегодня), date_to.
+    Страницы: limit (≤ 200) и cursor из next_cursor. Поля: fields=id,datetime,spots.
+    """
+    q = dict(request.query_params)
+    key = "v2:trainings:" + json.dumps(sorted(q.items()), ensure_ascii=False)
+    try:
+        cached = await schedule_events.cached(key, lambda: _load_trainings_page(q))
+    except ApiError as e:
+        return _error(e.message)
+    return _cached_response(request, cached)
+
+
+async def _load_occupancy(training_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Занятость нескольких тренировок одним запросом; без ников — только места и каналы"""
+    rows = await fetch('''
+        SELECT t.id, t.current_pilots, t.max_pilots,
+               COUNT(r.id) FILTER (WHERE r.paid = 1) AS paid,
+               COALESCE(array_agg(r.vtx_band || r.vtx_channel ORDER BY r.vtx_band, r.vtx_channel)
+                        FILTER (WHERE r.id IS NOT NULL), '{}') AS channels
+        FROM trainings t
+        LEFT JOIN registrations r ON r.training_id = t.id
+        WHERE t.id = ANY($1::int[])
+        GROUP BY t.id
+    ''', training_ids, name="api_v2_occupancy")
+
+    result = {}
+    for row in rows:
+        used = {band: [] for band in VTX_BANDS}
+        for code in row["channels"]:
+            used[code[0]].append(int(code[1:]))
+        result[row["id"]] = {
+            "id": row["id"],
+            "spots": {"current": row["current_pilots"], "max": row["max_pilots"], "paid": row["paid"]},
+            "channels": {"used": used, "free": len(VTX_BANDS) * 8 - len(row["channels"])},
+        }
+    return result
+
+
+@router.get("/v2/trainings/{training_id:int}/pilots", name="api_v2_training_pilots")
+async def api_v2_training_pilots(request: Request, training_id: int):
+    async def load():
+        occupancy = await _load_occupancy([training_id])
+        return CachedBody({"status": "success", "data": occupancy[training_id]}) if occupancy else None
+
+    cached = await schedule_events.cached(f"v2:pilots:{training_id}", load)
+    if cached is None:
+        return JSONResponse({"status": "error", "message": "Тренировка не найдена"}, status_code=404)
+    return _cached_response(request, cached)
+
+
+@router.get("/v2/occupancy", name="api_v2_occupancy")
+async def api_v2_occupancy(request: Request):
+    """Занятость до 100 тренировок за один запрос: ids=1,2,3"""
+    try:
+        ids = sorted({int(i) for i in request.query_params.get("ids", "").split(",") if i.strip()})
+    except ValueError:
+        return _error("ids: ожидаются целые числа через запятую")
+    if not ids or len(ids) > V2_MAX_IDS:
+        return _error(f"ids: от 1 до {V2_MAX_IDS} тренировок")
+
+    async def load():
+        occupancy = await _load_occupancy(ids)
+        return CachedBody({"status": "success", "data": [occupancy[i] for i in ids if i in occupancy]})
+
+    cached = await schedule_events.cached("v2:occupancy:" + ",".join(map(str, ids)), load)
+    return _cached_response(request, cached)
+
+
+# ========================
+# Дельта-синхронизация: только изменённое после токена
+# ========================
+
+# Перекрытие окна: строка, закоммиченная позже, чем началась её транзакция (updated_at = NOW() транзакции),
+# попадёт в следующий ответ. Клиент применяет изменения идемпотентно (upsert по id).
+CHANGES_OVERLAP = timedelta(seconds=30)
+# Токен округляется вниз, чтобы опросы разных клиентов попадали в общий ключ кэша
+CHANGES_TOKEN_STEP = 10
+TOMBSTONE_RETENTION = timedelta(days=30)  # совпадает с TOMBSTONE_RETENTION_DAYS планировщика
+
+
+def _encode_change_token(moment: datetime) -> str:
+    return base64.urlsafe_b64encode(str(int(moment.timestamp())).encode()).decode().rstrip("=")
+
+
+def _decode_change_token(token: str) -> datetime:
+    try:
+        return datetime.fromtimestamp(int(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))), pytz.utc)
+    except (binascii.Error, ValueError, OverflowError):
+        raise ApiError("Некорректный since")
+
+
+async def _load_changes(since: Optional[datetime]) -> CachedBody:
+    now = await fetchval("SELECT NOW()", name="api_v2_changes_now")
+    token_moment = datetime.fromtimestamp(int(now.timestamp()) // CHANGES_TOKEN_STEP * CHANGES_TOKEN_STEP, pytz.utc)
+
+    if since is None or now - since > TOMBSTONE_RETENTION:
+        # Полная выгрузка: первый запрос или отметки об удалении уже вычищены
+        rows = await fetch('''
+            SELECT id, city, location, date, time, track_type, current_pilots, max_pilots, updated_at
+            FROM trainings
+            WHERE date >= $1
+            ORDER BY id
+        ''', datetime.now(_tz).date().isoformat(), name="api_v2_changes_full")
+        deleted, reset = [], since is not None
+    else:
+        lower = since - CHANGES_OVERLAP
+        rows = await fetch('''
+            SELECT id, city, location, date, time, track_type, current_pilots, max_pilots, updated_at
+            FROM trainings
+            WHERE updated_at > $1
+            ORDER BY id
+        ''', lower, name="api_v2_changes")
+        deleted = [r['training_id'] for r in await fetch(
+            'SELECT training_id FROM training_tombstones WHERE deleted_at > $1 ORDER BY training_id',
+            lower, name="api_v2_changes_deleted"
+        )]
+        reset = False
+
+    return CachedBody({
+        "status": "success",
+        "reset": reset,
+        "changed": [{**_v2_item(r, V2_FIELDS), "updated_at": r['updated_at'].isoformat()} for r in rows],
+        "deleted": deleted,
+        "next_since": _encode_change_token(token_moment),
+    })
+
+
+@router.get("/v2/trainings/changes", name="api_v2_training_changes")
+async def api_v2_training_changes(request: Request):
+    """
+    Без since — все будущие тренировки и токен. Дальше ?since=<next_since>: изменённые
+    тренировки (включая прошедшие) и id удалённых. reset=true — токен старше хранения
+    удалений, ответ содержит полный список и клиент должен заменить свою копию.
+    """
+    try:
+        token = request.query_params.get("since")
+        since = _decode_change_token(token) if token else None
+        cached = await schedule_events.cached(f"v2:changes:{token or ''}", lambda: _load_changes(since))
+    except ApiError as e:
+        return _error(e.message)
+    return _cached_response(request, cached)
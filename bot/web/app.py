@@ -1,31 +1,76 @@
+import logging
+import os
+import secrets
+import time
 from fastapi import FastAPI, Request
-from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from ..database.db import fetch, init_db_pool
-from ..config import SCHEDULE_URL
-import qrcode
-from io import BytesIO
-import base64
+from fastapi.responses import RedirectResponse, Response
+from starlette.middleware.sessions import SessionMiddleware
+from ..database.db import init_db_pool, close_db_pool
+from ..utils.metrics import HTTP_REQUEST_DURATION, CONTENT_TYPE_LATEST, render_metrics
+from ..config import API_KEY
+from . import admin, api, exports, feeds, public
+from .events import schedule_events
 
-app = FastAPI(title="FPV Admin Panel")
+logger = logging.getLogger(__name__)
 
-# Инициализация пула БД при старте веб-приложения
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "static")
+
+app = FastAPI(title="FPV Training Platform")
+
+if not API_KEY:
+    logger.warning("⚠️ API_KEY не задан: сессии админки сбросятся при перезапуске")
+app.add_middleware(SessionMiddleware, secret_key=API_KEY or secrets.token_hex(32),
+                   session_cookie="fpv_admin", same_site="lax", https_only=False)
+
+
+# Пул БД и LISTEN на изменения расписания — на старте веб-приложения
 @app.on_event("startup")
 async def on_startup():
     await init_db_pool()
-    print("✅ Web: Database pool initialized")
+    await schedule_events.start()
+    logger.info("✅ Web: Database pool initialized")
+
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    from ..database.db import close_db_pool
+    await schedule_events.stop()
     await close_db_pool()
-    print("✅ Web: Database pool closed")
+    logger.info("✅ Web: Database pool closed")
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """http_request_duration_seconds по шаблону маршрута (без id в пути)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_DURATION.labels(request.method, path, status).observe(time.perf_counter() - start)
+
+
+@app.exception_handler(admin.LoginRequired)
+async def login_required(request: Request, exc: admin.LoginRequired):
+    if request.method == "GET" and "text/html" in request.headers.get("accept", ""):
+        return RedirectResponse(request.url_for("admin_login"), status_code=303)
+    return Response("Требуется вход", status_code=401)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 
-app.mount("/static", StaticFiles(directory="bot/web/static"), name="static")
-templates = Jinja2Templates(directory="bot/web/templates")
+app.include_router(public.router)
+app.include_router(admin.router)
+app.include_router(exports.router)
+app.include_router(api.router)
+app.include_router(feeds.router)
 
-@app.get("/", response_class=HTMLResponse)
-async def admin_panel(request: Request):
-    trainings = await fetch('SELECT * FROM trainings ORDER BY date, time')
-    return templates.TemplateResponse("admin.html", {"request": request, "trainings": trainings})
\ No newline at end of file
+# После роутеров: /static/qr-schedule.png генерируется маршрутом, остальное — файлы
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Set, Tuple
+
+from ..database.db import listen, unlisten
+from ..utils.metrics import SSE_CLIENTS
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CHANNEL = 'schedule_changed'
+# Комментарий-пинг, чтобы прокси не закрывали молчащее соединение
+KEEPALIVE_SECONDS = 15
+# Кэш расписания живёт до NOTIFY или не дольше TTL (прошедшие тренировки уходят по времени, без NOTIFY)
+CACHE_TTL_SECONDS = 30
+# Потолок ключей кэша (разные фильтры API); при переполнении выбрасываются устаревшие версии
+CACHE_MAX_KEYS = 1024
+
+
+class ScheduleEvents:
+    """
+    Одно LISTEN-соединение на процесс вместо опроса БД каждым клиентом.
+    NOTIFY увеличивает version: SSE-подписчики получают `refresh`, кэш расписания устаревает.
+    Очередь подписчика на один элемент — пачка изменений схлопывается в одно обновление.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._conn = None
+        self._cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def start(self):
+        self._conn = await listen(SCHEDULE_CHANNEL, self._on_notify)
+        logger.info(f"📡 Web: LISTEN {SCHEDULE_CHANNEL}")
+
+    async def stop(self):
+        if self._conn is not None:
+            await unlisten(self._conn, SCHEDULE_CHANNEL, self._on_notify)
+            self._conn = None
+        for queue in list(self._subscribers):
+            self._offer(queue, None)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.version += 1
+        for queue in self._subscribers:
+            self._offer(queue, self.version)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, item):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(item)
+
+    async def stream(self, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+        """Поток text/event-stream для одного клиента"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        SSE_CLIENTS.inc()
+        try:
+            yield "retry: 5000\n\n"
+            while not await is_disconnected():
+                try:
+                    version = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if version is None:
+                    break
+                yield f"event: refresh\ndata: {json.dumps({'version': version, 'time': time.time()})}\n\n"
+        finally:
+            self._subscribers.discard(queue)
+            SSE_CLIENTS.dec()
+
+    async def cached(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Значение loader() для текущей версии расписания.
+        Одновременные запросы после NOTIFY ждут одну загрузку, а не идут в БД толпой.
+        """
+        stamp = (self.version, int(time.monotonic() // CACHE_TTL_SECONDS))
+        hit = self._cache.get(key)
+        if hit and hit[0] == stamp:
+            return hit[1]
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            hit = self._cache.get(key)
+            if hit and hit[0] == stamp:
+                return hit[1]
+            value = await loader()
+            if len(self._cache) >= CACHE_MAX_KEYS:
+                self._evict(stamp)
+            self._cache[key] = (stamp, value)
+            return value
+
+    def _evict(self, stamp: Tuple[int, int]):
+        self._cache = {k: v for k, v in self._cache.items() if v[0] == stamp}
+        if len(self._cache) >= CACHE_MAX_KEYS:
+            self._cache.clear()
+        self._locks = {k: lock for k, lock in self._locks.items() if lock.locked()}
+
+
+schedule_events = ScheduleEvents()
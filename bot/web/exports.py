@@ -0,0 +1,257 @@
+import asyncio
+import csv
+import io
+import tempfile
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+
+from ..database.db import TRACK_TYPES, history_tables, transaction
+from ..utils.pdf import pdf_font
+from .admin import current_admin, scope_clause
+
+router = APIRouter(prefix="/admin/export")
+
+# Строк за один проход серверного курсора и за один вызов записи в файл
+EXPORT_PREFETCH = 500
+# Размер куска ответа при отдаче готового XLSX/PDF из временного файла
+CHUNK_SIZE = 64 * 1024
+
+COLUMNS: Sequence[Tuple[str, str]] = (
+    ("training_id", "ID тренировки"),
+    ("date", "Дата"),
+    ("time", "Время"),
+    ("city", "Город"),
+    ("location", "Площадка"),
+    ("track_type", "Трасса"),
+    ("display_name", "Пилот"),
+    ("username", "Username"),
+    ("channel", "Канал"),
+    ("paid", "Оплата"),
+)
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+
+class ExportError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+
+
+def _report_filters(params: Dict[str, str], admin: Dict[str, Any]) -> Tuple[Tuple[str, str], str, List[Any], str]:
+    """
+    Таблицы и WHERE отчёта: одна тренировка, площадка или период (с учётом прав location_admin) и имя файла.
+    Архив подключается, если период начинается раньше границы архивации или тренировка задана по id.
+    """
+    args: List[Any] = []
+    conditions = []
+    scope = scope_clause(admin, args, alias="t")
+    if scope:
+        conditions.append(scope)
+
+    def add(sql: str, value):
+        args.append(value)
+        conditions.append(sql.replace("?", f"${len(args)}"))
+
+    name = "report"
+    if params.get("training_id"):
+        try:
+            add("t.id = ?", int(params["training_id"]))
+        except ValueError:
+            raise ExportError("training_id: ожидается число")
+        name = f"training_{params['training_id']}"
+    for key, column in (("city", "t.city"), ("location", "t.location"), ("track_type", "t.track_type")):
+        if params.get(key):
+            add(f"{column} = ?", params[key])
+    for key, op in (("date_from", ">="), ("date_to", "<=")):
+        if params.get(key):
+            try:
+                add(f"t.date {op} ?", date.fromisoformat(params[key]).isoformat())
+            except ValueError:
+                raise ExportError(f"{key}: ожидается дата YYYY-MM-DD")
+    if name == "report" and (params.get("date_from") or params.get("date_to")):
+        name = f"report_{params.get('date_from', '')}_{params.get('date_to', '')}".rstrip("_")
+
+    tables = history_tables(None if params.get("training_id") else params.get("date_from"))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return tables, where, args, name
+
+
+async def _report_rows(tables: Tuple[str, str], where: str, args: Sequence[Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Пачки строк отчёта из серверного курсора: в памяти не больше EXPORT_PREFETCH записей"""
+    query = f'''
+        SELECT t.id AS training_id, t.date, t.time, t.city, t.location, t.track_type,
+               COALESCE(uc.nickname, 'Аноним') AS display_name, uc.username,
+               r.vtx_band || r.vtx_channel AS channel, r.paid
+        FROM {tables[1]} r
+        JOIN {tables[0]} t ON t.id = r.training_id
+        LEFT JOIN user_consent uc ON uc.user_id = r.user_id
+        {where}
+        ORDER BY t.date, t.time, t.id, r.vtx_band, r.vtx_channel
+    '''
+    async with transaction(name="tx:export_report") as conn:
+        batch = []
+        async for row in conn.cursor(query, *args, prefetch=EXPORT_PREFETCH):
+            batch.append(row)
+            if len(batch) >= EXPORT_PREFETCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _cells(row: Dict[str, Any]) -> List[Any]:
+    values = dict(row)
+    values["track_type"] = TRACK_TYPES.get(row["track_type"], row["track_type"])
+    values["paid"] = "да" if row["paid"] else "нет"
+    values["username"] = row["username"] or ""
+    return [values[key] for key, _ in COLUMNS]
+
+
+# ========================
+# Форматы
+# ========================
+
+async def _csv_stream(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """CSV уходит клиенту по мере чтения курсора; BOM — чтобы Excel открыл UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([title for _, title in COLUMNS])
+    yield buffer.getvalue().encode("utf-8-sig")
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(_cells(row) for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+class XlsxSink:
+    """xlsxwriter в режиме constant_memory: строки сразу уходят во временный файл на диске"""
+
+    def __init__(self, title: str):
+        import xlsxwriter  # только для выгрузок XLSX
+
+        self.file = tempfile.TemporaryFile()
+        self.workbook = xlsxwriter.Workbook(self.file, {"constant_memory": True})
+        self.sheet = self.workbook.add_worksheet("Записи")  # в имени листа нельзя «:» и «/»
+        self.sheet.write_row(0, 0, [t for _, t in COLUMNS], self.workbook.add_format({"bold": True}))
+        self.sheet.freeze_panes(1, 0)
+        self.row = 1
+
+    def write(self, batch: List[Dict[str, Any]]):
+        for row in batch:
+            self.sheet.write_row(self.row, 0, _cells(row))
+            self.row += 1
+
+    def finish(self):
+        self.workbook.close()
+        self.file.seek(0)
+        return self.file
+
+
+class PdfSink:
+    """
+    PDF со шрифтом DejaVu (кириллица, ✔). reportlab держит в памяти только готовые страницы
+    в сжатом виде, строки отчёта не копятся; файл пишется во временный файл и отдаётся кусками.
+    """
+
+    MARGIN = 40
+    LINE = 16
+
+    def __init__(self, title: str):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        self.file = tempfile.TemporaryFile()
+        self.font = pdf_font()
+        self.width, self.height = A4
+        self.canvas = canvas.Canvas(self.file, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.current_training = None
+        self.number = 0
+        self.y = self.height - self.MARGIN
+        self._text(title, size=16)
+        self.y -= self.LINE / 2
+
+    def _text(self, text: str, size: int = 10, x: float = None):
+        if self.y < self.MARGIN:
+            self.canvas.showPage()
+            self.y = self.height - self.MARGIN
+        self.canvas.setFont(self.font, size)
+        self.canvas.drawString(x if x is not None else self.MARGIN, self.y, text)
+        self.y -= self.LINE + (size - 10)
+
+    def write(self, batch: List[Dict[str, Any]]):
+        for row in batch:
+            if row["training_id"] != self.current_training:
+                self.current_training, self.number = row["training_id"], 0
+                self.y -= self.LINE / 2
+                # В DejaVu нет эмодзи из подписей TRACK_TYPES — оставляем текст
+                track = TRACK_TYPES.get(row["track_type"], row["track_type"]).split(" ", 1)[-1]
+                self._text(f"{row['date']} {row['time']} · {row['city']}, {row['location']} · {track}", size=12)
+            self.number += 1
+            paid = "✔ оплачено" if row["paid"] else "не оплачено"
+            self._text(f"{self.number}. {row['display_name']} — канал {row['channel']} — {paid}", x=self.MARGIN + 15)
+
+    def finish(self):
+        if self.current_training is None:
+            self._text("Записей нет")
+        self.canvas.save()
+        self.file.seek(0)
+        return self.file
+
+
+async def _file_stream(batches: AsyncIterator[List[Dict[str, Any]]], sink_factory, title: str) -> AsyncIterator[bytes]:
+    """XLSX и PDF нельзя отдавать до конца записи: пишем в поток исполнителя, затем отдаём файл кусками"""
+    sink = await asyncio.to_thread(sink_factory, title)
+    try:
+        async for batch in batches:
+            await asyncio.to_thread(sink.write, batch)
+        file = await asyncio.to_thread(sink.finish)
+        while chunk := await asyncio.to_thread(file.read, CHUNK_SIZE):
+            yield chunk
+    finally:
+        sink.file.close()
+
+
+def _title(params: Dict[str, str]) -> str:
+    parts = [params.get(k) for k in ("city", "location") if params.get(k)]
+    if params.get("date_from") or params.get("date_to"):
+        parts.append(f"{params.get('date_from', '…')} — {params.get('date_to', '…')}")
+    return "FPV: " + (", ".join(parts) if parts else "отчёт по записям")
+
+
+def _export_response(fmt: str, params: Dict[str, str], admin: Dict[str, Any]) -> Response:
+    if fmt not in FORMATS:
+        return Response("Формат: csv, xlsx или pdf", status_code=400)
+    try:
+        tables, where, args, name = _report_filters(params, admin)
+    except ExportError as e:
+        return Response(e.message, status_code=400)
+
+    batches = _report_rows(tables, where, args)
+    title = _title(params) if not params.get("training_id") else f"FPV: тренировка #{params['training_id']}"
+    if fmt == "csv":
+        body = _csv_stream(batches)
+    else:
+        body = _file_stream(batches, XlsxSink if fmt == "xlsx" else PdfSink, title)
+    return StreamingResponse(body, media_type=FORMATS[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{name}.{fmt}"',
+    })
+
+
+@router.get("/report.{fmt}", name="export_report")
+async def export_report(request: Request, fmt: str, admin: Dict[str, Any] = Depends(current_admin)):
+    """Отчёт по записям: training_id, либо city/location/track_type и период date_from..date_to"""
+    return _export_response(fmt, dict(request.query_params), admin)
+
+
+@router.get("/pdf/{training_id:int}", name="export_training_pdf")
+async def export_training_pdf(training_id: int, admin: Dict[str, Any] = Depends(current_admin)):
+    return _export_response("pdf", {"training_id": str(training_id)}, admin)
@@ -0,0 +1,116 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Sequence
+
+import pytz
+from fastapi import APIRouter, Request
+from fastapi.responses import Response, StreamingResponse
+
+from ..config import TIMEZONE
+from ..database.db import TRACK_TYPES, fetchrow, transaction
+from ..utils.ical import calendar_footer, calendar_header, training_event, verify_feed_token
+from .events import schedule_events
+
+router = APIRouter(prefix="/calendar")
+
+# Сколько дней прошлого оставлять в ленте, чтобы недавние тренировки не пропадали из календаря
+HISTORY_DAYS = 30
+# Строк за один проход курсора: лента любого размера стримится без загрузки целиком
+CURSOR_PREFETCH = 200
+CALENDAR_MEDIA_TYPE = "text/calendar; charset=utf-8"
+
+_tz = pytz.timezone(TIMEZONE)
+
+
+def _window_start() -> str:
+    return (datetime.now(_tz).date() - timedelta(days=HISTORY_DAYS)).isoformat()
+
+
+def _etag(*parts: Any) -> str:
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:24] + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return etag in {t.strip().removeprefix("W/") for t in header.split(",")} or header.strip() == "*"
+
+
+async def _stream_feed(name: str, query: str, args: Sequence[Any], describe) -> AsyncIterator[str]:
+    """VCALENDAR по строкам серверного курсора; память не зависит от числа тренировок"""
+    yield calendar_header(name)
+    async with transaction(name="tx:calendar_feed") as conn:
+        async for row in conn.cursor(query, *args, prefetch=CURSOR_PREFETCH):
+            yield training_event(row, TRACK_TYPES.get(row['track_type'], row['track_type']), describe(row))
+    yield calendar_footer()
+
+
+def _feed_response(request: Request, etag: str, cache_control: str, filename: str, body: AsyncIterator[str]):
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    return StreamingResponse(body, media_type=CALENDAR_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/city/{city}.ics", name="city_calendar")
+async def city_calendar(request: Request, city: str):
+    """Все тренировки города; ETag из агрегата по индексу — опрос без изменений отвечает 304 из кэша"""
+    since = _window_start()
+
+    async def version() -> Dict[str, Any]:
+        return dict(await fetchrow('''
+            SELECT COUNT(*) AS n, MAX(updated_at) AS changed, MAX(id) AS last_id
+            FROM trainings
+            WHERE city = $1 AND date >= $2
+        ''', city, since, name="calendar_city_version"))
+
+    v = await schedule_events.cached(f"ics:city:{city}:{since}", version)
+    etag = _etag("city", city, since, v['n'], v['changed'], v['last_id'])
+    body = _stream_feed(
+        f"FPV — {city}",
+        '''
+            SELECT id, city, location, date, time, track_type, current_pilots, max_pilots, updated_at
+            FROM trainings
+            WHERE city = $1 AND date >= $2
+            ORDER BY date, time
+        ''',
+        (city, since),
+        lambda row: f"Пилотов: {row['current_pilots']}/{row['max_pilots']}",
+    )
+    return _feed_response(request, etag, "public, max-age=300", "fpv-city.ics", body)
+
+
+@router.get("/user/{token}.ics", name="user_calendar")
+async def user_calendar(request: Request, token: str):
+    """Личная лента: тренировки, на которые записан пилот, с его каналом и статусом оплаты"""
+    user_id = verify_feed_token(token)
+    if user_id is None:
+        return Response("Ссылка недействительна", status_code=404)
+    since = _window_start()
+
+    async def version() -> Dict[str, Any]:
+        return dict(await fetchrow('''
+            SELECT COUNT(*) AS n, MAX(t.updated_at) AS changed,
+                   md5(string_agg(r.id || r.vtx_band || r.vtx_channel || r.paid, ',' ORDER BY r.id)) AS regs
+            FROM registrations r
+            JOIN trainings t ON t.id = r.training_id
+            WHERE r.user_id = $1 AND t.date >= $2
+        ''', user_id, since, name="calendar_user_version"))
+
+    v = await schedule_events.cached(f"ics:user:{user_id}:{since}", version)
+    etag = _etag("user", user_id, since, v['n'], v['changed'], v['regs'])
+    body = _stream_feed(
+        "FPV — мои тренировки",
+        '''
+            SELECT t.id, t.city, t.location, t.date, t.time, t.track_type, t.updated_at,
+                   r.vtx_band, r.vtx_channel, r.paid
+            FROM registrations r
+            JOIN trainings t ON t.id = r.training_id
+            WHERE r.user_id = $1 AND t.date >= $2
+            ORDER BY t.date, t.time
+        ''',
+        (user_id, since),
+        lambda row: f"Канал VTX: {row['vtx_band']}{row['vtx_channel']}. "
+                    f"{'Оплачено' if row['paid'] else 'Не оплачено'}",
+    )
+    return _feed_response(request, etag, "private, max-age=300", "fpv-my.ics", body)
@@ -0,0 +1,115 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+import pytz
+from fastapi import APIRouter, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+
+from ..config import SCHEDULE_URL, TIMEZONE
+from ..database.db import fetch
+from .events import schedule_events
+from .templating import render
+
+router = APIRouter()
+
+_tz = pytz.timezone(TIMEZONE)
+
+
+async def load_upcoming_trainings() -> List[Dict[str, Any]]:
+    """Тренировки с сегодняшнего дня (по TIMEZONE) вместе с записавшимися пилотами — два запроса на страницу"""
+    today = datetime.now(_tz).strftime("%Y-%m-%d")
+    trainings = [dict(t) for t in await fetch('''
+        SELECT id, city, location, date, time, track_type, current_pilots, max_pilots
+        FROM trainings
+        WHERE date >= $1
+        ORDER BY date, time
+    ''', today)]
+    pilots = await fetch('''
+        SELECT
+            r.training_id,
+            COALESCE(uc.nickname, 'Аноним') AS display_name,
+            r.vtx_band,
+            r.vtx_channel,
+            r.paid
+        FROM registrations r
+        LEFT JOIN user_consent uc ON r.user_id = uc.user_id
+        WHERE r.training_id = ANY($1::int[])
+        ORDER BY r.vtx_band, r.vtx_channel
+    ''', [t['id'] for t in trainings])
+
+    by_training = defaultdict(list)
+    for p in pilots:
+        by_training[p['training_id']].append(p)
+    for t in trainings:
+        t['pilots'] = by_training.get(t['id'], [])
+    return trainings
+
+
+def _with_is_past(trainings: List[Dict[str, Any]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Группировка по городам; is_past считается на каждый запрос (кэш не знает о времени суток)"""
+    now = datetime.now(_tz)
+    city_groups = defaultdict(list)
+    for t in trainings:
+        try:
+            is_past = _tz.localize(datetime.strptime(f"{t['date']} {t['time']}", "%Y-%m-%d %H:%M")) < now
+        except ValueError:
+            is_past = False
+        city_groups[t['city']].append({**t, 'is_past': is_past})
+    return sorted(city_groups.items(), key=lambda x: x[0])
+
+
+async def _schedule_context() -> Dict[str, Any]:
+    trainings = await schedule_events.cached("schedule", load_upcoming_trainings)
+    schedule = _with_is_past(trainings)
+    return {"schedule": schedule, "cities": [city for city, _ in schedule]}
+
+
+@router.get("/", name="index")
+async def index(request: Request):
+    return RedirectResponse(request.url_for("schedule"), status_code=302)
+
+
+@router.get("/schedule", name="schedule")
+async def schedule(request: Request):
+    context = await _schedule_context()
+    context["is_admin"] = request.session.get("admin_id") is not None
+    return render(request, "schedule.html", context)
+
+
+@router.get("/schedule-partial", name="schedule_partial")
+async def schedule_partial(request: Request):
+    """Фрагмент для HTMX-обновления по SSE"""
+    return render(request, "partials/schedule_table.html", await _schedule_context())
+
+
+@router.get("/updates", name="sse_updates")
+async def sse_updates(request: Request):
+    return StreamingResponse(
+        schedule_events.stream(request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/privacy", name="privacy")
+async def privacy(request: Request):
+    return render(request, "privacy.html")
+
+
+@lru_cache(maxsize=1)
+def _schedule_qr_png(url: str) -> bytes:
+    import qrcode  # PIL нужен только здесь
+
+    buffer = BytesIO()
+    qrcode.make(url).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@router.get("/static/qr-schedule.png", include_in_schema=False)
+async def schedule_qr():
+    png = await asyncio.to_thread(_schedule_qr_png, SCHEDULE_URL)
+    return Response(png, media_type="image/png", headers={"Cache-Control": "public, max-age=86400"})
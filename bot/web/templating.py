@@ -0,0 +1,76 @@
+import os
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple, Union
+from urllib.parse import urlencode
+
+from fastapi import Request
+from fastapi.templating import Jinja2Templates
+from jinja2 import pass_context
+
+from ..database.db import TRACK_TYPES
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+ACTION_LABELS = {
+    "add_training": "Добавление тренировки",
+    "delete_training": "Удаление тренировки",
+    "edit_pilot_channel": "Редактирование канала",
+    "add_admin": "Назначение админа",
+    "remove_admin": "Удаление админа",
+    "notify_pilot": "Уведомление пилоту",
+    "add_location_alias": "Алиас площадки",
+    "checkin_batch": "Отметка явки",
+}
+
+
+# ========================
+# Flash-сообщения в сессии (как flask.flash)
+# ========================
+
+def flash(request: Request, message: str, category: str = "info"):
+    request.session.setdefault("_flashes", []).append([category, message])
+
+
+def _flashed_messages(request: Request):
+    def get_flashed_messages(with_categories: bool = False) -> List[Union[str, Tuple[str, str]]]:
+        messages = request.session.pop("_flashes", [])
+        return [tuple(m) for m in messages] if with_categories else [m[1] for m in messages]
+    return get_flashed_messages
+
+
+def _template_context(request: Request) -> Dict[str, Any]:
+    """То, что шаблоны получали от Flask: endpoint, current_user, get_flashed_messages"""
+    route = request.scope.get("route")
+    admin_id = request.session.get("admin_id")
+    return {
+        "endpoint": route.name if route is not None else None,
+        "current_user": SimpleNamespace(id=admin_id, is_authenticated=admin_id is not None),
+        "get_flashed_messages": _flashed_messages(request),
+        "TRACK_TYPES": TRACK_TYPES,
+        "year": datetime.now().year,
+    }
+
+
+@pass_context
+def url_for(context, name: str, **params) -> str:
+    """url_for по имени маршрута; параметры, которых нет в пути, уходят в query string"""
+    request: Request = context["request"]
+    path_params = {}
+    for route in request.app.router.routes:
+        if getattr(route, "name", None) == name:
+            path_params = {k: params.pop(k) for k in list(params) if k in route.param_convertors}
+            break
+    path = request.app.url_path_for(name, **path_params)
+    query = {k: v for k, v in params.items() if v not in (None, "")}
+    return f"{path}?{urlencode(query)}" if query else str(path)
+
+
+templates = Jinja2Templates(directory=TEMPLATES_DIR, context_processors=[_template_context])
+templates.env.globals["url_for"] = url_for
+templates.env.globals["now"] = datetime.now
+templates.env.globals["get_action_label"] = lambda action: ACTION_LABELS.get(action, action)
+
+
+def render(request: Request, name: str, context: Dict[str, Any] = None, status_code: int = 200):
+    return templates.TemplateResponse(request, name, context or {}, status_code=status_code)
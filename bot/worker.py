@@ -0,0 +1,152 @@
+"""
+Обработчик очереди апдейтов для режима вебхука с UPDATE_WORKERS > 0.
+
+Запуск:
+    python -m bot.worker --processes 4 --concurrency 8
+
+Каждый процесс держит свой Bot/Dispatcher и пул БД и обрабатывает до
+--concurrency апдейтов разных чатов одновременно. Апдейты одного чата
+выполняются строго по очереди (см. db.claim_update), в каком бы процессе
+они ни оказались. Пул БД процесса растёт вместе с --concurrency.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+from datetime import datetime, timezone
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from prometheus_client import start_http_server
+
+from .config import UPDATE_WORKERS, WORKER_CONCURRENCY
+from .database.db import (
+    init_db_pool, close_db_pool, claim_update, complete_update, listen, unlisten, UPDATE_QUEUE_CHANNEL
+)
+from .utils.metrics import UPDATE_QUEUE_LAG
+from .utils.search_index import training_index
+
+logger = logging.getLogger(__name__)
+
+# Страховочный опрос очереди, если NOTIFY потерялся (например, при переподключении)
+POLL_INTERVAL = 1.0
+# Пул БД на процесс: по два соединения на одновременный апдейт (хендлер может взять второе,
+# пока держит транзакцию) плюс соединения LISTEN — очереди и индекса inline-поиска
+POOL_MIN_SIZE = 20
+POOL_LISTENERS = 2
+
+
+def pool_size(concurrency: int) -> int:
+    return max(POOL_MIN_SIZE, 2 * concurrency + POOL_LISTENERS)
+
+
+async def process_next(dp: Dispatcher, bot: Bot) -> bool:
+    """Обработать один апдейт из очереди; False — очередь пуста (или все чаты заняты)"""
+    row = await claim_update()
+    if row is None:
+        return False
+    UPDATE_QUEUE_LAG.observe((datetime.now(timezone.utc) - row['created_at']).total_seconds())
+    try:
+        update = Update.model_validate(json.loads(row['payload']), context={"bot": bot})
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        # Как и в polling: апдейт не повторяется, иначе он заблокирует свой чат
+        logger.exception(f"❌ Update {row['id']} failed: {e}")
+    # Прерванный на полпути апдейт (отмена задачи, падение) остаётся в очереди до конца аренды
+    await complete_update(row['id'])
+    return True
+
+
+async def consume(dp: Dispatcher, bot: Bot, wakeup: asyncio.Event, stopping: asyncio.Event):
+    while not stopping.is_set():
+        wakeup.clear()
+        if await process_next(dp, bot):
+            continue
+        try:
+            await asyncio.wait_for(wakeup.wait(), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_worker(
+    concurrency: int = WORKER_CONCURRENCY,
+    dp: Optional[Dispatcher] = None,
+    bot: Optional[Bot] = None,
+):
+    """Один процесс-обработчик; dp/bot можно передать свои (нагрузочный тест)"""
+    if dp is None or bot is None:
+        from .bot import create_bot, build_dispatcher
+        bot, dp = create_bot(), build_dispatcher()
+
+    await init_db_pool(max_size=pool_size(concurrency))
+    await training_index.start()  # inline-запросы обрабатываются и здесь
+    wakeup, stopping = asyncio.Event(), asyncio.Event()
+
+    def on_notify(*_):
+        wakeup.set()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    listener = await listen(UPDATE_QUEUE_CHANNEL, on_notify)
+    logger.info(f"👷 Worker started: {concurrency} concurrent chats")
+    try:
+        await asyncio.gather(*(consume(dp, bot, wakeup, stopping) for _ in range(concurrency)))
+    finally:
+        # Текущие апдейты уже дообработаны: consume выходит только между апдейтами
+        await unlisten(listener, UPDATE_QUEUE_CHANNEL, on_notify)
+        await training_index.stop()
+        await close_db_pool()
+        await bot.session.close()
+        logger.info("✅ Worker stopped")
+
+
+def _process_main(concurrency: int, metrics_port: Optional[int]):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if metrics_port:
+        start_http_server(metrics_port)
+    asyncio.run(run_worker(concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=max(UPDATE_WORKERS, 1))
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="первый порт /metrics; процесс i слушает порт + i (0 — не отдавать)")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        _process_main(args.concurrency, args.metrics_port)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(
+            target=_process_main,
+            args=(args.concurrency, args.metrics_port + i if args.metrics_port else None),
+            name=f"bot-worker-{i}",
+        )
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    # SIGTERM родителю — пересылаем детям, каждый дообрабатывает текущие апдейты
+    def forward(signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
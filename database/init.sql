@@ -50,6 +50,61 @@ CREATE INDEX IF NOT EXISTS idx_registrations_training ON registrations (training
 CREATE INDEX IF NOT EXISTS idx_registrations_user ON registrations (user_id);
 CREATE INDEX IF NOT EXISTS idx_registrations_paid ON registrations (paid);
 
+-- Явка: отметка по QR из чека (проверка на площадке, в т.ч. без сети — см. bot/utils/checkin.py)
+ALTER TABLE registrations ADD COLUMN IF NOT EXISTS checked_in_at TIMESTAMPTZ;  -- время скана на площадке
+ALTER TABLE registrations ADD COLUMN IF NOT EXISTS checked_in_by BIGINT;       -- админ, загрузивший отметку
+
+-- Таблица: Лист ожидания (FIFO по id)
+CREATE TABLE IF NOT EXISTS waitlist (
+    id SERIAL PRIMARY KEY,
+    training_id INTEGER NOT NULL REFERENCES trainings(id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,     -- Telegram user_id
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (training_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_waitlist_training_order ON waitlist (training_id, id);
+CREATE INDEX IF NOT EXISTS idx_waitlist_user ON waitlist (user_id);
+
+-- Таблица: Исходящие уведомления (пишутся в той же транзакции, что и изменение данных)
+CREATE TABLE IF NOT EXISTS notifications_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,     -- кому отправить
+    text TEXT NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    sent_at TIMESTAMPTZ          -- NULL = ещё не отправлено
+);
+
+-- Повторы доставки: взятое уведомление скрыто до next_attempt_at (аренда), при ошибке — отложено с backoff;
+-- failed_at — попытки исчерпаны или повтор бесполезен (бот заблокирован пользователем)
+ALTER TABLE notifications_outbox ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE notifications_outbox ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+ALTER TABLE notifications_outbox ADD COLUMN IF NOT EXISTS failed_at TIMESTAMPTZ;
+ALTER TABLE notifications_outbox ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+-- Сообщение пилоту переводится при отправке на язык получателя: message — строки [[ключ локали, параметры], ...];
+-- text — готовый текст (алерты организатору). Заполнено одно из двух
+ALTER TABLE notifications_outbox ADD COLUMN IF NOT EXISTS message JSONB;
+ALTER TABLE notifications_outbox ALTER COLUMN text DROP NOT NULL;
+
+DROP INDEX IF EXISTS idx_outbox_pending;
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON notifications_outbox (next_attempt_at, id)
+    WHERE sent_at IS NULL AND failed_at IS NULL;
+
+-- Таблица: Очередь входящих апдейтов Telegram (приёмник вебхука → процессы-обработчики)
+CREATE TABLE IF NOT EXISTS update_queue (
+    id BIGSERIAL PRIMARY KEY,
+    update_id BIGINT NOT NULL UNIQUE,  -- повторная доставка от Telegram не создаёт дубль
+    chat_id BIGINT NOT NULL,           -- ключ упорядочивания: апдейты одного чата строго по id
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_update_queue_chat ON update_queue (chat_id, id);
+
+-- Аренда апдейта обработчиком (db.claim_update): транзакция не держится на время обработки
+ALTER TABLE update_queue ADD COLUMN IF NOT EXISTS locked_until TIMESTAMPTZ;
+
 -- Таблица: Согласие пользователей (152-ФЗ)
 CREATE TABLE IF NOT EXISTS user_consent (
     user_id BIGINT PRIMARY KEY,  -- Telegram user_id
@@ -58,16 +113,19 @@ CREATE TABLE IF NOT EXISTS user_consent (
     consent_given INTEGER NOT NULL DEFAULT 0
         CHECK (consent_given IN (0, 1)),
     consent_date TIMESTAMPTZ,    -- дата согласия
+    lang TEXT NOT NULL DEFAULT 'ru',  -- язык интерфейса бота (en, ru)
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+ALTER TABLE user_consent ADD COLUMN IF NOT EXISTS lang TEXT NOT NULL DEFAULT 'ru';
+
 -- Таблица: Администраторы
 CREATE TABLE IF NOT EXISTS admins (
     user_id BIGINT PRIMARY KEY,  -- Telegram user_id
     role TEXT NOT NULL
         CHECK (role IN ('super_admin', 'location_admin')),
-    managed_locations JSONB NOT NULL DEFAULT '[]',  -- [{"city": "Москва", "location": "Парк Победы"}, ...]
+    managed_locations JSONB NOT NULL DEFAULT '[]',  -- устарело: площадки админов в admin_locations
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
@@ -89,19 +147,333 @@ CREATE INDEX IF NOT EXISTS idx_audit_admin ON admin_audit_log (admin_user_id);
 CREATE INDEX IF NOT EXISTS idx_audit_action ON admin_audit_log (action);
 CREATE INDEX IF NOT EXISTS idx_audit_created ON admin_audit_log (created_at DESC);
 
--- Таблица: 2FA сессии для админки
+-- Таблица: 2FA сессии для админки (один живой код на пользователя, хранится только HMAC)
 CREATE TABLE IF NOT EXISTS admin_2fa_sessions (
     id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL,        -- Telegram user_id
-    secret_code TEXT NOT NULL,      -- 6-значный код
+    code_hash TEXT NOT NULL,        -- HMAC-SHA256(user_id:код)
+    attempts INTEGER NOT NULL DEFAULT 0, -- неверные вводы; после лимита код удаляется
     expires_at TIMESTAMPTZ NOT NULL, -- срок действия
-    created_at TIMESTAMPTZ DEFAULT NOW(),
-    CHECK (LENGTH(secret_code) = 6)
+    created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
--- Индекс для очистки истёкших сессий
+-- Переход со схемы с кодом в открытом виде: старые коды живут 10 минут, их можно сбросить
+ALTER TABLE admin_2fa_sessions ADD COLUMN IF NOT EXISTS code_hash TEXT;
+ALTER TABLE admin_2fa_sessions ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+DELETE FROM admin_2fa_sessions WHERE code_hash IS NULL;
+ALTER TABLE admin_2fa_sessions DROP COLUMN IF EXISTS secret_code;
+ALTER TABLE admin_2fa_sessions ALTER COLUMN code_hash SET NOT NULL;
+
+-- Поиск кода по пользователю и очистка истёкших сессий
+CREATE UNIQUE INDEX IF NOT EXISTS idx_2fa_user ON admin_2fa_sessions (user_id);
 CREATE INDEX IF NOT EXISTS idx_2fa_expires ON admin_2fa_sessions (expires_at);
 
+-- Таблица: Журнал платежей (сумма, валюта, провайдер, возвраты)
+-- Город/площадка/трасса/дата копируются из тренировки: выручка считается и после удаления записи
+CREATE TABLE IF NOT EXISTS payments (
+    id BIGSERIAL PRIMARY KEY,
+    provider TEXT NOT NULL
+        CHECK (provider IN ('telegram', 'yookassa', 'stripe')),
+    provider_payment_id TEXT NOT NULL,   -- charge_id Telegram, id платежа ЮKassa, PaymentIntent Stripe
+    registration_id INTEGER,             -- без FK: запись могла уйти в архив или быть отменена
+    training_id INTEGER,                 -- без FK: тренировка могла уйти в архив
+    user_id BIGINT NOT NULL,
+    amount NUMERIC(12, 2) NOT NULL CHECK (amount >= 0),
+    refunded_amount NUMERIC(12, 2) NOT NULL DEFAULT 0
+        CHECK (refunded_amount >= 0 AND refunded_amount <= amount),
+    currency TEXT NOT NULL DEFAULT 'RUB',
+    status TEXT NOT NULL
+        CHECK (status IN ('pending', 'succeeded', 'canceled', 'refund_requested', 'partially_refunded', 'refunded')),
+    city TEXT,
+    location TEXT,
+    track_type TEXT,
+    training_date DATE,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (provider, provider_payment_id)  -- повтор вебхука не создаёт второй платёж
+);
+
+-- Ссылки на записи и тренировки переживают архивацию (id в архиве те же)
+ALTER TABLE payments DROP CONSTRAINT IF EXISTS payments_registration_id_fkey;
+ALTER TABLE payments DROP CONSTRAINT IF EXISTS payments_training_id_fkey;
+
+-- Выручка по площадке за период (по дате тренировки и по дате платежа)
+CREATE INDEX IF NOT EXISTS idx_payments_location_day ON payments (city, location, training_date);
+CREATE INDEX IF NOT EXISTS idx_payments_created ON payments (created_at);
+CREATE INDEX IF NOT EXISTS idx_payments_training ON payments (training_id);
+CREATE INDEX IF NOT EXISTS idx_payments_registration ON payments (registration_id);
+
+-- Таблица: История статусов платежа (оплата, заявка на возврат, возврат, сверка)
+CREATE TABLE IF NOT EXISTS payment_events (
+    id BIGSERIAL PRIMARY KEY,
+    payment_id BIGINT NOT NULL REFERENCES payments(id) ON DELETE CASCADE,
+    status TEXT NOT NULL,
+    amount NUMERIC(12, 2),
+    details JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_payment_events_payment ON payment_events (payment_id, created_at);
+
+-- Таблица: Очередь возвратов у провайдера (пишется в той же транзакции, что и заявка refund_requested)
+-- idempotency_key один на все попытки: повтор после таймаута или падения процесса не вернёт деньги дважды.
+-- Взятая задача скрыта до next_attempt_at (аренда); provider_refund_id — провайдер принял возврат,
+-- дальше опрашивается его статус. failed — попытки исчерпаны или провайдер отказал: возврат вручную
+CREATE TABLE IF NOT EXISTS refund_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    payment_id BIGINT NOT NULL REFERENCES payments(id) ON DELETE CASCADE,
+    amount NUMERIC(12, 2) NOT NULL CHECK (amount > 0),
+    idempotency_key UUID NOT NULL DEFAULT gen_random_uuid() UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'succeeded', 'failed')),
+    provider_refund_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+    details JSONB NOT NULL DEFAULT '{}',  -- источник заявки и данные для чека (канал, дата и время тренировки)
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+-- Не больше одной незавершённой задачи на платёж
+CREATE UNIQUE INDEX IF NOT EXISTS idx_refund_jobs_active ON refund_jobs (payment_id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_refund_jobs_due ON refund_jobs (next_attempt_at, id) WHERE status = 'pending';
+
+-- Площадки: канонические названия со стабильными id. trainings.city/location — копия канонического
+-- названия (проставляет триггер), права админов и фильтры сравнивают location_id
+-- Регистр кириллицы сворачивается явно: lower() зависит от локали БД и под C меняет только латиницу,
+-- а ключ хранится в сгенерированных столбцах и обязан быть одинаковым при любой локали
+CREATE OR REPLACE FUNCTION location_key(s TEXT)
+RETURNS TEXT AS $$
+    SELECT translate(lower(regexp_replace(btrim(s), '\s+', ' ', 'g')),
+                     'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯё',
+                     'абвгдеежзийклмнопрстуфхцчшщъыьэюяе');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS locations (
+    id SERIAL PRIMARY KEY,
+    city TEXT NOT NULL,
+    name TEXT NOT NULL,
+    city_key TEXT GENERATED ALWAYS AS (location_key(city)) STORED,
+    name_key TEXT GENERATED ALWAYS AS (location_key(name)) STORED,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (city_key, name_key)      -- «Парк» и « парк » — одна площадка
+);
+
+-- Другие написания той же площадки (например, «ЦПКиО» → «Парк Горького»)
+CREATE TABLE IF NOT EXISTS location_aliases (
+    city_key TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    PRIMARY KEY (city_key, name_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_location_aliases_location ON location_aliases (location_id);
+
+-- id площадки по написанию (алиас или каноническое название); NULL — не найдена
+CREATE OR REPLACE FUNCTION find_location(p_city TEXT, p_name TEXT)
+RETURNS INTEGER AS $$
+    SELECT COALESCE(
+        (SELECT location_id FROM location_aliases
+         WHERE city_key = location_key(p_city) AND name_key = location_key(p_name)),
+        (SELECT id FROM locations
+         WHERE city_key = location_key(p_city) AND name_key = location_key(p_name))
+    );
+$$ LANGUAGE sql STABLE;
+
+-- id площадки по написанию; новая площадка создаётся с этим написанием как каноническим
+CREATE OR REPLACE FUNCTION resolve_location(p_city TEXT, p_name TEXT)
+RETURNS INTEGER AS $$
+DECLARE
+    loc_id INTEGER;
+BEGIN
+    loc_id := find_location(p_city, p_name);
+    IF loc_id IS NULL THEN
+        INSERT INTO locations (city, name)
+        VALUES (btrim(p_city), btrim(p_name))
+        ON CONFLICT (city_key, name_key) DO NOTHING
+        RETURNING id INTO loc_id;
+        IF loc_id IS NULL THEN  -- параллельная вставка той же площадки
+            loc_id := find_location(p_city, p_name);
+        END IF;
+    END IF;
+    RETURN loc_id;
+END;
+$$ language 'plpgsql';
+
+ALTER TABLE trainings ADD COLUMN IF NOT EXISTS location_id INTEGER REFERENCES locations(id);
+CREATE INDEX IF NOT EXISTS idx_trainings_location ON trainings (location_id, date);
+
+CREATE OR REPLACE FUNCTION set_training_location()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.location_id IS NULL
+       OR NEW.city IS DISTINCT FROM OLD.city OR NEW.location IS DISTINCT FROM OLD.location THEN
+        NEW.location_id := resolve_location(NEW.city, NEW.location);
+    END IF;
+    SELECT city, name INTO NEW.city, NEW.location FROM locations WHERE id = NEW.location_id;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS set_training_location ON trainings;
+CREATE TRIGGER set_training_location
+    BEFORE INSERT OR UPDATE OF city, location, location_id ON trainings
+    FOR EACH ROW
+    EXECUTE FUNCTION set_training_location();
+
+-- Права админов площадок (вместо сравнения строк из admins.managed_locations)
+CREATE TABLE IF NOT EXISTS admin_locations (
+    admin_user_id BIGINT NOT NULL REFERENCES admins(user_id) ON DELETE CASCADE,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    PRIMARY KEY (admin_user_id, location_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_admin_locations_location ON admin_locations (location_id);
+
+-- Архив: прошедшие тренировки и их записи переносятся сюда пачками (bot: archive_past_trainings)
+-- Горячие таблицы содержат только ближайшее прошлое и будущее; история — через *_all
+CREATE TABLE IF NOT EXISTS trainings_archive (
+    id INTEGER PRIMARY KEY,          -- тот же id, что был в trainings
+    city TEXT NOT NULL,
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    track_type TEXT NOT NULL,
+    max_pilots INTEGER NOT NULL,
+    current_pilots INTEGER NOT NULL,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    location_id INTEGER REFERENCES locations(id)
+);
+
+ALTER TABLE trainings_archive ADD COLUMN IF NOT EXISTS location_id INTEGER REFERENCES locations(id);
+CREATE INDEX IF NOT EXISTS idx_trainings_archive_datetime ON trainings_archive (date, time);
+CREATE INDEX IF NOT EXISTS idx_trainings_archive_location ON trainings_archive (location_id, date);
+CREATE INDEX IF NOT EXISTS idx_trainings_archive_city_location ON trainings_archive (city, location);
+
+CREATE TABLE IF NOT EXISTS registrations_archive (
+    id INTEGER PRIMARY KEY,
+    training_id INTEGER NOT NULL REFERENCES trainings_archive(id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    vtx_band TEXT NOT NULL,
+    vtx_channel INTEGER NOT NULL,
+    paid INTEGER NOT NULL,
+    payment_id TEXT,
+    payment_date TIMESTAMPTZ,
+    created_at TIMESTAMPTZ,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    checked_in_at TIMESTAMPTZ,
+    checked_in_by BIGINT
+);
+
+ALTER TABLE registrations_archive ADD COLUMN IF NOT EXISTS checked_in_at TIMESTAMPTZ;
+ALTER TABLE registrations_archive ADD COLUMN IF NOT EXISTS checked_in_by BIGINT;
+CREATE INDEX IF NOT EXISTS idx_registrations_archive_training ON registrations_archive (training_id);
+CREATE INDEX IF NOT EXISTS idx_registrations_archive_user ON registrations_archive (user_id);
+CREATE INDEX IF NOT EXISTS idx_registrations_archive_payment ON registrations_archive (payment_id);
+
+-- Вся история: условия по date/id планировщик опускает в обе ветки и использует их индексы
+CREATE OR REPLACE VIEW trainings_all AS
+    SELECT id, city, location, date, time, track_type, max_pilots, current_pilots, created_at, updated_at,
+           location_id
+    FROM trainings
+    UNION ALL
+    SELECT id, city, location, date, time, track_type, max_pilots, current_pilots, created_at, updated_at,
+           location_id
+    FROM trainings_archive;
+
+CREATE OR REPLACE VIEW registrations_all AS
+    SELECT id, training_id, user_id, vtx_band, vtx_channel, paid, payment_id, payment_date, created_at,
+           checked_in_at
+    FROM registrations
+    UNION ALL
+    SELECT id, training_id, user_id, vtx_band, vtx_channel, paid, payment_id, payment_date, created_at,
+           checked_in_at
+    FROM registrations_archive;
+
+CREATE INDEX IF NOT EXISTS idx_registrations_payment ON registrations (payment_id);
+
+-- Ключи, посчитанные прежней location_key под локалью C, различали регистр кириллицы, и одна площадка
+-- могла раздвоиться: дубликаты сливаются в площадку с меньшим id, ключи пересчитываются
+-- (повторный запуск ничего не меняет)
+DO $$
+DECLARE
+    dup RECORD;
+BEGIN
+    FOR dup IN
+        SELECT id, keep_id FROM (
+            SELECT id, min(id) OVER (PARTITION BY location_key(city), location_key(name)) AS keep_id
+            FROM locations
+        ) l
+        WHERE id <> keep_id
+    LOOP
+        UPDATE trainings SET location_id = dup.keep_id WHERE location_id = dup.id;
+        UPDATE trainings_archive t SET location_id = l.id, city = l.city, location = l.name
+        FROM locations l WHERE l.id = dup.keep_id AND t.location_id = dup.id;
+        INSERT INTO admin_locations (admin_user_id, location_id)
+        SELECT admin_user_id, dup.keep_id FROM admin_locations WHERE location_id = dup.id
+        ON CONFLICT DO NOTHING;
+        UPDATE location_aliases SET location_id = dup.keep_id WHERE location_id = dup.id;
+        DELETE FROM locations WHERE id = dup.id;
+    END LOOP;
+
+    -- Сгенерированный столбец пересчитывается, когда UPDATE задаёт его исходный столбец
+    UPDATE locations SET city = city, name = name
+    WHERE (city_key, name_key) IS DISTINCT FROM (location_key(city), location_key(name));
+
+    -- В алиасах хранятся только ключи; location_key от старого ключа даёт новый
+    DELETE FROM location_aliases a
+    USING location_aliases b
+    WHERE location_key(a.city_key) = location_key(b.city_key)
+      AND location_key(a.name_key) = location_key(b.name_key)
+      AND (a.city_key, a.name_key) > (b.city_key, b.name_key);
+    UPDATE location_aliases SET city_key = location_key(city_key), name_key = location_key(name_key)
+    WHERE (city_key, name_key) IS DISTINCT FROM (location_key(city_key), location_key(name_key));
+END $$;
+
+-- Перенос свободного текста в locations (повторный запуск ничего не меняет):
+-- написания, совпадающие по location_key, сливаются; каноническим становится самое частое
+INSERT INTO locations (city, name)
+SELECT DISTINCT ON (location_key(city), location_key(location)) btrim(city), btrim(location)
+FROM (
+    SELECT city, location FROM trainings
+    UNION ALL
+    SELECT city, location FROM trainings_archive
+    UNION ALL
+    SELECT loc->>'city', loc->>'location'
+    FROM admins, jsonb_array_elements(managed_locations) loc
+    WHERE jsonb_typeof(managed_locations) = 'array'
+) src
+WHERE city IS NOT NULL AND location IS NOT NULL
+GROUP BY city, location
+ORDER BY location_key(city), location_key(location), COUNT(*) DESC, city, location
+ON CONFLICT (city_key, name_key) DO NOTHING;
+
+UPDATE trainings SET location_id = find_location(city, location) WHERE location_id IS NULL;
+
+UPDATE trainings_archive t
+SET location_id = l.id, city = l.city, location = l.name
+FROM locations l
+WHERE t.location_id IS NULL AND l.id = find_location(t.city, t.location);
+
+INSERT INTO admin_locations (admin_user_id, location_id)
+SELECT a.user_id, resolve_location(loc->>'city', loc->>'location')
+FROM admins a, jsonb_array_elements(a.managed_locations) loc
+WHERE jsonb_typeof(a.managed_locations) = 'array'
+  AND loc->>'city' IS NOT NULL AND loc->>'location' IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+-- Права перенесены: иначе повторный запуск вернул бы снятые через admin_locations площадки
+UPDATE admins SET managed_locations = '[]' WHERE managed_locations <> '[]';
+
+-- Журнал платежей хранит названия площадок — приводим их к каноническим
+UPDATE payments p
+SET city = t.city, location = t.location
+FROM trainings_all t
+WHERE t.id = p.training_id AND (p.city, p.location) IS DISTINCT FROM (t.city, t.location);
+
 -- Триггер для обновления updated_at (опционально)
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -130,6 +502,168 @@ CREATE TRIGGER update_admins_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+-- Счётчик пилотов: поддерживается триггером по фактическим записям
+CREATE OR REPLACE FUNCTION sync_training_pilots()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE trainings SET current_pilots = current_pilots + 1 WHERE id = NEW.training_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE trainings SET current_pilots = current_pilots - 1 WHERE id = OLD.training_id;
+    ELSIF NEW.training_id <> OLD.training_id THEN
+        UPDATE trainings SET current_pilots = current_pilots - 1 WHERE id = OLD.training_id;
+        UPDATE trainings SET current_pilots = current_pilots + 1 WHERE id = NEW.training_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS sync_training_pilots ON registrations;
+CREATE TRIGGER sync_training_pilots
+    AFTER INSERT OR DELETE OR UPDATE OF training_id ON registrations
+    FOR EACH ROW
+    EXECUTE FUNCTION sync_training_pilots();
+
+-- Удалённые тренировки для дельта-синхронизации (/api/v2/trainings/changes): updated_at удаление не покажет
+CREATE TABLE IF NOT EXISTS training_tombstones (
+    training_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_training_tombstones_deleted ON training_tombstones (deleted_at);
+CREATE INDEX IF NOT EXISTS idx_trainings_updated ON trainings (updated_at);
+
+CREATE OR REPLACE FUNCTION record_training_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Перенос в архив — не удаление: тренировка прошла и остаётся у клиентов
+    IF current_setting('fpv.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO training_tombstones (training_id) VALUES (OLD.id)
+    ON CONFLICT (training_id) DO UPDATE SET deleted_at = NOW();
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_training_tombstone ON trainings;
+CREATE TRIGGER record_training_tombstone
+    AFTER DELETE ON trainings
+    FOR EACH ROW
+    EXECUTE FUNCTION record_training_tombstone();
+
+-- Аналитика: дневные агрегаты по дате тренировки и city/location/track_type
+-- Чтение графиков не зависит от объёма истории; пересчитываются только «грязные» дни
+CREATE TABLE IF NOT EXISTS stats_daily (
+    day DATE NOT NULL,
+    city TEXT NOT NULL,
+    location TEXT NOT NULL,
+    track_type TEXT NOT NULL,
+    trainings INTEGER NOT NULL DEFAULT 0,
+    capacity INTEGER NOT NULL DEFAULT 0,       -- сумма max_pilots
+    registrations INTEGER NOT NULL DEFAULT 0,
+    paid INTEGER NOT NULL DEFAULT 0,
+    revenue NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, city, location, track_type)
+);
+
+CREATE TABLE IF NOT EXISTS stats_dirty_days (
+    day DATE PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION stats_day(d TEXT)
+RETURNS DATE AS $$
+    SELECT CASE WHEN d ~ '^\d{4}-\d{2}-\d{2}$' THEN d::date END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION mark_stats_dirty()
+RETURNS TRIGGER AS $$
+DECLARE
+    days DATE[];
+BEGIN
+    -- Перенос в архив агрегаты не меняет: пересчёт читает trainings_all / registrations_all
+    IF current_setting('fpv.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_TABLE_NAME = 'trainings' THEN
+        days := ARRAY[
+            CASE WHEN TG_OP <> 'INSERT' THEN stats_day(OLD.date) END,
+            CASE WHEN TG_OP <> 'DELETE' THEN stats_day(NEW.date) END
+        ];
+    ELSIF TG_TABLE_NAME = 'payments' THEN
+        days := ARRAY[
+            CASE WHEN TG_OP <> 'INSERT' THEN OLD.training_date END,
+            CASE WHEN TG_OP <> 'DELETE' THEN NEW.training_date END
+        ];
+    ELSE
+        SELECT array_agg(stats_day(t.date)) INTO days
+        FROM trainings_all t
+        WHERE t.id IN (
+            CASE WHEN TG_OP <> 'INSERT' THEN OLD.training_id END,
+            CASE WHEN TG_OP <> 'DELETE' THEN NEW.training_id END
+        );
+    END IF;
+    INSERT INTO stats_dirty_days (day)
+    SELECT DISTINCT d FROM unnest(days) d WHERE d IS NOT NULL
+    ON CONFLICT (day) DO NOTHING;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS mark_stats_dirty ON trainings;
+CREATE TRIGGER mark_stats_dirty
+    AFTER INSERT OR DELETE OR UPDATE OF date, city, location, track_type, max_pilots ON trainings
+    FOR EACH ROW
+    EXECUTE FUNCTION mark_stats_dirty();
+
+DROP TRIGGER IF EXISTS mark_stats_dirty ON registrations_archive;
+CREATE TRIGGER mark_stats_dirty
+    AFTER DELETE ON registrations_archive
+    FOR EACH ROW
+    EXECUTE FUNCTION mark_stats_dirty();
+
+DROP TRIGGER IF EXISTS mark_stats_dirty ON registrations;
+CREATE TRIGGER mark_stats_dirty
+    AFTER INSERT OR DELETE OR UPDATE OF training_id, paid ON registrations
+    FOR EACH ROW
+    EXECUTE FUNCTION mark_stats_dirty();
+
+DROP TRIGGER IF EXISTS mark_stats_dirty ON payments;
+CREATE TRIGGER mark_stats_dirty
+    AFTER INSERT OR DELETE OR UPDATE OF status, amount, refunded_amount, training_date ON payments
+    FOR EACH ROW
+    EXECUTE FUNCTION mark_stats_dirty();
+
+-- Первый запуск на существующей базе: пересчитать все дни с тренировками
+INSERT INTO stats_dirty_days (day)
+SELECT DISTINCT stats_day(date) FROM trainings_all
+WHERE stats_day(date) IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM stats_daily)
+ON CONFLICT (day) DO NOTHING;
+
+-- Изменение расписания → NOTIFY schedule_changed (веб: SSE-обновление и сброс кэша)
+-- Уровень оператора: массовое изменение даёт одно уведомление, а не по одному на строку
+CREATE OR REPLACE FUNCTION notify_schedule_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('schedule_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS notify_trainings_changed ON trainings;
+CREATE TRIGGER notify_trainings_changed
+    AFTER INSERT OR UPDATE OR DELETE ON trainings
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_schedule_changed();
+
+-- Отметки явки (checked_in_at) на расписание и занятость не влияют — без NOTIFY
+DROP TRIGGER IF EXISTS notify_registrations_changed ON registrations;
+CREATE TRIGGER notify_registrations_changed
+    AFTER INSERT OR UPDATE OF training_id, user_id, vtx_band, vtx_channel, paid OR DELETE ON registrations
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_schedule_changed();
+
 -- Первоначальные данные (опционально)
 -- INSERT INTO admins (user_id, role) VALUES (123456789, 'super_admin'); -- Замени на свой Telegram ID
 
@@ -137,6 +671,18 @@ CREATE TRIGGER update_admins_updated_at
 COMMENT ON TABLE trainings IS 'Тренировки FPV';
 COMMENT ON TABLE registrations IS 'Записи пилотов на тренировки';
 COMMENT ON TABLE user_consent IS 'Согласие пользователей на обработку ПДн (152-ФЗ)';
+COMMENT ON TABLE waitlist IS 'Лист ожидания на заполненные тренировки';
+COMMENT ON TABLE notifications_outbox IS 'Очередь уведомлений пользователям (transactional outbox)';
+COMMENT ON TABLE payments IS 'Журнал платежей: суммы, статусы и возвраты по провайдерам';
+COMMENT ON TABLE payment_events IS 'История статусов платежей';
+COMMENT ON TABLE locations IS 'Площадки: канонические названия и стабильные id';
+COMMENT ON TABLE location_aliases IS 'Другие написания площадок';
+COMMENT ON TABLE admin_locations IS 'Площадки админов (location_admin)';
+COMMENT ON TABLE trainings_archive IS 'Архив прошедших тренировок (перенос пачками из trainings)';
+COMMENT ON TABLE registrations_archive IS 'Архив записей на прошедшие тренировки';
+COMMENT ON TABLE training_tombstones IS 'Удалённые тренировки для дельта-синхронизации календарей и интеграций';
+COMMENT ON TABLE stats_daily IS 'Дневные агрегаты для графиков админки (пересчёт по stats_dirty_days)';
+COMMENT ON TABLE update_queue IS 'Очередь апдейтов Telegram для процессов bot.worker';
 COMMENT ON TABLE admins IS 'Администраторы системы';
 COMMENT ON TABLE admin_audit_log IS 'Лог аудита действий администраторов';
 COMMENT ON TABLE admin_2fa_sessions IS 'Сессии двухфакторной аутентификации';